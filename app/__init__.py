@@ -3,30 +3,32 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 import os
 
-db = SQLAlchemy()
+from app.db_routing import RoutingSession
+
+# 使用 RoutingSession：@read_replica 视图中的只读查询可以发往只读副本
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
-def create_app(config_name='default'):
+def create_app(config_name=None):
+    """创建应用
+
+    config_name 对应 config.py 中的配置类，未指定时依次读取
+    FLASK_CONFIG、FLASK_ENV 环境变量，默认 development。
+    """
+    from config import config
+    
     app = Flask(__name__)
     
+    if config_name is None:
+        config_name = os.environ.get('FLASK_CONFIG') or os.environ.get('FLASK_ENV') or 'default'
+    app.config.from_object(config.get(config_name, config['default']))
+    
     # 禁用模板缓存（开发时使用）
     app.config['TEMPLATES_AUTO_RELOAD'] = True
     app.jinja_env.auto_reload = True
-    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
-    
-    # 直接配置基本设置
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY') or 'dev-secret-key-please-change-in-production'
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0  # 内容哈希命名的图片另见 register_image_caching
     
-    # 数据库配置
     basedir = os.path.abspath(os.path.dirname(__file__))
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL') or \
-        f'sqlite:///{os.path.join(basedir, "..", "instance", "database.db")}'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    # 文件上传配置
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
-    app.config['UPLOAD_FOLDER'] = os.path.join(basedir, 'static', 'uploads')
-    app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
     
     # 确保上传目录存在
     os.makedirs(os.path.join(basedir, 'static', 'images', 'dishes'), exist_ok=True)
@@ -34,10 +36,49 @@ def create_app(config_name='default'):
     os.makedirs(os.path.join(basedir, 'static', 'images', 'logos'), exist_ok=True)
     os.makedirs(os.path.join(basedir, 'static', 'images', 'banners'), exist_ok=True)
 
-    db.init_app(app)
+    # 只读副本注册为 bind（需在 db.init_app 之前）
+    from app.db_routing import replica_router
+    replica_router.init_app(app)
+
+    # 按部署方式生成连接池参数，SQLite 开启 WAL 和 busy_timeout
+    from app.db_pool import init_engine
+    init_engine(app, db)
+
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
 
+    from app.passwords import password_hasher
+    password_hasher.init_app(app)
+
+    # 登录用户缓存（注册 user_loader）
+    from app.user_cache import user_cache
+    user_cache.init_app(app)
+
+    from app.profiler import sql_profiler
+    sql_profiler.init_app(app)
+
+    from app.search import search_index
+    search_index.init_app(app)
+
+    from app.cart_summary import cart_summary
+    cart_summary.init_app(app)
+
+    from app.ranking import restaurant_ranking
+    restaurant_ranking.init_app(app)
+
+    from app.sales_counter import sales_counter
+    sales_counter.init_app(app)
+
+    from app.geo import geo_index
+    geo_index.init_app(app)
+
+    from app.events import event_bus
+    event_bus.init_app(app)
+
+    # 内容哈希命名的图片使用长期缓存，并注册 srcset 模板过滤器
+    from app.utils import register_image_caching
+    register_image_caching(app)
+
     # 注册蓝图
     from app.routes.auth import auth_bp
     from app.routes.dish import dish_bp
@@ -46,6 +87,8 @@ def create_app(config_name='default'):
     from app.routes.cart import cart_bp
     from app.routes.restaurant_category import restaurant_category_bp
     from app.routes.category import category_bp
+    from app.routes.image import image_bp
+    from app.routes.admin import admin_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(dish_bp)
@@ -54,6 +97,8 @@ def create_app(config_name='default'):
     app.register_blueprint(cart_bp)
     app.register_blueprint(restaurant_category_bp)
     app.register_blueprint(category_bp)
+    app.register_blueprint(image_bp)
+    app.register_blueprint(admin_bp)
 
     @app.route('/')
     def index():
@@ -62,9 +107,4 @@ def create_app(config_name='default'):
         else:
             return redirect(url_for('auth.login'))
 
-    from app.models import User
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
-
     return app
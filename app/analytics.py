@@ -0,0 +1,272 @@
+"""
+销售统计
+
+sales_rollup 表按小时和天两种粒度预聚合订单数、成交额（GMV）和件数，
+分餐厅、菜品、分类三个维度（菜品和分类的行带有所属餐厅，便于只看一家餐厅）。
+
+维护方式：
+  - 结算时在同一事务内累加（record），INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE
+    一条语句写入全部受影响的行；
+  - 订单取消或删除时按下单时间所在的时间段扣减（release_orders）；
+  - backfill() 从 order/order_item 全量或从某一天起重建，用于上线或修正数据。
+
+统计页面只查询 sales_rollup：一年范围按天粒度，每家餐厅最多 365 行，
+走 (granularity, dimension, restaurant_id, key_id, bucket) 主键或
+(granularity, dimension, bucket) 索引的范围扫描，与订单量无关。
+
+时间段按本地时间划分（ANALYTICS_UTC_OFFSET，小时），订单的 created_at 为 UTC。
+"""
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from app import db
+from app.models import SalesRollup, Order, OrderItem, Dish, Restaurant, Category
+
+HOUR = 'hour'
+DAY = 'day'
+GRANULARITIES = (HOUR, DAY)
+
+RESTAURANT = 'restaurant'
+DISH = 'dish'
+CATEGORY = 'category'
+DIMENSIONS = (RESTAURANT, DISH, CATEGORY)
+
+# 不计入统计的订单状态
+EXCLUDED_STATUSES = ('cancelled',)
+
+# 查询范围不超过该天数时按小时返回时间序列
+HOURLY_MAX_DAYS = 2
+
+
+def _utc_offset():
+    return timedelta(hours=current_app.config.get('ANALYTICS_UTC_OFFSET', 8))
+
+
+def bucket_start(created_at, granularity):
+    """UTC 时间 -> 本地时间的小时/天起点"""
+    local = created_at + _utc_offset()
+    if granularity == DAY:
+        return local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def _add(totals, key, orders, gmv, items):
+    current = totals.get(key)
+    if current is None:
+        totals[key] = [orders, gmv, items]
+    else:
+        current[0] += orders
+        current[1] += gmv
+        current[2] += items
+
+
+def _accumulate(totals, created_at, restaurant_id, total_amount, items, sign=1):
+    """把一个订单计入 totals；items 为 [(dish_id, category_id, quantity, subtotal)]"""
+    dishes, categories = {}, {}
+    for dish_id, category_id, quantity, subtotal in items:
+        for group, key in ((dishes, dish_id), (categories, category_id or 0)):
+            amount = group.setdefault(key, [0, 0])
+            amount[0] += subtotal or 0
+            amount[1] += quantity
+    quantity = sum(amount[1] for amount in dishes.values())
+
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(created_at, granularity)
+        _add(totals, (granularity, RESTAURANT, restaurant_id, 0, bucket),
+             sign, sign * (total_amount or 0), sign * quantity)
+        for dimension, group in ((DISH, dishes), (CATEGORY, categories)):
+            for key, (amount, count) in group.items():
+                _add(totals, (granularity, dimension, restaurant_id, key, bucket),
+                     sign, sign * amount, sign * count)
+
+
+def _upsert_statement():
+    table = SalesRollup.__table__
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table)
+        return stmt.on_duplicate_key_update(
+            orders=table.c.orders + stmt.inserted.orders,
+            gmv=table.c.gmv + stmt.inserted.gmv,
+            items=table.c['items'] + stmt.inserted['items'],
+        )
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[column.name for column in table.primary_key.columns],
+        set_={
+            'orders': table.c.orders + stmt.excluded.orders,
+            'gmv': table.c.gmv + stmt.excluded.gmv,
+            'items': table.c['items'] + stmt.excluded['items'],
+        }
+    )
+
+
+def _apply(totals, batch_size=1000):
+    """累加到 sales_rollup（按主键排序写入，固定加锁顺序；由调用方提交）"""
+    rows = [{
+        'granularity': key[0], 'dimension': key[1], 'restaurant_id': key[2],
+        'key_id': key[3], 'bucket': key[4],
+        'orders': orders, 'gmv': gmv, 'items': items,
+    } for key, (orders, gmv, items) in sorted(totals.items()) if orders or gmv or items]
+    stmt = _upsert_statement()
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(stmt, rows[i:i + batch_size])
+    return len(rows)
+
+
+def record(orders):
+    """结算时累加（在结算事务内调用，由调用方提交）
+
+    orders: [(created_at, restaurant_id, total_amount, [(dish_id, category_id, quantity, subtotal)])]
+    """
+    totals = {}
+    for created_at, restaurant_id, total_amount, items in orders:
+        _accumulate(totals, created_at, restaurant_id, total_amount, items)
+    _apply(totals)
+
+
+def _load_orders(order_ids):
+    """一次查询取出订单及订单项 -> [(created_at, restaurant_id, total_amount, items)]"""
+    rows = db.session.query(
+        Order.id, Order.created_at, Order.restaurant_id, Order.total_amount,
+        OrderItem.dish_id, Dish.category_id, OrderItem.quantity, OrderItem.subtotal
+    ).join(
+        OrderItem, OrderItem.order_id == Order.id
+    ).outerjoin(
+        Dish, OrderItem.dish_id == Dish.id
+    ).filter(Order.id.in_(order_ids)).order_by(Order.id).all()
+
+    orders = {}
+    for order_id, created_at, restaurant_id, total_amount, dish_id, category_id, quantity, subtotal in rows:
+        order = orders.get(order_id)
+        if order is None:
+            order = orders[order_id] = (created_at, restaurant_id, total_amount, [])
+        order[3].append((dish_id, category_id, quantity, subtotal))
+    return list(orders.values())
+
+
+def release_orders(order_ids):
+    """取消或删除的订单不再计入统计（在同一事务内调用，由调用方提交）"""
+    if not order_ids:
+        return
+    totals = {}
+    for created_at, restaurant_id, total_amount, items in _load_orders(order_ids):
+        _accumulate(totals, created_at, restaurant_id, total_amount, items, sign=-1)
+    _apply(totals)
+
+
+def backfill(since=None, batch_size=1000):
+    """从订单重建统计（since 为本地日期，为空时全量），返回处理的订单数
+
+    删除和重建在同一事务中提交；重建期间写入的订单会被计入两次或漏计，
+    应在低峰期执行。
+    """
+    table = SalesRollup.__table__
+    stale = table.delete()
+    query = db.session.query(Order.id).filter(Order.status.notin_(EXCLUDED_STATUSES))
+    if since is not None:
+        start = datetime(since.year, since.month, since.day)
+        stale = stale.where(table.c.bucket >= start)
+        query = query.filter(Order.created_at >= start - _utc_offset())
+    db.session.execute(stale)
+
+    totals = {}
+    count = 0
+    last_id = 0
+    while True:
+        order_ids = [row[0] for row in query.filter(Order.id > last_id).order_by(Order.id).limit(batch_size)]
+        if not order_ids:
+            break
+        for created_at, restaurant_id, total_amount, items in _load_orders(order_ids):
+            _accumulate(totals, created_at, restaurant_id, total_amount, items)
+        count += len(order_ids)
+        last_id = order_ids[-1]
+
+    _apply(totals)
+    db.session.commit()
+    return count
+
+
+# ---- 查询（只读 sales_rollup） ----
+
+def recent_range(days):
+    """最近 days 天（含今天）的本地时间范围 [start, end)"""
+    end = bucket_start(datetime.utcnow(), DAY) + timedelta(days=1)
+    return end - timedelta(days=days), end
+
+
+def granularity_for(start, end):
+    return HOUR if end - start <= timedelta(days=HOURLY_MAX_DAYS) else DAY
+
+
+def _filtered(query, granularity, dimension, start, end, restaurant_id):
+    query = query.filter(
+        SalesRollup.granularity == granularity,
+        SalesRollup.dimension == dimension,
+        SalesRollup.bucket >= start,
+        SalesRollup.bucket < end
+    )
+    if restaurant_id:
+        query = query.filter(SalesRollup.restaurant_id == restaurant_id)
+    return query
+
+
+def _totals(row):
+    orders, gmv, items = row
+    return {'orders': int(orders or 0), 'gmv': round(gmv or 0, 2), 'items': int(items or 0)}
+
+
+def summary(start, end, restaurant_id=None):
+    """[start, end) 内的订单数、成交额、件数（本地时间）"""
+    query = db.session.query(
+        func.sum(SalesRollup.orders), func.sum(SalesRollup.gmv), func.sum(SalesRollup.items)
+    )
+    row = _filtered(query, granularity_for(start, end), RESTAURANT, start, end, restaurant_id).one()
+    return _totals(row)
+
+
+def timeseries(start, end, restaurant_id=None, granularity=None):
+    """按时间段汇总 -> [{'bucket', 'orders', 'gmv', 'items'}]（没有订单的时间段不返回）"""
+    granularity = granularity or granularity_for(start, end)
+    query = db.session.query(
+        SalesRollup.bucket,
+        func.sum(SalesRollup.orders), func.sum(SalesRollup.gmv), func.sum(SalesRollup.items)
+    )
+    rows = _filtered(query, granularity, RESTAURANT, start, end, restaurant_id)\
+        .group_by(SalesRollup.bucket).order_by(SalesRollup.bucket).all()
+    return [dict(_totals(row[1:]), bucket=row[0]) for row in rows]
+
+
+_NAME_COLUMNS = {
+    RESTAURANT: (Restaurant.id, Restaurant.name),
+    DISH: (Dish.id, Dish.name),
+    CATEGORY: (Category.id, Category.name),
+}
+
+
+def top(dimension, start, end, restaurant_id=None, limit=10):
+    """成交额最高的餐厅/菜品/分类 -> [{'id', 'name', 'orders', 'gmv', 'items'}]"""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f'未知的统计维度: {dimension}')
+    key = SalesRollup.restaurant_id if dimension == RESTAURANT else SalesRollup.key_id
+    gmv = func.sum(SalesRollup.gmv)
+    query = db.session.query(key, func.sum(SalesRollup.orders), gmv, func.sum(SalesRollup.items))
+    rows = _filtered(query, granularity_for(start, end), dimension, start, end, restaurant_id)\
+        .group_by(key).order_by(gmv.desc()).limit(limit).all()
+
+    id_column, name_column = _NAME_COLUMNS[dimension]
+    ids = [row[0] for row in rows]
+    names = dict(db.session.query(id_column, name_column).filter(id_column.in_(ids)).all()) if ids else {}
+    result = []
+    for row in rows:
+        name = names.get(row[0]) or ('未分类' if dimension == CATEGORY else f'#{row[0]}')
+        result.append(dict(_totals(row[1:]), id=row[0], name=name))
+    return result
@@ -0,0 +1,223 @@
+"""
+菜品/餐厅批量管理
+
+按 id 列表或筛选条件（如“配料包含某食材的菜品”“某菜系的餐厅”）选出记录，
+一次查询取出受影响的 id，再以集合形式的 UPDATE/DELETE 在同一事务中修改，
+提交后对菜单缓存、搜索索引、排序分和位置索引各做一次失效，返回实际修改的行数。
+
+筛选条件为 dict，至少需要一个条件，避免误操作全表：
+  请求体为 {"ids": [...]} 或 {"filter": {...}}，两者同时给出时取交集。
+  菜品：ids, restaurant_id, category_id, keyword（名称包含）, ingredient（配料包含）, available
+  餐厅：ids, cuisine_type, status, keyword（名称包含）
+"""
+
+from sqlalchemy import update, delete, exists
+
+from app import db
+from app.models import Dish, Restaurant, RestaurantScore, CartItem, OrderItem
+
+RESTAURANT_STATUSES = ('open', 'closed', 'busy')
+
+# 一次最多修改的行数
+MAX_BULK_ROWS = 10000
+
+
+class BulkError(ValueError):
+    """筛选条件无效（消息可直接返回给调用方）"""
+
+
+def _ids(value):
+    if not isinstance(value, (list, tuple)):
+        raise BulkError('ids 必须是列表')
+    try:
+        return [int(v) for v in value]
+    except (TypeError, ValueError):
+        raise BulkError('ids 必须是整数')
+
+
+def _int(criteria, key):
+    try:
+        return int(criteria[key])
+    except (TypeError, ValueError):
+        raise BulkError(f'{key} 必须是整数')
+
+
+def criteria_from_json(data):
+    """请求体 {"ids": [...], "filter": {...}} -> 筛选条件"""
+    if not isinstance(data, dict):
+        raise BulkError('请求体必须是 JSON 对象')
+    criteria = data.get('filter') or {}
+    if not isinstance(criteria, dict):
+        raise BulkError('filter 必须是 JSON 对象')
+    criteria = dict(criteria)
+    if data.get('ids') is not None:
+        criteria['ids'] = data['ids']
+    return criteria
+
+
+def dish_conditions(criteria):
+    """筛选条件 -> WHERE 条件列表"""
+    conditions = []
+    if criteria.get('ids') is not None:
+        conditions.append(Dish.id.in_(_ids(criteria['ids'])))
+    if criteria.get('restaurant_id'):
+        conditions.append(Dish.restaurant_id == _int(criteria, 'restaurant_id'))
+    if criteria.get('category_id'):
+        conditions.append(Dish.category_id == _int(criteria, 'category_id'))
+    if criteria.get('keyword'):
+        conditions.append(Dish.name.contains(str(criteria['keyword']), autoescape=True))
+    if criteria.get('ingredient'):
+        conditions.append(Dish.ingredients.contains(str(criteria['ingredient']), autoescape=True))
+    if criteria.get('available') is not None:
+        conditions.append(Dish.available == bool(criteria['available']))
+    if not conditions:
+        raise BulkError('请指定 ids 或筛选条件')
+    return conditions
+
+
+def restaurant_conditions(criteria):
+    conditions = []
+    if criteria.get('ids') is not None:
+        conditions.append(Restaurant.id.in_(_ids(criteria['ids'])))
+    if criteria.get('cuisine_type'):
+        conditions.append(Restaurant.cuisine_type == str(criteria['cuisine_type']))
+    if criteria.get('status'):
+        conditions.append(Restaurant.status == str(criteria['status']))
+    if criteria.get('keyword'):
+        conditions.append(Restaurant.name.contains(str(criteria['keyword']), autoescape=True))
+    if not conditions:
+        raise BulkError('请指定 ids 或筛选条件')
+    return conditions
+
+
+def _select(query):
+    rows = query.limit(MAX_BULK_ROWS + 1).all()
+    if len(rows) > MAX_BULK_ROWS:
+        raise BulkError(f'一次最多修改 {MAX_BULK_ROWS} 条，请缩小筛选范围')
+    return rows
+
+
+def bulk_set_dish_available(criteria, available):
+    """批量上下架，返回 {'matched', 'updated'}"""
+    from app.menu_cache import menu_cache
+    from app.search import search_index
+
+    rows = _select(db.session.query(
+        Dish.id, Dish.restaurant_id, Dish.name, Dish.ingredients, Dish.description
+    ).filter(*dish_conditions(criteria), Dish.available != available))
+    if not rows:
+        return {'matched': 0, 'updated': 0}
+
+    dish_ids = [row.id for row in rows]
+    updated = db.session.execute(
+        update(Dish).where(Dish.id.in_(dish_ids)).values(available=available)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    menu_cache.publish(*set(row.restaurant_id for row in rows))
+    db.session.commit()
+
+    menu_cache.invalidate(*set(row.restaurant_id for row in rows))
+    if available:
+        search_index.index_dishes(rows)
+    else:
+        search_index.remove_dishes(dish_ids)
+    return {'matched': len(rows), 'updated': updated}
+
+
+def bulk_delete_dishes(criteria, force=False):
+    """批量删除菜品
+
+    已有订单记录的菜品不删除（订单项引用菜品，与单个删除一致），计入 skipped；
+    默认同时跳过仍在购物车中的菜品。force 时先删除匹配菜品的购物车项
+    （并使这些用户的购物车汇总失效），有订单记录的菜品改为下架（计入 deactivated）。
+    返回 {'matched', 'deleted', 'skipped', 'deactivated', 'cart_items_deleted'}。
+    """
+    from app.menu_cache import menu_cache
+    from app.search import search_index
+    from app.cart_summary import cart_summary
+    from app.utils import delete_image_file
+
+    conditions = dish_conditions(criteria)
+    matched = _select(db.session.query(Dish.id, Dish.restaurant_id, Dish.available).filter(*conditions))
+    deletable = [~exists().where(OrderItem.dish_id == Dish.id)]
+    if not force:
+        deletable.append(~exists().where(CartItem.dish_id == Dish.id))
+    rows = db.session.query(Dish.id, Dish.restaurant_id).filter(*conditions, *deletable).all()
+
+    dish_ids = [row.id for row in rows]
+    deletable_ids = set(dish_ids)
+    # 有订单记录的菜品只下架
+    deactivate_ids = [row.id for row in matched if row.id not in deletable_ids and row.available] if force else []
+    if not dish_ids and not deactivate_ids:
+        return {'matched': len(matched), 'deleted': 0, 'skipped': len(matched),
+                'deactivated': 0, 'cart_items_deleted': 0}
+
+    cart_items_deleted = 0
+    cart_user_ids = []
+    if force:
+        matched_ids = [row.id for row in matched]
+        # 提交后刷新这些用户的购物车汇总
+        cart_user_ids = [user_id for (user_id,) in db.session.query(CartItem.user_id)
+                         .filter(CartItem.dish_id.in_(matched_ids)).distinct()]
+        cart_items_deleted = db.session.execute(
+            delete(CartItem).where(CartItem.dish_id.in_(matched_ids))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    deactivated = 0
+    if deactivate_ids:
+        deactivated = db.session.execute(
+            update(Dish).where(Dish.id.in_(deactivate_ids)).values(available=False)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    deleted = 0
+    images = []
+    if dish_ids:
+        images = [image for (image,) in db.session.query(Dish.image).filter(
+            Dish.id.in_(dish_ids), Dish.image.isnot(None)).distinct()]
+        deleted = db.session.execute(
+            delete(Dish).where(Dish.id.in_(dish_ids)).execution_options(synchronize_session=False)
+        ).rowcount
+    touched = set(dish_ids) | set(deactivate_ids)
+    touched_restaurants = set(row.restaurant_id for row in matched if row.id in touched)
+    menu_cache.publish(*touched_restaurants)
+    db.session.commit()
+    for image in images:
+        if not image.startswith('http'):
+            delete_image_file(image)
+
+    menu_cache.invalidate(*touched_restaurants)
+    for user_id in cart_user_ids:
+        cart_summary.invalidate(user_id)
+    search_index.remove_dishes(list(touched))
+    return {
+        'matched': len(matched),
+        'deleted': deleted,
+        'skipped': len(matched) - deleted,
+        'deactivated': deactivated,
+        'cart_items_deleted': cart_items_deleted,
+    }
+
+
+def bulk_set_restaurant_status(criteria, status):
+    """批量修改餐厅营业状态（同时修改排序表中冗余的状态），返回 {'matched', 'updated'}"""
+    from app.geo import geo_index
+
+    if status not in RESTAURANT_STATUSES:
+        raise BulkError(f'无效的状态: {status}')
+    restaurant_ids = [row.id for row in _select(db.session.query(Restaurant.id).filter(
+        *restaurant_conditions(criteria), Restaurant.status != status))]
+    if not restaurant_ids:
+        return {'matched': 0, 'updated': 0}
+
+    updated = db.session.execute(
+        update(Restaurant).where(Restaurant.id.in_(restaurant_ids)).values(status=status)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.execute(
+        update(RestaurantScore).where(RestaurantScore.restaurant_id.in_(restaurant_ids))
+        .values(status=status).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    geo_index.rebuild()
+    return {'matched': len(restaurant_ids), 'updated': updated}
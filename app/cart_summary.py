@@ -0,0 +1,229 @@
+"""
+购物车汇总缓存
+
+按用户缓存购物车汇总（商品种数、总件数、各餐厅小计），
+加购/改数量/删除/清空/结算时增量维护，/cart/count 命中时不查询 CartItem。
+
+存储可插拔：
+  - LRUCartStore：进程内 LRU（默认）。多个 worker 之间不共享，
+    依靠 CART_SUMMARY_TTL 限制不一致的时间；
+  - RedisCartStore：任何提供 get/set(ex=)/delete/pipeline 的 Redis 兼容客户端。
+
+增量维护是“读取-修改-写回”，两种存储都通过 update() 原子地完成：
+LRU 在锁内修改，Redis 用 WATCH/MULTI 乐观锁，键被并发修改时重试。
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from flask import current_app
+
+from app import db
+from app.models import CartItem, Dish
+
+try:
+    import redis
+    from redis.exceptions import WatchError
+except ImportError:  # redis 为可选依赖
+    redis = None
+
+    class WatchError(Exception):
+        """WATCH 的键在事务提交前被修改"""
+
+
+class CartSummary(object):
+    """某个用户的购物车汇总"""
+
+    __slots__ = ('items',)
+
+    def __init__(self, items=None):
+        # {dish_id: (restaurant_id, quantity, price)}
+        self.items = items or {}
+
+    @property
+    def distinct_items(self):
+        return len(self.items)
+
+    @property
+    def total_quantity(self):
+        return sum(quantity for _, quantity, _ in self.items.values())
+
+    def restaurant_subtotals(self):
+        subtotals = {}
+        for restaurant_id, quantity, price in self.items.values():
+            subtotals[restaurant_id] = subtotals.get(restaurant_id, 0) + price * quantity
+        return subtotals
+
+    def restaurant_item_count(self, restaurant_id):
+        """某餐厅在购物车中的商品种数"""
+        return sum(1 for rid, _, _ in self.items.values() if rid == restaurant_id)
+
+    def to_dict(self):
+        return {str(dish_id): list(item) for dish_id, item in self.items.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(dict((int(dish_id), tuple(item)) for dish_id, item in data.items()))
+
+
+class LRUCartStore(object):
+    """进程内 LRU 存储"""
+
+    def __init__(self, max_entries=10000, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def update(self, key, change):
+        """在锁内用 change(旧值) 的返回值替换缓存的值，未缓存或已过期时不处理"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.time():
+                return
+            self._data[key] = (time.time() + self.ttl, change(entry[1]))
+            self._data.move_to_end(key)
+
+
+class RedisCartStore(object):
+    """Redis 兼容存储（值为 JSON）"""
+
+    max_retries = 5  # update() 因并发修改失败时的重试次数
+
+    def __init__(self, client, ttl=3600, prefix='cart_summary:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @staticmethod
+    def _decode(raw):
+        if raw is None:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8')
+        return json.loads(raw)
+
+    def get(self, key):
+        return self._decode(self.client.get(self.prefix + str(key)))
+
+    def set(self, key, value):
+        self.client.set(self.prefix + str(key), json.dumps(value), ex=self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + str(key))
+
+    def update(self, key, change):
+        """WATCH 键后读取、修改，在 MULTI 中写回；期间键被修改时重试，未缓存时不处理"""
+        name = self.prefix + str(key)
+        for _ in range(self.max_retries):
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(name)
+                    value = self._decode(pipe.get(name))
+                    if value is None:
+                        pipe.unwatch()
+                        return
+                    pipe.multi()
+                    pipe.set(name, json.dumps(change(value)), ex=self.ttl)
+                    pipe.execute()
+                    return
+                except WatchError:
+                    continue
+        # 冲突过多时删除，下次读取从数据库加载
+        self.client.delete(name)
+
+
+def load_cart_summary(user_id):
+    """从数据库加载购物车汇总（一次查询）"""
+    rows = db.session.query(
+        CartItem.dish_id, Dish.restaurant_id, CartItem.quantity, Dish.price
+    ).join(Dish, CartItem.dish_id == Dish.id).filter(CartItem.user_id == user_id).all()
+
+    items = {}
+    for dish_id, restaurant_id, quantity, price in rows:
+        items[dish_id] = (restaurant_id, quantity, price)
+    return CartSummary(items)
+
+
+class CartSummaryCache(object):
+    """购物车汇总的读取与增量维护"""
+
+    def init_app(self, app):
+        app.config.setdefault('CART_SUMMARY_STORE', 'memory')  # memory/redis
+        app.config.setdefault('CART_SUMMARY_TTL', 30)
+        app.config.setdefault('CART_SUMMARY_MAX_USERS', 10000)
+        app.config.setdefault('CART_SUMMARY_REDIS_URL', 'redis://localhost:6379/0')
+
+        if app.config['CART_SUMMARY_STORE'] == 'redis':
+            if redis is None:
+                raise RuntimeError('CART_SUMMARY_STORE=redis 需要安装 redis 包')
+            client = redis.Redis.from_url(app.config['CART_SUMMARY_REDIS_URL'])
+            store = RedisCartStore(client, ttl=app.config['CART_SUMMARY_TTL'])
+        else:
+            store = LRUCartStore(max_entries=app.config['CART_SUMMARY_MAX_USERS'],
+                                 ttl=app.config['CART_SUMMARY_TTL'])
+        app.extensions['cart_summary_store'] = store
+
+    @property
+    def store(self):
+        return current_app.extensions['cart_summary_store']
+
+    def get(self, user_id):
+        """读取汇总，未命中时从数据库加载"""
+        data = self.store.get(user_id)
+        if data is not None:
+            return CartSummary.from_dict(data)
+
+        summary = load_cart_summary(user_id)
+        self.store.set(user_id, summary.to_dict())
+        return summary
+
+    def _update(self, user_id, change):
+        # 未缓存时不做处理，下次读取会从数据库加载
+        def apply(data):
+            summary = CartSummary.from_dict(data)
+            change(summary.items)
+            return summary.to_dict()
+        self.store.update(user_id, apply)
+
+    def set_item(self, user_id, dish, quantity):
+        """加购或修改数量后调用"""
+        self._update(user_id, lambda items: items.__setitem__(
+            dish.id, (dish.restaurant_id, quantity, dish.price)))
+
+    def remove_item(self, user_id, dish_id):
+        self._update(user_id, lambda items: items.pop(dish_id, None))
+
+    def clear(self, user_id):
+        self.store.set(user_id, CartSummary().to_dict())
+
+    def invalidate(self, user_id):
+        self.store.delete(user_id)
+
+
+cart_summary = CartSummaryCache()
@@ -0,0 +1,315 @@
+"""
+餐厅/菜品批量导入
+
+读取 CSV 或 JSONL，逐行校验（不把整个文件读进内存），餐厅名和分类名
+在开始时各用一次查询解析为 id；校验通过的行按批处理：每批一次查询找出已存在的记录，
+新记录 executemany 插入、已有记录 executemany 按 id 更新，每批单独提交。
+出错的行记录行号和原因后跳过，不影响同批其他行。
+
+餐厅以名称为唯一键，菜品以 (餐厅, 菜品名称) 为唯一键。
+"""
+
+import csv
+import json
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from app import db
+from app.models import Restaurant, Dish, Category
+from app.geo import geocode
+
+RESTAURANT_STATUSES = ('open', 'closed', 'busy')
+
+# 最多保留的错误明细条数（错误总数另计）
+MAX_REPORTED_ERRORS = 1000
+
+_TRUE_VALUES = ('1', 'true', 'yes', 'y', 'on', '是')
+_FALSE_VALUES = ('0', 'false', 'no', 'n', 'off', '否', '')
+
+
+class RowError(ValueError):
+    """单行校验失败"""
+
+
+class ImportResult(object):
+    """导入结果"""
+
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []  # [(行号, 原因)]
+        self.restaurant_ids = set()  # 菜品涉及的餐厅，用于刷新菜单缓存
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self):
+        return {
+            'total': self.total,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+        }
+
+
+def read_rows(text_stream, fmt):
+    """逐行读取，产出 (行号, dict)；CSV 行号含表头"""
+    if fmt == 'csv':
+        reader = csv.DictReader(text_stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(text_stream, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, RowError(f'JSON 格式错误: {e}')
+                continue
+            if not isinstance(row, dict):
+                yield line_no, RowError('每行必须是 JSON 对象')
+                continue
+            yield line_no, row
+    else:
+        raise ValueError(f'不支持的格式: {fmt}')
+
+
+# ---- 字段解析 ----
+
+def _text(row, key, required=False, max_length=None):
+    value = row.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'缺少 {key}')
+    if max_length and len(value) > max_length:
+        raise RowError(f'{key} 超过 {max_length} 个字符')
+    return value
+
+
+def _number(row, key, default=None, required=False, minimum=None):
+    value = row.get(key)
+    if value is None or str(value).strip() == '':
+        if required:
+            raise RowError(f'缺少 {key}')
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{key} 不是数字: {value}')
+    if minimum is not None and number < minimum:
+        raise RowError(f'{key} 不能小于 {minimum}')
+    return number
+
+
+def _bool(row, key, default=False):
+    value = row.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise RowError(f'{key} 不是布尔值: {value}')
+
+
+def parse_restaurant(row):
+    status = _text(row, 'status') or 'open'
+    if status not in RESTAURANT_STATUSES:
+        raise RowError(f'status 无效: {status}')
+    address = _text(row, 'address', max_length=200)
+    point = geocode(address)
+    return {
+        'name': _text(row, 'name', required=True, max_length=100),
+        'description': _text(row, 'description'),
+        'address': address,
+        'latitude': point[0] if point else None,
+        'longitude': point[1] if point else None,
+        'phone': _text(row, 'phone', max_length=20),
+        'cuisine_type': _text(row, 'cuisine_type', max_length=50),
+        'business_hours': _text(row, 'business_hours', max_length=100),
+        'delivery_fee': _number(row, 'delivery_fee', 0, minimum=0),
+        'min_order': _number(row, 'min_order', 0, minimum=0),
+        'status': status,
+        'logo': _text(row, 'logo', max_length=200),
+        'banner': _text(row, 'banner', max_length=200),
+    }
+
+
+def parse_dish(row, restaurant_ids, category_ids):
+    restaurant_name = _text(row, 'restaurant', required=True)
+    restaurant_id = restaurant_ids.get(restaurant_name)
+    if restaurant_id is None:
+        raise RowError(f'餐厅不存在: {restaurant_name}')
+
+    category_name = _text(row, 'category')
+    category_id = None
+    if category_name:
+        category_id = category_ids.get(category_name)
+        if category_id is None:
+            raise RowError(f'分类不存在: {category_name}')
+
+    return {
+        'restaurant_id': restaurant_id,
+        'category_id': category_id,
+        'name': _text(row, 'name', required=True, max_length=100),
+        'description': _text(row, 'description'),
+        'price': _number(row, 'price', required=True, minimum=0),
+        'original_price': _number(row, 'original_price', minimum=0),
+        'discount_rate': _number(row, 'discount_rate', minimum=0),
+        'image': _text(row, 'image', max_length=200),
+        'ingredients': _text(row, 'ingredients', max_length=200),
+        'available': _bool(row, 'available', True),
+        'is_recommended': _bool(row, 'is_recommended'),
+        'is_spicy': _bool(row, 'is_spicy'),
+    }
+
+
+# ---- 批量写入 ----
+
+def _upsert(table, batch, existing_ids, result, restaurant_ids=()):
+    """写入并提交一批，batch: {键: (行号, 字段)}；existing_ids: {键: id}
+
+    restaurant_ids 为本批涉及菜单的餐厅，在同一事务中发布菜单失效记录。
+    """
+    from app.menu_cache import menu_cache
+
+    inserts, updates = [], []
+    for key, (_, values) in batch.items():
+        row_id = existing_ids.get(key)
+        if row_id is None:
+            inserts.append(dict(values, created_at=datetime.utcnow()))
+        else:
+            updates.append(dict(('b_' + column, value) for column, value in values.items()))
+            updates[-1]['b_id'] = row_id
+
+    try:
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            columns = [key[2:] for key in updates[0] if key != 'b_id']
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('b_id'))
+                .values(dict((column, bindparam('b_' + column)) for column in columns)),
+                updates
+            )
+        menu_cache.publish(*restaurant_ids)
+        db.session.commit()
+    except Exception as e:
+        # 整批写入失败时回滚本批，逐行记为错误后继续下一批
+        db.session.rollback()
+        for line, _ in batch.values():
+            result.add_error(line, f'写入失败: {e.__class__.__name__}')
+        return False
+    result.inserted += len(inserts)
+    result.updated += len(updates)
+    return True
+
+
+def _flush_restaurants(batch, result, dry_run):
+    if not batch:
+        return
+    existing = dict(db.session.query(Restaurant.name, Restaurant.id)
+                    .filter(Restaurant.name.in_(list(batch))).all())
+    if dry_run:
+        result.inserted += sum(1 for name in batch if name not in existing)
+        result.updated += sum(1 for name in batch if name in existing)
+        return
+    _upsert(Restaurant.__table__, batch, existing, result)
+
+
+def _flush_dishes(batch, result, dry_run):
+    if not batch:
+        return
+    restaurant_ids = set(rid for rid, _ in batch)
+    names = set(name for _, name in batch)
+    existing = dict(((rid, name), dish_id) for dish_id, rid, name in db.session.query(
+        Dish.id, Dish.restaurant_id, Dish.name
+    ).filter(Dish.restaurant_id.in_(restaurant_ids), Dish.name.in_(names)).all())
+    result.restaurant_ids.update(restaurant_ids)
+    if dry_run:
+        result.inserted += sum(1 for key in batch if key not in existing)
+        result.updated += sum(1 for key in batch if key in existing)
+        return
+    _upsert(Dish.__table__, batch, existing, result, restaurant_ids)
+
+
+def import_restaurants(rows, batch_size=500, dry_run=False):
+    """导入餐厅，rows 为 read_rows 的输出"""
+    result = ImportResult()
+    batch = {}
+    for line, row in rows:
+        result.total += 1
+        try:
+            if isinstance(row, RowError):
+                raise row
+            values = parse_restaurant(row)
+        except RowError as e:
+            result.add_error(line, str(e))
+            continue
+        batch[values['name']] = (line, values)  # 同名的后一行覆盖前一行
+        if len(batch) >= batch_size:
+            _flush_restaurants(batch, result, dry_run)
+            batch = {}
+    _flush_restaurants(batch, result, dry_run)
+    return result
+
+
+def import_dishes(rows, batch_size=500, dry_run=False):
+    """导入菜品，rows 为 read_rows 的输出"""
+    # 餐厅名、分类名各一次查询
+    restaurant_ids = dict(db.session.query(Restaurant.name, Restaurant.id).all())
+    category_ids = dict(db.session.query(Category.name, Category.id).all())
+
+    result = ImportResult()
+    batch = {}
+    for line, row in rows:
+        result.total += 1
+        try:
+            if isinstance(row, RowError):
+                raise row
+            values = parse_dish(row, restaurant_ids, category_ids)
+        except RowError as e:
+            result.add_error(line, str(e))
+            continue
+        batch[(values['restaurant_id'], values['name'])] = (line, values)
+        if len(batch) >= batch_size:
+            _flush_dishes(batch, result, dry_run)
+            batch = {}
+    _flush_dishes(batch, result, dry_run)
+    return result
+
+
+def import_catalog(kind, text_stream, fmt, batch_size=500, dry_run=False):
+    """导入入口，kind 为 restaurants 或 dishes；导入后刷新相关缓存和索引"""
+    from app.menu_cache import menu_cache
+    from app.search import search_index
+    from app.ranking import restaurant_ranking
+    from app.geo import geo_index
+
+    rows = read_rows(text_stream, fmt)
+    if kind == 'restaurants':
+        result = import_restaurants(rows, batch_size, dry_run)
+    elif kind == 'dishes':
+        result = import_dishes(rows, batch_size, dry_run)
+    else:
+        raise ValueError(f'不支持的导入类型: {kind}')
+
+    if not dry_run and (result.inserted or result.updated):
+        menu_cache.invalidate(*result.restaurant_ids)
+        search_index.rebuild()
+        if kind == 'restaurants':
+            # 新餐厅需要排序分和位置索引
+            restaurant_ranking.rebuild()
+            geo_index.rebuild()
+    return result
@@ -0,0 +1,335 @@
+"""
+购物车结算
+
+一次查询读取购物车，单次遍历按餐厅分组，之后全部使用集合操作：
+先按 id 删除（占用）购物车行，再批量插入订单和订单项，
+最后追加菜品销量增量（app/sales_counter.py 定期汇总到 dish.sales_count），
+并累加各餐厅的近 30 天销量（排序分）和销售统计（app/analytics.py）。
+各阶段耗时记录在 CheckoutResult.timings（毫秒）中，便于写日志。
+
+客户端可以为每次结算带上幂等键（表单 idempotency_key 或 Idempotency-Key 请求头），
+幂等键与订单在同一事务中写入 idempotency_key 表，IDEMPOTENCY_KEY_TTL 秒内
+用同一个键重复提交时直接返回首次生成的订单，不再重新处理。
+"""
+
+import os
+import socket
+import time
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import CartItem, Dish, Restaurant, Order, OrderItem, IdempotencyKey
+from app.ranking import restaurant_ranking
+from app.sales_counter import sales_counter
+from app import analytics
+
+
+class CheckoutError(Exception):
+    """结算失败（消息可直接展示给用户）"""
+
+
+class CheckoutResult(object):
+    """结算结果"""
+
+    def __init__(self):
+        self.order_ids = []
+        self.order_nos = []
+        self.restaurant_ids = []
+        self.item_count = 0
+        self.timings = {}
+        self.replayed = False  # 重复提交，返回的是首次生成的订单
+
+    @property
+    def total_ms(self):
+        return round(sum(self.timings.values()), 2)
+
+
+class _StageTimer(object):
+    """记录每个阶段的耗时"""
+
+    def __init__(self, timings):
+        self.timings = timings
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.timings[stage] = round((now - self._last) * 1000, 2)
+        self._last = now
+
+
+# 同一进程内同一用户同时只允许一个结算请求（跨进程由占用购物车行保证）
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+
+class OrderNumberGenerator(object):
+    """订单号：ORD + 本地时间（精确到毫秒）+ 5 位节点号 + 3 位序号
+
+    同一毫秒内序号递增，序号用完或时钟回拨时沿用上一个毫秒值继续递增，
+    因此同一进程内严格递增、不重复，也不需要查询数据库。
+    节点号取 ORDER_NODE_ID，未配置时由主机名和进程号哈希得到（容器中进程号经常相同，
+    只用进程号在多个容器之间会重复）。哈希仍可能碰撞，结算在订单号冲突时重试一次。
+    """
+
+    SEQUENCE_LIMIT = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+        self._hashed_node = None  # (进程号, 节点号)
+
+    def _node_id(self):
+        node_id = current_app.config.get('ORDER_NODE_ID')
+        if node_id is not None:
+            return int(node_id) % 100000
+        pid = os.getpid()
+        if self._hashed_node is None or self._hashed_node[0] != pid:
+            key = f'{socket.gethostname()}:{pid}'.encode('utf-8')
+            self._hashed_node = (pid, zlib.crc32(key) % 100000)
+        return self._hashed_node[1]
+
+    def next(self):
+        now_ms = int(time.time() * 1000)
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms, self._sequence = now_ms, 0
+            else:
+                self._sequence += 1
+                if self._sequence >= self.SEQUENCE_LIMIT:
+                    self._last_ms, self._sequence = self._last_ms + 1, 0
+            ms, sequence = self._last_ms, self._sequence
+        timestamp = datetime.fromtimestamp(ms / 1000).strftime('%Y%m%d%H%M%S')
+        return f"ORD{timestamp}{ms % 1000:03d}{self._node_id():05d}{sequence:03d}"
+
+
+order_numbers = OrderNumberGenerator()
+
+
+def generate_order_no():
+    """生成订单号"""
+    return order_numbers.next()
+
+
+def find_idempotent_result(user_id, key):
+    """幂等键未过期时返回首次结算的结果，否则返回 None"""
+    record = db.session.get(IdempotencyKey, (user_id, key))
+    if record is None or record.expires_at < datetime.utcnow():
+        return None
+    order_ids = [int(order_id) for order_id in record.order_ids.split(',')]
+    orders = dict((row[0], row) for row in db.session.query(
+        Order.id, Order.order_no, Order.restaurant_id
+    ).filter(Order.id.in_(order_ids)).all())
+
+    result = CheckoutResult()
+    result.replayed = True
+    for order_id in order_ids:
+        if order_id in orders:
+            result.order_ids.append(order_id)
+            result.order_nos.append(orders[order_id][1])
+            result.restaurant_ids.append(orders[order_id][2])
+    return result
+
+
+_purged_at = 0
+
+
+def purge_expired_keys(force=False):
+    """删除过期的幂等键（每个进程每 IDEMPOTENCY_PURGE_INTERVAL 秒最多执行一次）"""
+    global _purged_at
+    if not force and time.time() - _purged_at < current_app.config['IDEMPOTENCY_PURGE_INTERVAL']:
+        return 0
+    _purged_at = time.time()
+    deleted = IdempotencyKey.query.filter(
+        IdempotencyKey.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def _is_order_no_conflict(error):
+    """唯一约束冲突是否发生在 order.order_no 上（各数据库的错误信息都带有列名或约束名）"""
+    return 'order_no' in str(getattr(error, 'orig', error))
+
+
+def checkout_cart(user_id, address, remark='', idempotency_key=None):
+    """将用户购物车按餐厅拆分为订单，返回 CheckoutResult
+
+    购物车为空或已被并发请求提交时抛出 CheckoutError，事务已回滚。
+    带幂等键且该键已成功结算过时返回首次的结果（result.replayed 为 True）。
+    """
+    if idempotency_key:
+        replay = find_idempotent_result(user_id, idempotency_key)
+        if replay is not None:
+            return replay
+
+    with _inflight_lock:
+        if user_id in _inflight:
+            raise CheckoutError('订单正在提交中，请勿重复提交')
+        _inflight.add(user_id)
+
+    try:
+        try:
+            result = _checkout(user_id, address, remark, idempotency_key)
+        except IntegrityError as e:
+            if not _is_order_no_conflict(e):
+                raise
+            # 两个进程的节点号相同且在同一毫秒生成了相同的订单号：回滚后用新的订单号重试一次
+            db.session.rollback()
+            current_app.logger.warning(f'订单号冲突，重试结算 user={user_id}')
+            result = _checkout(user_id, address, remark, idempotency_key)
+    except (CheckoutError, IntegrityError):
+        # 同一个键的并发请求先提交时，本次的购物车占用或幂等键写入会失败
+        db.session.rollback()
+        replay = idempotency_key and find_idempotent_result(user_id, idempotency_key)
+        if replay:
+            return replay
+        raise
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.discard(user_id)
+
+    purge_expired_keys()
+    return result
+
+
+def _checkout(user_id, address, remark, idempotency_key=None):
+    result = CheckoutResult()
+    timer = _StageTimer(result.timings)
+
+    # 1. 读取购物车（只取需要的列）
+    rows = db.session.query(
+        CartItem.id, CartItem.dish_id, CartItem.quantity,
+        Dish.price, Dish.restaurant_id, Dish.category_id, Restaurant.delivery_fee
+    ).join(
+        Dish, CartItem.dish_id == Dish.id
+    ).join(
+        Restaurant, Dish.restaurant_id == Restaurant.id
+    ).filter(
+        CartItem.user_id == user_id
+    ).all()
+    timer.mark('load_cart')
+
+    if not rows:
+        raise CheckoutError('购物车为空')
+
+    # 2. 单次遍历按餐厅分组，同时累计每道菜的销量增量
+    groups = {}
+    sales = {}
+    categories = {}
+    for cart_id, dish_id, quantity, price, restaurant_id, category_id, delivery_fee in rows:
+        group = groups.get(restaurant_id)
+        if group is None:
+            group = groups[restaurant_id] = {
+                'delivery_fee': delivery_fee or 0,
+                'subtotal': 0,
+                'items': []
+            }
+        group['items'].append((dish_id, quantity, price))
+        group['subtotal'] += price * quantity
+        sales[dish_id] = sales.get(dish_id, 0) + quantity
+        categories[dish_id] = category_id
+    timer.mark('group')
+
+    # 3. 占用购物车行：并发的重复提交在这里只能删除到 0 行
+    cart_ids = [row[0] for row in rows]
+    deleted = CartItem.query.filter(
+        CartItem.user_id == user_id,
+        CartItem.id.in_(cart_ids)
+    ).delete(synchronize_session=False)
+    if deleted != len(cart_ids):
+        db.session.rollback()
+        raise CheckoutError('购物车已变化或订单已提交，请刷新后重试')
+    timer.mark('claim_cart')
+
+    # 4. 批量插入订单，按订单号一次取回 id
+    now = datetime.utcnow()
+    order_rows = []
+    for restaurant_id, group in groups.items():
+        order_rows.append({
+            'order_no': generate_order_no(),
+            'user_id': user_id,
+            'restaurant_id': restaurant_id,
+            'delivery_name': address.name,
+            'delivery_phone': address.phone,
+            'delivery_address': address.address,
+            'subtotal': group['subtotal'],
+            'delivery_fee': group['delivery_fee'],
+            'total_amount': group['subtotal'] + group['delivery_fee'],
+            'status': 'pending',
+            'payment_status': 'unpaid',
+            'created_at': now,
+            'remark': remark
+        })
+    db.session.execute(Order.__table__.insert(), order_rows)
+
+    order_nos = [row['order_no'] for row in order_rows]
+    order_ids = dict(db.session.query(Order.restaurant_id, Order.id).filter(
+        Order.order_no.in_(order_nos)
+    ).all())
+    timer.mark('insert_orders')
+
+    # 5. 批量插入订单项
+    item_rows = []
+    for restaurant_id, group in groups.items():
+        for dish_id, quantity, price in group['items']:
+            item_rows.append({
+                'order_id': order_ids[restaurant_id],
+                'dish_id': dish_id,
+                'quantity': quantity,
+                'price': price,
+                'subtotal': price * quantity
+            })
+    db.session.execute(OrderItem.__table__.insert(), item_rows)
+    timer.mark('insert_items')
+
+    # 6. 追加菜品销量增量（由 sales_counter 定期汇总到 dish.sales_count，不在热点行上加锁）
+    sales_counter.record(sales)
+    timer.mark('update_sales')
+
+    # 7. 餐厅近 30 天销量（排序分）
+    restaurant_ranking.record_sales(dict(
+        (restaurant_id, sum(quantity for _, quantity, _ in group['items']))
+        for restaurant_id, group in groups.items()
+    ))
+    timer.mark('update_ranking')
+
+    # 7.1 销售统计（按小时/天预聚合）
+    analytics.record([
+        (now, restaurant_id, group['subtotal'] + group['delivery_fee'],
+         [(dish_id, categories[dish_id], quantity, price * quantity) for dish_id, quantity, price in group['items']])
+        for restaurant_id, group in groups.items()
+    ])
+    timer.mark('update_analytics')
+
+    # 8. 幂等键（与订单一起提交；过期的同名键先删除）
+    if idempotency_key:
+        IdempotencyKey.query.filter(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == idempotency_key,
+            IdempotencyKey.expires_at < now
+        ).delete(synchronize_session=False)
+        db.session.execute(IdempotencyKey.__table__.insert(), [{
+            'user_id': user_id,
+            'key': idempotency_key,
+            'order_ids': ','.join(str(order_ids[restaurant_id]) for restaurant_id in groups),
+            'expires_at': now + timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL']),
+        }])
+        timer.mark('idempotency_key')
+
+    db.session.commit()
+    timer.mark('commit')
+
+    result.order_nos = order_nos
+    result.restaurant_ids = list(groups)
+    result.order_ids = [order_ids[restaurant_id] for restaurant_id in groups]
+    result.item_count = len(item_rows)
+    return result
@@ -0,0 +1,170 @@
+"""
+数据库连接池与引擎配置
+
+按部署方式（gunicorn worker × 线程数）推导连接池大小：每个 worker 进程一个连接池，
+每个线程同一时间最多占用一个连接，所以 pool_size 取线程数，另留少量溢出给脚本和突发请求。
+MySQL 等服务端数据库开启 pool_pre_ping 和 pool_recycle，避免拿到被服务端断开的连接；
+SQLite 文件库开启 WAL 和 busy_timeout，读写可以并发，写锁冲突时等待而不是立即报错。
+
+连接池使用 InstrumentedQueuePool，记录取连接的等待时间、超时次数和峰值占用，
+管理员可在 /admin/db-pool 查看。
+"""
+
+import time
+import threading
+
+from flask import current_app
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录取连接等待与饱和度的 QueuePool"""
+
+    # 沿用 SQLAlchemy 的日志名，否则会挂到 Flask 的 app 日志下输出调试信息
+    _sqla_logger_namespace = 'sqlalchemy.pool.impl.QueuePool'
+
+    def __init__(self, *args, **kwargs):
+        super(InstrumentedQueuePool, self).__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.slow_threshold = 0.01  # 秒
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.checkouts = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.slow_checkouts = 0  # 等待超过 DB_POOL_SLOW_CHECKOUT_MS 的次数
+            self.timeouts = 0
+            self.peak_checked_out = 0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super(InstrumentedQueuePool, self).connect()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        with self._stats_lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            if waited >= self.slow_threshold:
+                self.slow_checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checkedout())
+        return connection
+
+    def metrics(self):
+        capacity = self.size() + max(self._max_overflow, 0)
+        with self._stats_lock:
+            return {
+                'pool_size': self.size(),
+                'max_overflow': self._max_overflow,
+                'checked_out': self.checkedout(),
+                'peak_checked_out': self.peak_checked_out,
+                'saturation': round(self.checkedout() / float(capacity), 3) if capacity else 0,
+                'peak_saturation': round(self.peak_checked_out / float(capacity), 3) if capacity else 0,
+                'checkouts': self.checkouts,
+                'avg_wait_ms': round(self.total_wait * 1000 / self.checkouts, 3) if self.checkouts else 0,
+                'max_wait_ms': round(self.max_wait * 1000, 3),
+                'slow_checkouts': self.slow_checkouts,
+                'timeouts': self.timeouts,
+            }
+
+
+def _is_sqlite(url):
+    return url.drivername.startswith('sqlite')
+
+
+def _is_sqlite_memory(url):
+    return _is_sqlite(url) and url.database in (None, '', ':memory:')
+
+
+def build_engine_options(config):
+    """根据配置生成 SQLALCHEMY_ENGINE_OPTIONS
+
+    配置中已显式给出的 SQLALCHEMY_ENGINE_OPTIONS 优先。
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    threads = max(1, int(config.get('WEB_THREADS') or 1))
+
+    options = {}
+    if not _is_sqlite_memory(url):
+        pool_size = config.get('DB_POOL_SIZE') or threads
+        max_overflow = config.get('DB_MAX_OVERFLOW')
+        options.update({
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': pool_size,
+            'max_overflow': threads if max_overflow is None else max_overflow,
+            'pool_timeout': config.get('DB_POOL_TIMEOUT', 10),
+        })
+        if not _is_sqlite(url):
+            options['pool_pre_ping'] = config.get('DB_POOL_PRE_PING', True)
+            options['pool_recycle'] = config.get('DB_POOL_RECYCLE', 280)
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def _set_sqlite_pragmas(busy_timeout_ms, wal):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout_ms)}')
+            if wal:
+                cursor.execute('PRAGMA journal_mode = WAL')
+                cursor.execute('PRAGMA synchronous = NORMAL')
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def configure_engine(app, engine):
+    """引擎创建后的设置：SQLite 连接参数，以及连接总数检查"""
+    url = engine.url
+    if _is_sqlite(url):
+        if not _is_sqlite_memory(url):
+            event.listen(engine, 'connect', _set_sqlite_pragmas(
+                app.config.get('SQLITE_BUSY_TIMEOUT_MS', 5000),
+                app.config.get('SQLITE_WAL', True)))
+        return
+
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        per_process = pool.size() + max(pool._max_overflow, 0)
+        workers = max(1, int(app.config.get('WEB_WORKERS') or 1))
+        limit = app.config.get('DB_MAX_CONNECTIONS')
+        if limit and per_process * workers > limit:
+            app.logger.warning(
+                f"连接池上限 {workers} worker × {per_process} = {per_process * workers} "
+                f"超过数据库允许的连接数 {limit}，请调小 DB_POOL_SIZE/DB_MAX_OVERFLOW"
+            )
+
+
+def init_engine(app, db):
+    """在 db.init_app 之前生成引擎参数，之后完成引擎设置"""
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(app.config)
+    db.init_app(app)
+    with app.app_context():
+        # 主库和各只读副本
+        for engine in db.engines.values():
+            configure_engine(app, engine)
+            if isinstance(engine.pool, InstrumentedQueuePool):
+                engine.pool.slow_threshold = app.config.get('DB_POOL_SLOW_CHECKOUT_MS', 10) / 1000.0
+
+
+def pool_metrics(engine):
+    """当前连接池指标，非 InstrumentedQueuePool 时只返回基本信息"""
+    pool = engine.pool
+    if isinstance(pool, InstrumentedQueuePool):
+        metrics = pool.metrics()
+    else:
+        metrics = {'status': pool.status()}
+    metrics['pool_class'] = type(pool).__name__
+    metrics['workers'] = current_app.config.get('WEB_WORKERS')
+    metrics['threads'] = current_app.config.get('WEB_THREADS')
+    return metrics
@@ -0,0 +1,200 @@
+"""
+读写分离
+
+SQLALCHEMY_REPLICA_URIS 中的每个只读副本注册为一个 bind（replica0、replica1……）。
+标记了 @read_replica 的只读页面（GET 请求）把查询发往一个健康的副本，其余请求和写入都走主库：
+
+  - RoutingSession.get_bind：本次请求一旦有写入（flush、INSERT/UPDATE/DELETE、
+    SELECT ... FOR UPDATE 或原生 SQL），之后的查询全部改走主库；
+  - 读己之写：请求中有写入时在 Flask 会话里记下时间，REPLICA_STICKY_SECONDS 秒内
+    该用户的请求都读主库（例如结算后立即打开订单列表或餐厅页）；
+  - 延迟保护：配置了副本时，每个 worker 处理第一个请求时启动心跳线程，每
+    REPLICA_HEARTBEAT_INTERVAL 秒更新主库 replication_heartbeat 表的时间（读请求本身不写主库）；
+    从副本读出的时间与当前时间相差超过 REPLICA_MAX_LAG 秒的副本视为不可用。
+
+没有配置副本时所有查询仍走主库。本地可以用两个 SQLite 文件模拟主库和副本
+（复制主库文件作为副本，副本的心跳时间停留在复制时刻）。
+"""
+
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import select, update, insert
+from sqlalchemy.sql.elements import TextClause
+
+STICKY_SESSION_KEY = '_primary_until'
+
+
+def _is_write(clause):
+    if clause is None:
+        return False
+    if isinstance(clause, TextClause):
+        return True
+    return getattr(clause, 'is_dml', False) or getattr(clause, '_for_update_arg', None) is not None
+
+
+class RoutingSession(Session):
+    """按 session.info 中的标记把只读查询发往副本"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        if bind is not None:
+            return engine
+        if self._flushing or _is_write(clause):
+            self.info['wrote'] = True
+            return engine
+        replica = self.info.get('replica')
+        if replica is None or self.info.get('wrote') or self.info.get('primary'):
+            return engine
+        # 只替换默认库（主库）上的查询
+        engines = self._db.engines
+        if engine is engines.get(None):
+            return engines[replica]
+        return engine
+
+
+class ReplicaRouter(object):
+    """副本注册、健康检查与选择"""
+
+    def __init__(self):
+        self._lag = {}          # bind key -> (检查时间, 延迟秒数或 None)
+        self._heartbeat_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """在 db.init_app 之前调用：把副本加入 SQLALCHEMY_BINDS"""
+        app.config.setdefault('SQLALCHEMY_REPLICA_URIS', [])
+        app.config.setdefault('REPLICA_MAX_LAG', 3)                  # 秒
+        app.config.setdefault('REPLICA_LAG_CHECK_INTERVAL', 1)       # 秒
+        app.config.setdefault('REPLICA_HEARTBEAT_INTERVAL', 1)       # 秒
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 10)          # 写入后读主库的时间
+
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for i, uri in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+            binds[f'replica{i}'] = uri
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+        app.before_request(self._ensure_heartbeat)
+        app.after_request(self._remember_writes)
+
+    @property
+    def replica_keys(self):
+        return [f'replica{i}' for i in range(len(current_app.config['SQLALCHEMY_REPLICA_URIS']))]
+
+    # ---- 延迟检查 ----
+
+    def _write_heartbeat(self, db):
+        """更新主库心跳"""
+        from app.models import ReplicationHeartbeat
+        table = ReplicationHeartbeat.__table__
+        with db.engines[None].begin() as conn:
+            now = datetime.utcnow()
+            if not conn.execute(update(table).where(table.c.id == 1).values(updated_at=now)).rowcount:
+                conn.execute(insert(table).values(id=1, updated_at=now))
+
+    def _ensure_heartbeat(self):
+        """配置了副本时每个进程启动一个心跳线程（gunicorn fork 之后在各 worker 中分别启动）"""
+        if not current_app.config['SQLALCHEMY_REPLICA_URIS'] or self._heartbeat_pid == os.getpid():
+            return
+        with self._lock:
+            if self._heartbeat_pid == os.getpid():
+                return
+            app = current_app._get_current_object()
+            thread = threading.Thread(target=self._run_heartbeat, args=(app,),
+                                      name='replica-heartbeat', daemon=True)
+            thread.start()
+            self._heartbeat_pid = os.getpid()
+
+    def _run_heartbeat(self, app):
+        from app import db
+        while True:
+            with app.app_context():
+                try:
+                    self._write_heartbeat(db)
+                except Exception:
+                    current_app.logger.warning('写入复制心跳失败', exc_info=True)
+                interval = current_app.config['REPLICA_HEARTBEAT_INTERVAL']
+            time.sleep(interval)
+
+    def _measure(self, db, key):
+        from app.models import ReplicationHeartbeat
+        table = ReplicationHeartbeat.__table__
+        try:
+            with db.engines[key].connect() as conn:
+                beat = conn.execute(select(table.c.updated_at).where(table.c.id == 1)).scalar()
+        except Exception:
+            current_app.logger.warning(f'只读副本 {key} 不可用', exc_info=True)
+            return None
+        if beat is None:
+            return None
+        return max((datetime.utcnow() - beat).total_seconds(), 0.0)
+
+    def lag(self, key):
+        """副本延迟（秒），不可用时返回 None；结果缓存 REPLICA_LAG_CHECK_INTERVAL 秒"""
+        from app import db
+        checked_at, lag = self._lag.get(key, (0, None))
+        if time.time() - checked_at < current_app.config['REPLICA_LAG_CHECK_INTERVAL']:
+            return lag
+        with self._lock:
+            checked_at, lag = self._lag.get(key, (0, None))
+            if time.time() - checked_at < current_app.config['REPLICA_LAG_CHECK_INTERVAL']:
+                return lag
+            lag = self._measure(db, key)
+            self._lag[key] = (time.time(), lag)
+            return lag
+
+    def healthy_replicas(self):
+        max_lag = current_app.config['REPLICA_MAX_LAG']
+        healthy = []
+        for key in self.replica_keys:
+            lag = self.lag(key)
+            if lag is not None and lag <= max_lag:
+                healthy.append(key)
+        return healthy
+
+    def status(self):
+        return dict((key, {'lag': self.lag(key)}) for key in self.replica_keys)
+
+    # ---- 请求路由 ----
+
+    def choose(self):
+        """本次请求使用的副本，不应读副本时返回 None"""
+        if request.method not in ('GET', 'HEAD') or not self.replica_keys:
+            return None
+        if flask_session.get(STICKY_SESSION_KEY, 0) > time.time():
+            return None
+        healthy = self.healthy_replicas()
+        return random.choice(healthy) if healthy else None
+
+    def _remember_writes(self, response):
+        from app import db
+        if db.session.registry.has() and db.session.info.get('wrote') and self.replica_keys:
+            flask_session[STICKY_SESSION_KEY] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+
+def read_replica(view):
+    """只读视图：GET 请求的查询发往健康的副本"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from app import db
+        replica = replica_router.choose()
+        if replica is not None:
+            db.session.info['replica'] = replica
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def use_primary():
+    """本次请求余下的查询改读主库（需要读到刚写入的数据时调用）"""
+    from app import db
+    db.session.info['primary'] = True
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,312 @@
+"""
+订单事件推送
+
+订单状态变化（结算下单、商家修改状态、用户取消）提交后发布事件，
+/order/events 以 Server-Sent Events 长连接推送给相关的用户和商家，
+页面不再需要反复刷新。
+
+事件按频道分发：user:<用户 id>、restaurant:<餐厅 id>、orders（全部订单，管理员使用）。
+进程内由 EventBus 把事件分发给本进程的订阅者；进程之间通过可插拔的 broker 传递：
+  - MemoryBroker：只在本进程内分发（默认，适用于单个 worker）；
+  - FileBroker：各 worker 追加写同一个事件文件，后台线程读取新增的行，
+    作为多个 gunicorn worker 在同一台机器上共享事件的本地替代；
+  - RedisBroker：Redis 发布/订阅（需要 redis 包）。
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows 上没有 fcntl，文件轮转不加锁
+    fcntl = None
+
+try:
+    import redis
+except ImportError:  # redis 为可选依赖
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+ORDERS_CHANNEL = 'orders'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def restaurant_channel(restaurant_id):
+    return f'restaurant:{restaurant_id}'
+
+
+class MemoryBroker(object):
+    """进程内 broker：发布即分发"""
+
+    def __init__(self):
+        self._deliver = None
+
+    def start(self, deliver):
+        self._deliver = deliver
+
+    def publish(self, message):
+        if self._deliver is not None:
+            self._deliver(message)
+
+
+class FileBroker(object):
+    """同机多进程共享的事件文件
+
+    每条事件一行 JSON，用一次 O_APPEND 写入；每个进程的后台线程保持文件句柄，
+    按 poll_interval 读取新增的行。文件超过 max_bytes 时改名为 <path>.1 并重新创建，
+    读取线程读完旧文件剩余内容后切换到新文件。
+    """
+
+    def __init__(self, path, poll_interval=0.2, max_bytes=1024 * 1024):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def start(self, deliver):
+        thread = threading.Thread(target=self._tail, args=(deliver,), name='event-file-broker', daemon=True)
+        thread.start()
+
+    def publish(self, message):
+        data = (json.dumps(message, ensure_ascii=False) + '\n').encode('utf-8')
+        self._rotate()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _rotate(self):
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except OSError:
+            return
+        with open(self.path + '.lock', 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            # 加锁后再次确认，避免其他进程刚轮转过
+            try:
+                if os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+            except OSError:
+                pass
+
+    def _open(self, path, seek_end):
+        fd = os.open(path, os.O_RDONLY | os.O_CREAT, 0o644)
+        f = os.fdopen(fd, 'rb')
+        if seek_end:
+            f.seek(0, os.SEEK_END)
+        return f
+
+    def _tail(self, deliver):
+        f = self._open(self.path, seek_end=True)
+        pending = b''
+        while True:
+            chunk = f.read()
+            if chunk:
+                pending += chunk
+                *lines, pending = pending.split(b'\n')
+                for line in lines:
+                    if line:
+                        try:
+                            deliver(json.loads(line))
+                        except Exception:
+                            logger.exception('订单事件分发失败')
+                continue
+
+            reading = os.fstat(f.fileno()).st_ino
+            try:
+                current = os.stat(self.path).st_ino
+            except OSError:
+                current = None
+            if current == reading:
+                time.sleep(self.poll_interval)
+                continue
+
+            # 已轮转。两次读取之间轮转了两次时，中间的文件此时是 <path>.1，先读它
+            f.close()
+            pending = b''
+            try:
+                if os.stat(self.path + '.1').st_ino != reading:
+                    f = self._open(self.path + '.1', seek_end=False)
+                    continue
+            except OSError:
+                pass
+            f = self._open(self.path, seek_end=False)
+
+
+class RedisBroker(object):
+    """Redis 发布/订阅"""
+
+    def __init__(self, client, channel='order_events'):
+        self.client = client
+        self.channel = channel
+
+    def start(self, deliver):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: lambda item: deliver(json.loads(item['data']))})
+        pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def publish(self, message):
+        self.client.publish(self.channel, json.dumps(message, ensure_ascii=False))
+
+
+class Subscription(object):
+    """一个 SSE 连接的订阅（有界队列，消费过慢时丢弃最旧的事件）"""
+
+    def __init__(self, channels, maxsize):
+        self.channels = tuple(channels)
+        self.queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout):
+        """等待下一条事件，超时返回 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus(object):
+    """进程内订阅表 + broker"""
+
+    def __init__(self):
+        self._subscriptions = {}  # 频道 -> set(Subscription)
+        self._streams = set()
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._sequence = 0
+
+    def init_app(self, app):
+        app.config.setdefault('EVENT_BROKER', 'memory')  # memory/file/redis
+        app.config.setdefault('EVENT_FILE_PATH', os.path.join(app.instance_path, 'events.log'))
+        app.config.setdefault('EVENT_REDIS_URL', 'redis://localhost:6379/0')
+        app.config.setdefault('EVENT_QUEUE_SIZE', 100)         # 每个连接最多缓存的事件数
+        app.config.setdefault('EVENT_HEARTBEAT', 15)           # 心跳间隔（秒）
+        app.config.setdefault('EVENT_STREAM_TIMEOUT', 60)      # 连接保持时间（秒），之后由浏览器自动重连
+        app.config.setdefault('EVENT_POLL_INTERVAL', 15)       # 推送连接已满时客户端的轮询间隔（秒）
+        # 每个 SSE 连接占用一个 gunicorn 线程，默认最多占用一半线程（容量说明见 config.py）
+        if not app.config.get('EVENT_MAX_STREAMS'):
+            app.config['EVENT_MAX_STREAMS'] = max(app.config.get('WEB_THREADS', 4) // 2, 1)
+
+        kind = app.config['EVENT_BROKER']
+        if kind == 'redis':
+            if redis is None:
+                raise RuntimeError('EVENT_BROKER=redis 需要安装 redis 包')
+            broker = RedisBroker(redis.Redis.from_url(app.config['EVENT_REDIS_URL']))
+        elif kind == 'file':
+            broker = FileBroker(app.config['EVENT_FILE_PATH'])
+        else:
+            broker = MemoryBroker()
+        app.extensions['event_broker'] = broker
+
+    @property
+    def broker(self):
+        broker = current_app.extensions['event_broker']
+        # gunicorn 在 fork 之后的每个 worker 中各自启动读取线程
+        if self._started_pid != os.getpid():
+            with self._lock:
+                if self._started_pid != os.getpid():
+                    broker.start(self._deliver)
+                    self._started_pid = os.getpid()
+        return broker
+
+    def publish(self, channels, event, data):
+        """发布事件（在数据库提交之后调用）"""
+        self.broker.publish({'channels': list(channels), 'event': event, 'data': data})
+
+    def subscribe(self, channels):
+        """订阅频道；连接数达到 EVENT_MAX_STREAMS 时返回 None"""
+        self.broker  # 确保本进程的 broker 已启动
+        subscription = Subscription(channels, current_app.config['EVENT_QUEUE_SIZE'])
+        with self._lock:
+            if len(self._streams) >= current_app.config['EVENT_MAX_STREAMS']:
+                return None
+            self._streams.add(subscription)
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._streams.discard(subscription)
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def stream_count(self):
+        return len(self._streams)
+
+    def _deliver(self, message):
+        with self._lock:
+            self._sequence += 1
+            message = dict(message, id=self._sequence)
+            targets = set()
+            for channel in message['channels']:
+                targets.update(self._subscriptions.get(channel, ()))
+        for subscription in targets:
+            subscription.put(message)
+
+
+def publish_order_status(order_id, order_no, user_id, restaurant_id, status):
+    """发布订单状态变化"""
+    from app.order_status import status_label
+    event_bus.publish(
+        [user_channel(user_id), restaurant_channel(restaurant_id), ORDERS_CHANNEL],
+        'order_status',
+        {
+            'order_id': order_id,
+            'order_no': order_no,
+            'restaurant_id': restaurant_id,
+            'status': status,
+            'label': status_label(status),
+            'at': datetime.utcnow().isoformat(),
+        }
+    )
+
+
+def publish_orders(order_ids):
+    """批量修改后按 id 读取并发布（一次查询）"""
+    from app import db
+    from app.models import Order
+    if not order_ids:
+        return
+    rows = db.session.query(
+        Order.id, Order.order_no, Order.user_id, Order.restaurant_id, Order.status
+    ).filter(Order.id.in_(order_ids)).all()
+    for row in rows:
+        publish_order_status(*row)
+
+
+def sse_message(message):
+    """格式化为 SSE 消息"""
+    return (f"id: {message['id']}\nevent: {message['event']}\n"
+            f"data: {json.dumps(message['data'], ensure_ascii=False)}\n\n")
+
+
+event_bus = EventBus()
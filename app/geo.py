@@ -0,0 +1,217 @@
+"""
+地理位置：离线地址解析与附近餐厅索引
+
+geocode() 用本地地名表把地址文本解析为经纬度（取匹配到的最具体的地名），
+作为接入真实地图服务之前的替代；表中没有的地址返回 None，不参与距离计算。
+
+GeoIndex 把营业中且有坐标的餐厅放进固定大小的经纬度网格，
+“半径 N 公里内由近到远”只需扫描覆盖半径的若干网格再精确计算距离。
+索引在进程内维护，写入路径在提交后调用 index_restaurant/remove_restaurant，
+另按 GEO_INDEX_TTL 定期全量重建以合并其他进程的修改。
+"""
+
+import math
+import time
+import threading
+
+from flask import current_app
+from sqlalchemy import or_, update
+
+from app import db
+from app.models import Restaurant, Address
+
+KM_PER_DEGREE = 111.32
+
+# 离线地名表：地名 -> (纬度, 经度)。按层级匹配：地标/商圈优先于城区，城区优先于城市
+GEOCODE_CITIES = {
+    '北京': (39.9042, 116.4074),
+}
+
+GEOCODE_DISTRICTS = {
+    '东城区': (39.9288, 116.4160),
+    '西城区': (39.9123, 116.3660),
+    '朝阳区': (39.9215, 116.4431),
+    '海淀区': (39.9593, 116.2981),
+    '丰台区': (39.8585, 116.2866),
+    '石景山区': (39.9056, 116.2229),
+    '通州区': (39.9098, 116.6564),
+    '昌平区': (40.2207, 116.2312),
+    '大兴区': (39.7269, 116.3416),
+    '顺义区': (40.1302, 116.6546),
+}
+
+GEOCODE_LANDMARKS = {
+    '三里屯': (39.9334, 116.4551),
+    '太古里': (39.9358, 116.4547),
+    '国贸': (39.9087, 116.4605),
+    '建国门外': (39.9088, 116.4490),
+    '王府井': (39.9147, 116.4109),
+    '中关村': (39.9837, 116.3164),
+    '西单': (39.9133, 116.3741),
+    '望京': (39.9967, 116.4700),
+    '朝阳大悦城': (39.9243, 116.5183),
+    '朝阳北路': (39.9243, 116.5090),
+    '金融大街': (39.9176, 116.3587),
+    '学院路': (39.9926, 116.3522),
+    '五道口': (39.9925, 116.3375),
+    '亚运村': (40.0028, 116.4072),
+    '双井': (39.8937, 116.4614),
+    '前门': (39.8997, 116.3979),
+    '798': (39.9842, 116.4952),
+    '西二旗': (40.0530, 116.3074),
+}
+
+# 同一层级内长的地名优先
+_GEOCODE_LOOKUP = [
+    (key, table[key])
+    for table in (GEOCODE_LANDMARKS, GEOCODE_DISTRICTS, GEOCODE_CITIES)
+    for key in sorted(table, key=len, reverse=True)
+]
+
+
+def geocode(address):
+    """离线解析地址，返回 (纬度, 经度) 或 None"""
+    if not address:
+        return None
+    for key, point in _GEOCODE_LOOKUP:
+        if key in address:
+            return point
+    return None
+
+
+def fill_coordinates(obj, force=False):
+    """根据 obj.address 填充 latitude/longitude（已有坐标且非 force 时不覆盖）"""
+    if not force and obj.latitude is not None and obj.longitude is not None:
+        return
+    point = geocode(obj.address)
+    obj.latitude, obj.longitude = point if point else (None, None)
+
+
+def backfill_coordinates():
+    """为没有坐标的餐厅和收货地址补充坐标，返回更新的行数"""
+    updated = 0
+    for model in (Restaurant, Address):
+        rows = db.session.query(model.id, model.address).filter(
+            or_(model.latitude.is_(None), model.longitude.is_(None))).all()
+        params = []
+        for row_id, address in rows:
+            point = geocode(address)
+            if point:
+                params.append({'id': row_id, 'latitude': point[0], 'longitude': point[1]})
+        if params:
+            db.session.execute(update(model), params)
+            updated += len(params)
+    db.session.commit()
+    return updated
+
+
+class GeoIndex(object):
+    """营业中餐厅的网格索引"""
+
+    def __init__(self):
+        self._cells = None   # (纬度格, 经度格) -> {restaurant_id: (纬度, 经度)}
+        self._points = {}    # restaurant_id -> 所在网格
+        self._cell_deg = None
+        self._built_at = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('GEO_CELL_KM', 1.0)          # 网格边长（按纬度方向）
+        app.config.setdefault('GEO_DEFAULT_RADIUS_KM', 5)  # 按距离排序时的默认范围
+        app.config.setdefault('GEO_MAX_RADIUS_KM', 50)
+        app.config.setdefault('GEO_INDEX_TTL', 300)
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self._cell_deg)), int(math.floor(lon / self._cell_deg)))
+
+    def rebuild(self):
+        rows = db.session.query(Restaurant.id, Restaurant.latitude, Restaurant.longitude).filter(
+            Restaurant.status == 'open',
+            Restaurant.latitude.isnot(None),
+            Restaurant.longitude.isnot(None)
+        ).all()
+
+        cell_deg = current_app.config['GEO_CELL_KM'] / KM_PER_DEGREE
+        cells, points = {}, {}
+        with self._lock:
+            self._cell_deg = cell_deg
+            for rid, lat, lon in rows:
+                cell = self._cell(lat, lon)
+                cells.setdefault(cell, {})[rid] = (lat, lon)
+                points[rid] = cell
+            self._cells, self._points = cells, points
+            self._built_at = time.time()
+        return len(points)
+
+    def _ensure(self):
+        if self._cells is None or time.time() - self._built_at > current_app.config['GEO_INDEX_TTL']:
+            self.rebuild()
+
+    def index_restaurant(self, restaurant):
+        """餐厅增改后调用：营业中且有坐标时加入索引，否则移除"""
+        if self._cells is None:
+            return
+        self.remove_restaurant(restaurant.id)
+        if restaurant.status != 'open' or restaurant.latitude is None or restaurant.longitude is None:
+            return
+        with self._lock:
+            cell = self._cell(restaurant.latitude, restaurant.longitude)
+            self._cells.setdefault(cell, {})[restaurant.id] = (restaurant.latitude, restaurant.longitude)
+            self._points[restaurant.id] = cell
+
+    def remove_restaurant(self, restaurant_id):
+        if self._cells is None:
+            return
+        with self._lock:
+            cell = self._points.pop(restaurant_id, None)
+            if cell is not None:
+                bucket = self._cells.get(cell)
+                bucket.pop(restaurant_id, None)
+                if not bucket:
+                    del self._cells[cell]
+
+    def nearby(self, lat, lon, radius_km, limit=None):
+        """半径内的餐厅，返回按距离升序的 [(restaurant_id, 公里)]"""
+        self._ensure()
+        radius_km = min(radius_km, current_app.config['GEO_MAX_RADIUS_KM'])
+
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        with self._lock:
+            lat_min, lon_min = self._cell(lat - dlat, lon - dlon)
+            lat_max, lon_max = self._cell(lat + dlat, lon + dlon)
+            candidates = []
+            for i in range(lat_min, lat_max + 1):
+                for j in range(lon_min, lon_max + 1):
+                    bucket = self._cells.get((i, j))
+                    if bucket:
+                        candidates.extend(bucket.items())
+
+        # 城市范围内用等距圆柱投影近似，先比较平方距离，只对命中的点开方
+        kx = KM_PER_DEGREE * math.cos(math.radians(lat))
+        ky = KM_PER_DEGREE
+        limit_sq = radius_km * radius_km
+        results = []
+        for rid, (plat, plon) in candidates:
+            dx = (plon - lon) * kx
+            dy = (plat - lat) * ky
+            distance_sq = dx * dx + dy * dy
+            if distance_sq <= limit_sq:
+                results.append((rid, math.sqrt(distance_sq)))
+        results.sort(key=lambda item: item[1])
+        return results[:limit] if limit else results
+
+
+def user_location(user):
+    """用户的默认收货地址坐标（没有默认地址时取最早的有坐标地址）"""
+    address = Address.query.filter(
+        Address.user_id == user.id,
+        Address.latitude.isnot(None),
+        Address.longitude.isnot(None)
+    ).order_by(Address.is_default.desc(), Address.id).first()
+    if address is None:
+        return None
+    return address.latitude, address.longitude
+
+
+geo_index = GeoIndex()
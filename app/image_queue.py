@@ -0,0 +1,179 @@
+"""
+图片处理队列
+
+上传时只把原始字节写到目标路径（作为占位）并立即返回，
+格式转换、缩放、JPEG/WebP 压缩和各宽度版本交给线程池/进程池完成，
+处理结果先写临时文件再原子替换目标文件。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+
+from flask import current_app
+from PIL import Image
+
+# 任务状态
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def pending_marker(file_path):
+    """处理中的标记文件（存在时表示目标文件仍是未处理的原图）"""
+    return os.path.splitext(file_path)[0] + '.pending'
+
+
+def variant_widths(max_size, widths):
+    """需要生成的宽度：小于最大宽度的预设宽度 + 最大宽度本身"""
+    return sorted(set([w for w in widths if w < max_size[0]] + [max_size[0]]))
+
+
+def _save_atomic(img, path, fmt, **options):
+    tmp_path = path + '.tmp'
+    try:
+        img.save(tmp_path, fmt, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def process_image(file_path, max_size, widths=(), webp=True):
+    """转换为 RGB、按比例缩放并压缩（在工作线程/进程中执行）
+
+    除目标文件外，还为每个宽度生成 <名称>-<宽度>.jpg（以及 .webp），
+    目标文件最后替换，完成后删除处理中标记。
+    """
+    base = os.path.splitext(file_path)[0]
+    try:
+        with Image.open(file_path) as img:
+            # 转换为RGB模式（处理RGBA等格式）
+            if img.mode in ('RGBA', 'LA', 'P'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                if img.mode == 'P':
+                    img = img.convert('RGBA')
+                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+
+            # 调整图片大小（保持比例）
+            img.thumbnail(tuple(max_size), Image.Resampling.LANCZOS)
+
+            # 各宽度的响应式版本
+            for width in variant_widths(max_size, widths) if widths else []:
+                variant = img.copy()
+                variant.thumbnail((width, max_size[1]), Image.Resampling.LANCZOS)
+                _save_atomic(variant, f'{base}-{width}.jpg', 'JPEG', quality=85, optimize=True)
+                if webp:
+                    _save_atomic(variant, f'{base}-{width}.webp', 'WEBP', quality=80)
+
+            if webp and widths:
+                _save_atomic(img, base + '.webp', 'WEBP', quality=80)
+            _save_atomic(img, file_path, 'JPEG', quality=85, optimize=True)
+        return file_path
+    finally:
+        marker = pending_marker(file_path)
+        if os.path.exists(marker):
+            os.remove(marker)
+
+
+class ImageJob(object):
+    """一次图片处理任务"""
+
+    __slots__ = ('id', 'web_path', '_status', '_error', 'future')
+
+    def __init__(self, job_id, web_path):
+        self.id = job_id
+        self.web_path = web_path
+        self._status = PENDING
+        self._error = None
+        self.future = None
+
+    @property
+    def status(self):
+        if self.future is None:
+            return self._status
+        if not self.future.done():
+            return PENDING
+        return FAILED if self.future.exception() is not None else DONE
+
+    @property
+    def error(self):
+        if self.future is not None and self.future.done() and self.future.exception() is not None:
+            return str(self.future.exception())
+        return self._error
+
+    def to_dict(self):
+        return {'id': self.id, 'path': self.web_path, 'status': self.status, 'error': self.error}
+
+
+class ImageQueue(object):
+    """图片处理队列（IMAGE_EXECUTOR 为 thread 或 process）"""
+
+    max_jobs = 1000  # 保留最近的任务状态
+
+    def __init__(self):
+        self._executor = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    workers = current_app.config.get('IMAGE_WORKERS', 2)
+                    if current_app.config.get('IMAGE_EXECUTOR', 'thread') == 'process':
+                        self._executor = ProcessPoolExecutor(max_workers=workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                                            thread_name_prefix='image')
+        return self._executor
+
+    def submit(self, job_id, file_path, web_path, max_size, widths=(), webp=True):
+        """提交处理任务；IMAGE_ASYNC 关闭时在当前线程同步处理"""
+        job = ImageJob(job_id, web_path)
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        if not current_app.config.get('IMAGE_ASYNC', True):
+            try:
+                process_image(file_path, max_size, widths, webp)
+                job._status = DONE
+            except Exception as e:
+                job._status = FAILED
+                job._error = str(e)
+            return job
+
+        job.future = self._get_executor().submit(process_image, file_path, max_size, widths, webp)
+        return job
+
+    def status(self, job_id):
+        """查询任务状态，未知任务返回 None"""
+        return self._jobs.get(job_id)
+
+    def wait(self, job_id=None, timeout=None):
+        """等待指定任务（或全部未完成任务）结束，返回是否全部完成"""
+        with self._lock:
+            if job_id is not None:
+                jobs = [self._jobs[job_id]] if job_id in self._jobs else []
+            else:
+                jobs = list(self._jobs.values())
+        futures = [job.future for job in jobs if job.future is not None]
+        if not futures:
+            return True
+        _, not_done = wait(futures, timeout=timeout)
+        return not not_done
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+image_queue = ImageQueue()
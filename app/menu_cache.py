@@ -0,0 +1,267 @@
+"""
+餐厅菜单快照缓存
+
+一次查询加载餐厅的全部在售菜品，在 Python 中按分类分组，
+生成不可变的快照并按餐厅缓存在进程内。菜品增删改后调用
+invalidate() 使对应餐厅的快照失效。
+
+每个快照带有版本号（该餐厅每加载一次新快照加 1），菜单 JSON 接口
+按 (餐厅, 分类, 版本) 缓存序列化并 gzip 压缩后的响应体（MenuResponseCache），
+版本不变时重复请求不查询数据库也不重新序列化。
+
+失效后 REPLICA_MAX_LAG 秒内重新加载的快照从主库读取，避免把只读副本上的旧菜单缓存下来。
+
+后台任务（如销量汇总）只在一个进程中运行，通过 publish() 向 menu_invalidation 表
+追加失效记录；每个进程每 MENU_SYNC_INTERVAL 秒最多查询一次新记录并使对应快照失效。
+"""
+
+import gzip
+import hashlib
+import time
+import threading
+from collections import namedtuple, OrderedDict
+
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.db_routing import use_primary
+
+from app import db
+from app.models import Dish, Category, MenuInvalidation
+
+# 快照中使用的只读记录（避免在请求之间共享 ORM 对象）
+DishView = namedtuple('DishView', [
+    'id', 'restaurant_id', 'category_id', 'name', 'description', 'price',
+    'original_price', 'image', 'ingredients', 'sales_count', 'rating',
+    'is_recommended', 'is_spicy'
+])
+
+CategoryView = namedtuple('CategoryView', ['id', 'name', 'icon', 'sort_order'])
+
+
+class MenuSnapshot(object):
+    """某个餐厅在某一时刻的菜单（只读）"""
+
+    __slots__ = ('restaurant_id', 'dishes', 'categories', 'dishes_by_category',
+                 'recommended', 'built_at', 'version')
+
+    def __init__(self, restaurant_id, dishes, categories, dishes_by_category,
+                 recommended):
+        self.restaurant_id = restaurant_id
+        self.dishes = dishes                          # tuple[DishView]，按销量降序
+        self.categories = categories                  # tuple[CategoryView]
+        self.dishes_by_category = dishes_by_category  # {分类名: tuple[DishView]}
+        self.recommended = recommended                # tuple[DishView]
+        self.built_at = time.time()
+        self.version = None                           # 写入缓存时由 MenuCache 分配
+
+    def dishes_in_category(self, category_id):
+        """按分类筛选菜品，category_id 为空时返回全部"""
+        if not category_id:
+            return self.dishes
+        return tuple(d for d in self.dishes if d.category_id == category_id)
+
+
+def load_menu_snapshot(restaurant_id, recommended_limit=6):
+    """用一条 SQL 加载餐厅全部在售菜品并分组"""
+    rows = db.session.query(
+        Dish.id, Dish.restaurant_id, Dish.category_id, Dish.name,
+        Dish.description, Dish.price, Dish.original_price, Dish.image,
+        Dish.ingredients, Dish.sales_count, Dish.rating,
+        Dish.is_recommended, Dish.is_spicy,
+        Category.name, Category.icon, Category.sort_order
+    ).outerjoin(
+        Category, Dish.category_id == Category.id
+    ).filter(
+        Dish.restaurant_id == restaurant_id,
+        Dish.available == True
+    ).order_by(Dish.sales_count.desc(), Dish.id).all()
+
+    dishes = []
+    categories = {}
+    grouped = {}
+    for row in rows:
+        dish = DishView(*row[:13])
+        dishes.append(dish)
+        if dish.category_id is None or row[13] is None:
+            continue
+        if dish.category_id not in categories:
+            categories[dish.category_id] = CategoryView(
+                dish.category_id, row[13], row[14], row[15] or 0
+            )
+            grouped[dish.category_id] = []
+        grouped[dish.category_id].append(dish)
+
+    ordered = tuple(sorted(categories.values(), key=lambda c: (c.sort_order, c.id)))
+    dishes_by_category = dict(
+        (category.name, tuple(grouped[category.id])) for category in ordered
+    )
+    recommended = tuple(d for d in dishes if d.is_recommended)[:recommended_limit]
+
+    return MenuSnapshot(restaurant_id, tuple(dishes), ordered,
+                        dishes_by_category, recommended)
+
+
+class MenuCache(object):
+    """按餐厅缓存菜单快照
+
+    进程内缓存。invalidate() 只作用于本进程，需要通知所有 worker 时用 publish()；
+    快照同时带有 TTL（MENU_CACHE_TTL，秒）作为兜底。
+    按最近使用淘汰，最多保留 max_restaurants 家餐厅的快照。
+    """
+
+    max_restaurants = 2000
+
+    # 失效记录保留时间（秒），应大于 MENU_CACHE_TTL
+    invalidation_retention = 3600
+
+    def __init__(self):
+        self._snapshots = OrderedDict()
+        self._generations = {}  # 每次失效递增，防止并发加载写回旧快照
+        self._versions = {}     # 每写入一个新快照递增
+        self._invalidated_at = {}
+        self._last_invalidation = None  # 已处理的最大 menu_invalidation.id
+        self._synced_at = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _ttl(self):
+        return current_app.config.get('MENU_CACHE_TTL', 300)
+
+    def cached(self, restaurant_id):
+        """返回未过期的快照，没有时返回 None（不加载）"""
+        self._sync()
+        with self._lock:
+            snapshot = self._snapshots.get(restaurant_id)
+            if snapshot is None or time.time() - snapshot.built_at >= self._ttl():
+                return None
+            self._snapshots.move_to_end(restaurant_id)
+        self.hits += 1
+        return snapshot
+
+    def get(self, restaurant_id):
+        """获取快照，不存在或已过期时重新加载（调用方应先确认餐厅存在）"""
+        snapshot = self.cached(restaurant_id)
+        if snapshot is not None:
+            return snapshot
+
+        self.misses += 1
+        generation = self._generations.get(restaurant_id, 0)
+        if time.time() - self._invalidated_at.get(restaurant_id, 0) < current_app.config.get('REPLICA_MAX_LAG', 0):
+            use_primary()
+        snapshot = load_menu_snapshot(restaurant_id)
+        with self._lock:
+            if self._generations.get(restaurant_id, 0) == generation:
+                snapshot.version = self._versions.get(restaurant_id, 0) + 1
+                self._versions[restaurant_id] = snapshot.version
+                self._snapshots[restaurant_id] = snapshot
+                self._snapshots.move_to_end(restaurant_id)
+                while len(self._snapshots) > self.max_restaurants:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, *restaurant_ids):
+        """使指定餐厅的快照失效"""
+        with self._lock:
+            for restaurant_id in restaurant_ids:
+                if restaurant_id is None:
+                    continue
+                self._snapshots.pop(restaurant_id, None)
+                self._generations[restaurant_id] = \
+                    self._generations.get(restaurant_id, 0) + 1
+                self._invalidated_at[restaurant_id] = time.time()
+
+    def publish(self, *restaurant_ids):
+        """记录需要所有进程失效的餐厅（在调用方事务内写入，由调用方提交）"""
+        restaurant_ids = sorted(set(rid for rid in restaurant_ids if rid is not None))
+        if restaurant_ids:
+            db.session.execute(MenuInvalidation.__table__.insert(), [
+                {'restaurant_id': rid, 'created_at': datetime.utcnow()} for rid in restaurant_ids
+            ])
+
+    def purge(self):
+        """删除超过保留时间的失效记录（由调用方提交）"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.invalidation_retention)
+        db.session.execute(MenuInvalidation.__table__.delete().where(MenuInvalidation.created_at < cutoff))
+
+    def _sync(self):
+        """读取其他进程发布的失效记录"""
+        now = time.time()
+        if now - self._synced_at < current_app.config.get('MENU_SYNC_INTERVAL', 2):
+            return
+        self._synced_at = now
+        if self._last_invalidation is None:
+            # 本进程刚启动，缓存为空，从当前位置开始跟踪
+            self._last_invalidation = db.session.query(func.max(MenuInvalidation.id)).scalar() or 0
+            return
+        rows = db.session.query(MenuInvalidation.id, MenuInvalidation.restaurant_id)\
+            .filter(MenuInvalidation.id > self._last_invalidation)\
+            .order_by(MenuInvalidation.id).all()
+        if rows:
+            self._last_invalidation = rows[-1][0]
+            self.invalidate(*set(rid for _, rid in rows))
+
+    def clear(self):
+        with self._lock:
+            for restaurant_id in self._snapshots:
+                self._generations[restaurant_id] = \
+                    self._generations.get(restaurant_id, 0) + 1
+            self._snapshots.clear()
+
+
+class MenuBody(object):
+    """预序列化的菜单响应体"""
+
+    __slots__ = ('raw', 'gzipped', 'etag')
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.gzipped = gzip.compress(raw, compresslevel=6)
+        self.etag = hashlib.sha1(raw).hexdigest()[:20]
+
+
+class MenuResponseCache(object):
+    """按 (餐厅, 分类, 快照版本) 缓存菜单响应体
+
+    每家餐厅只保留当前版本的各分类响应，版本变化时整体替换；
+    餐厅之间按最近使用淘汰，最多保留 max_restaurants 家。
+    """
+
+    max_restaurants = 2000
+
+    def __init__(self):
+        self._entries = OrderedDict()  # restaurant_id -> (版本, {category_id: MenuBody})
+        self._lock = threading.Lock()
+
+    def get(self, snapshot, category_id):
+        if snapshot.version is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(snapshot.restaurant_id)
+            if entry is None or entry[0] != snapshot.version:
+                return None
+            self._entries.move_to_end(snapshot.restaurant_id)
+            return entry[1].get(category_id)
+
+    def put(self, snapshot, category_id, body):
+        if snapshot.version is None:
+            return
+        with self._lock:
+            entry = self._entries.get(snapshot.restaurant_id)
+            if entry is None or entry[0] != snapshot.version:
+                entry = self._entries[snapshot.restaurant_id] = (snapshot.version, {})
+            entry[1][category_id] = body
+            self._entries.move_to_end(snapshot.restaurant_id)
+            while len(self._entries) > self.max_restaurants:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+menu_cache = MenuCache()
+menu_responses = MenuResponseCache()
@@ -1,7 +1,6 @@
 from app import db
 from flask_login import UserMixin
 from datetime import datetime
-from app import login_manager  # 确保这个导入在上面
 
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
@@ -29,9 +28,16 @@ class Address(db.Model):
     name = db.Column(db.String(50), nullable=False)  # 收货人姓名
     phone = db.Column(db.String(20), nullable=False)
     address = db.Column(db.String(200), nullable=False)  # 详细地址
+    latitude = db.Column(db.Float)  # 纬度（由 app/geo.py 根据地址解析）
+    longitude = db.Column(db.Float)  # 经度
     is_default = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+def _initial_rating():
+    """新餐厅的评分：没有评价时的贝叶斯平滑评分（即先验评分）"""
+    from app.reviews import bayesian_rating
+    return bayesian_rating(0, 0)
+
 class Restaurant(db.Model):
     """餐厅/店铺"""
     id = db.Column(db.Integer, primary_key=True)
@@ -40,12 +46,15 @@ class Restaurant(db.Model):
     logo = db.Column(db.String(200))
     banner = db.Column(db.String(200))
     address = db.Column(db.String(200))
+    latitude = db.Column(db.Float)  # 纬度（由 app/geo.py 根据地址解析）
+    longitude = db.Column(db.Float)  # 经度
     phone = db.Column(db.String(20))
     cuisine_type = db.Column(db.String(50))  # 菜系类型（中餐、西餐、日料等）
     business_hours = db.Column(db.String(100))  # 营业时间
     delivery_fee = db.Column(db.Float, default=0)  # 配送费
     min_order = db.Column(db.Float, default=0)  # 起送价
-    rating = db.Column(db.Float, default=5.0)  # 评分
+    rating = db.Column(db.Float, default=_initial_rating)  # 评分（贝叶斯平滑，由 app/reviews.py 维护）
+    rating_sum = db.Column(db.Integer, default=0)  # 评价星数合计
     review_count = db.Column(db.Integer, default=0)  # 评价数量
     status = db.Column(db.String(20), default='open')  # open/closed/busy
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -57,6 +66,24 @@ class Restaurant(db.Model):
     # 餐厅评价
     reviews = db.relationship('Review', backref='restaurant', lazy='dynamic')
 
+class RestaurantScore(db.Model):
+    """餐厅排序分（由 app/ranking.py 维护）"""
+    restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='open')  # 与 Restaurant.status 同步
+    rating = db.Column(db.Float, nullable=False, default=0)
+    sales_30d = db.Column(db.Integer, nullable=False, default=0)  # 近 30 天销量（件）
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime)  # 餐厅创建时间，按最新排序
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # 列表页先按 status 过滤再按某一项排序，每种排序对应一个联合索引
+    __table_args__ = (
+        db.Index('ix_restaurant_score_rating', 'status', 'rating', 'restaurant_id'),
+        db.Index('ix_restaurant_score_sales', 'status', 'sales_30d', 'restaurant_id'),
+        db.Index('ix_restaurant_score_reviews', 'status', 'review_count', 'restaurant_id'),
+        db.Index('ix_restaurant_score_recency', 'status', 'created_at', 'restaurant_id'),
+    )
+
 class RestaurantCategory(db.Model):
     """餐厅分类"""
     id = db.Column(db.Integer, primary_key=True)
@@ -125,24 +152,98 @@ class Order(db.Model):
     total_amount = db.Column(db.Float, nullable=False)  # 总金额
     
     # 订单状态
-    status = db.Column(db.String(20), default='pending')  # pending/confirmed/preparing/delivering/completed/cancelled
+    status = db.Column(db.String(20), default='pending')  # 状态及允许的变化见 app/order_status.py
     payment_status = db.Column(db.String(20), default='unpaid')  # unpaid/paid/refunded
     
     # 时间信息
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     confirmed_at = db.Column(db.DateTime)
-    delivered_at = db.Column(db.DateTime)
+    preparing_at = db.Column(db.DateTime)
+    delivering_at = db.Column(db.DateTime)
+    delivered_at = db.Column(db.DateTime)  # 完成（送达）时间
+    cancelled_at = db.Column(db.DateTime)
     
     # 备注
     remark = db.Column(db.Text)
     
     # 订单项
     order_items = db.relationship('OrderItem', backref='order', lazy='dynamic', cascade='all, delete-orphan')
+    
+    # 订单列表按 (created_at, id) 键集分页，各筛选条件使用对应的联合索引
+    __table_args__ = (
+        db.Index('ix_order_created_id', 'created_at', 'id'),
+        db.Index('ix_order_user_created_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_order_restaurant_created_id', 'restaurant_id', 'created_at', 'id'),
+        db.Index('ix_order_status_created_id', 'status', 'created_at', 'id'),
+        # 商家按状态查看订单队列
+        db.Index('ix_order_restaurant_status_created_id', 'restaurant_id', 'status', 'created_at', 'id'),
+    )
+
+class ReplicationHeartbeat(db.Model):
+    """复制心跳：主库定期更新，从副本读出的时间用于估算复制延迟"""
+    __tablename__ = 'replication_heartbeat'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+class DishSalesDelta(db.Model):
+    """菜品销量增量（只追加，由 app/sales_counter.py 定期汇总到 dish.sales_count 后删除）"""
+    __tablename__ = 'dish_sales_delta'
+    id = db.Column(db.Integer, primary_key=True)
+    dish_id = db.Column(db.Integer, nullable=False)  # 不设外键：菜品删除后残留的增量在汇总时丢弃
+    quantity = db.Column(db.Integer, nullable=False)
+    batch = db.Column(db.String(32), index=True)  # 汇总时写入的批次号，未汇总为空
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class MenuInvalidation(db.Model):
+    """菜单失效记录（只追加，各 worker 的 MenuCache 定期读取新记录，使本进程的快照失效）"""
+    __tablename__ = 'menu_invalidation'
+    id = db.Column(db.Integer, primary_key=True)
+    restaurant_id = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SearchIndexChange(db.Model):
+    """搜索索引变更记录（只追加，各 worker 的内存搜索索引定期读取新记录，从数据库重新加载对应文档）
+
+    doc_key 为 d:菜品id / r:餐厅id，'*' 表示全量重建。
+    """
+    __tablename__ = 'search_index_change'
+    id = db.Column(db.Integer, primary_key=True)
+    doc_key = db.Column(db.String(32), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class SalesRollup(db.Model):
+    """销售统计（按小时/天预聚合，由 app/analytics.py 维护）
+
+    dimension 为 restaurant 时 key_id 为 0；为 dish/category 时 key_id 为菜品/分类 id
+    （未分类为 0），restaurant_id 为所属餐厅。bucket 为本地时间的小时/天起点。
+    """
+    __tablename__ = 'sales_rollup'
+    granularity = db.Column(db.String(8), primary_key=True)  # hour/day
+    dimension = db.Column(db.String(16), primary_key=True)  # restaurant/dish/category
+    restaurant_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    key_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)  # 订单数（菜品/分类为包含它的订单数）
+    gmv = db.Column(db.Float, nullable=False, default=0)  # 成交额（餐厅含配送费，菜品/分类为小计）
+    items = db.Column(db.Integer, nullable=False, default=0)  # 件数
+
+    __table_args__ = (
+        # 不限餐厅的时间范围查询
+        db.Index('ix_sales_rollup_bucket', 'granularity', 'dimension', 'bucket'),
+    )
+
+class IdempotencyKey(db.Model):
+    """结算请求的幂等键：重复提交时直接返回首次生成的订单"""
+    __tablename__ = 'idempotency_key'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    key = db.Column(db.String(64), primary_key=True)
+    order_ids = db.Column(db.Text, nullable=False)  # 逗号分隔
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
 
 class OrderItem(db.Model):
     """订单项"""
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
     dish_id = db.Column(db.Integer, db.ForeignKey('dish.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)  # 下单时的价格
@@ -150,6 +251,10 @@ class OrderItem(db.Model):
 
 class Review(db.Model):
     """评价"""
+    __table_args__ = (
+        # 每个订单只能评价一次
+        db.Index('uq_review_order', 'order_id', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     restaurant_id = db.Column(db.Integer, db.ForeignKey('restaurant.id'), nullable=False)
@@ -170,7 +275,3 @@ class AdminApplication(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', backref='admin_applications')
-
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
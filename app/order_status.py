@@ -0,0 +1,176 @@
+"""
+订单状态机
+
+订单状态只能沿 TRANSITIONS 中列出的边变化，每次变化同时写入对应的时间字段
+（confirmed_at、preparing_at、delivering_at、delivered_at、cancelled_at）。
+单个订单用 transition()，商家一次处理多个订单用 batch_transition()：
+按目标状态一条 UPDATE，WHERE 条件中带上允许的来源状态，并发修改时不会越级。
+
+商家的待处理订单队列走 (restaurant_id, status, created_at, id) 联合索引，
+是一次索引范围扫描，与历史订单数量无关。
+"""
+
+from datetime import datetime
+
+from sqlalchemy import func, update
+
+from app import db
+from app.models import Order, OrderItem
+
+PENDING = 'pending'
+CONFIRMED = 'confirmed'
+PREPARING = 'preparing'
+DELIVERING = 'delivering'
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+
+STATUS_LABELS = {
+    PENDING: '待确认',
+    CONFIRMED: '已确认',
+    PREPARING: '准备中',
+    DELIVERING: '配送中',
+    COMPLETED: '已完成',
+    CANCELLED: '已取消',
+}
+
+# 当前状态 -> 允许的下一状态
+TRANSITIONS = {
+    PENDING: (CONFIRMED, CANCELLED),
+    CONFIRMED: (PREPARING, CANCELLED),
+    PREPARING: (DELIVERING, CANCELLED),
+    DELIVERING: (COMPLETED,),
+    COMPLETED: (),
+    CANCELLED: (),
+}
+
+# 进入某状态时写入的时间字段
+TIMESTAMP_COLUMNS = {
+    CONFIRMED: 'confirmed_at',
+    PREPARING: 'preparing_at',
+    DELIVERING: 'delivering_at',
+    COMPLETED: 'delivered_at',
+    CANCELLED: 'cancelled_at',
+}
+
+# 用户可以自行修改/取消的状态（商家尚未开始准备）
+USER_EDITABLE_STATUSES = (PENDING, CONFIRMED)
+
+# 早期版本写入的中文状态
+LEGACY_STATUSES = {
+    '未处理': PENDING,
+    '准备中': PREPARING,
+    '配送中': DELIVERING,
+    '已完成': COMPLETED,
+    '已取消': CANCELLED,
+}
+
+
+class InvalidTransition(ValueError):
+    """状态变化不在 TRANSITIONS 中"""
+
+
+def status_label(status):
+    return STATUS_LABELS.get(status, status)
+
+
+def allowed_transitions(status):
+    return TRANSITIONS.get(status, ())
+
+
+def source_statuses(target):
+    """可以转到 target 的状态"""
+    return tuple(source for source, targets in TRANSITIONS.items() if target in targets)
+
+
+def _transition_values(target, now):
+    values = {'status': target}
+    column = TIMESTAMP_COLUMNS.get(target)
+    if column:
+        values[column] = now
+    return values
+
+
+def release_sales(order_ids, now=None):
+    """取消或删除的订单不再计入餐厅近期销量和销售统计（在同一事务内调用，由调用方提交）"""
+    from app import analytics
+    from app.ranking import restaurant_ranking
+    analytics.release_orders(order_ids)
+    rows = db.session.query(
+        Order.restaurant_id, func.sum(OrderItem.quantity)
+    ).join(
+        OrderItem, OrderItem.order_id == Order.id
+    ).filter(
+        Order.id.in_(order_ids),
+        Order.created_at >= restaurant_ranking.window_start(now)
+    ).group_by(Order.restaurant_id).all()
+    restaurant_ranking.record_sales(dict((rid, -int(quantity)) for rid, quantity in rows if quantity))
+
+
+def transition(order, target, now=None):
+    """修改单个订单的状态（由调用方提交）"""
+    if target not in allowed_transitions(order.status):
+        raise InvalidTransition(f'订单状态不能从{status_label(order.status)}变为{status_label(target)}')
+    now = now or datetime.utcnow()
+    for column, value in _transition_values(target, now).items():
+        setattr(order, column, value)
+    if target == CANCELLED:
+        release_sales([order.id], now)
+
+
+def batch_transition(order_ids, target, restaurant_id=None, now=None):
+    """批量修改订单状态（由调用方提交）
+
+    返回 (已修改的订单 id, [(订单 id, 原因)])；不存在或状态不允许的订单跳过。
+    """
+    if target not in STATUS_LABELS:
+        raise InvalidTransition(f'未知的订单状态: {target}')
+    order_ids = sorted(set(order_ids))
+    if not order_ids:
+        return [], []
+
+    query = db.session.query(Order.id, Order.status).filter(Order.id.in_(order_ids))
+    if restaurant_id:
+        query = query.filter(Order.restaurant_id == restaurant_id)
+    current = dict(query.all())
+
+    sources = source_statuses(target)
+    candidates, skipped = [], []
+    for order_id in order_ids:
+        status = current.get(order_id)
+        if status is None:
+            skipped.append((order_id, '订单不存在'))
+        elif status not in sources:
+            skipped.append((order_id, f'{status_label(status)}的订单不能变为{status_label(target)}'))
+        else:
+            candidates.append(order_id)
+    if not candidates:
+        return [], skipped
+
+    now = now or datetime.utcnow()
+    # 先锁定并再次确认来源状态，避免并发修改后的订单被越级更新
+    moved = [row[0] for row in db.session.query(Order.id).filter(
+        Order.id.in_(candidates), Order.status.in_(sources)
+    ).with_for_update().all()]
+    moved_ids = set(moved)
+    skipped.extend((order_id, '订单状态已变化') for order_id in candidates if order_id not in moved_ids)
+    if moved:
+        db.session.execute(
+            update(Order).where(Order.id.in_(moved), Order.status.in_(sources))
+            .values(**_transition_values(target, now))
+            .execution_options(synchronize_session='fetch')
+        )
+        if target == CANCELLED:
+            release_sales(moved, now)
+    return moved, skipped
+
+
+def migrate_legacy_statuses():
+    """把早期写入的中文状态改为状态码，返回修改的行数"""
+    updated = 0
+    for legacy, status in LEGACY_STATUSES.items():
+        updated += db.session.execute(
+            update(Order).where(Order.status == legacy).values(status=status)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    db.session.commit()
+    return updated
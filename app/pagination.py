@@ -0,0 +1,68 @@
+"""
+键集（游标）分页
+
+按 (created_at, id) 倒序翻页，下一页条件为
+created_at < c OR (created_at = c AND id < i)，可以直接利用
+(…, created_at, id) 联合索引做范围扫描，不需要 OFFSET。
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(created_at, row_id):
+    """将 (created_at, id) 编码为 URL 安全的游标字符串"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时返回 None"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage(object):
+    """一页结果"""
+
+    def __init__(self, items, next_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def keyset_paginate(query, created_col, id_col, cursor=None, per_page=20):
+    """对 query 按 (created_col, id_col) 倒序做键集分页
+
+    多取一行判断是否还有下一页；per_page 小于 1 时按 1 处理。
+    """
+    per_page = max(per_page, 1)
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, row_id = position
+        query = query.filter(or_(
+            created_col < created_at,
+            and_(created_col == created_at, id_col < row_id)
+        ))
+
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(per_page + 1).all()
+
+    next_cursor = None
+    if rows and len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_col.key), getattr(last, id_col.key))
+    return KeysetPage(rows, next_cursor, per_page)
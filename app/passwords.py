@@ -0,0 +1,122 @@
+"""
+密码哈希服务
+
+算法和代价参数由 PASSWORD_HASH_METHOD 配置（werkzeug 的写法，如
+pbkdf2:sha256:600000、scrypt:32768:8:1）。计算放到进程池里执行，
+请求线程等待结果时不占用 GIL；进程池大小和排队数都有上限，
+登录高峰时排不上队的请求直接提示稍后重试，而不是把所有线程都堆在 CPU 上。
+
+登录成功时如果已保存的哈希与当前配置不同，用本次输入的明文重新计算并保存。
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+class PasswordHasherBusy(Exception):
+    """哈希队列已满"""
+
+
+def normalize_method(method):
+    """补全默认参数，得到与哈希值前缀一致的写法"""
+    name, *args = method.split(':')
+    if name == 'pbkdf2':
+        hash_name = args[0] if args else 'sha256'
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{int(iterations)}'
+    if name == 'scrypt':
+        n, r, p = args if args else (2 ** 15, 8, 1)
+        return f'scrypt:{int(n)}:{int(r)}:{int(p)}'
+    return method
+
+
+def hash_password(password, method, salt_length=16):
+    """计算哈希（在工作进程中执行）"""
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def verify_password(stored_hash, password):
+    """校验密码（在工作进程中执行）"""
+    return check_password_hash(stored_hash, password)
+
+
+class PasswordHasher(object):
+    """密码哈希服务（PASSWORD_HASH_EXECUTOR 为 process 或 inline）"""
+
+    def __init__(self):
+        self._executor = None
+        self._executor_pid = None
+        self._slots = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:%d' % DEFAULT_PBKDF2_ITERATIONS)
+        app.config.setdefault('PASSWORD_SALT_LENGTH', 16)
+        app.config.setdefault('PASSWORD_HASH_EXECUTOR', 'process')
+        # 每个 worker 分到的 CPU 核数
+        workers = max(1, int(app.config.get('WEB_WORKERS') or 1))
+        app.config.setdefault('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 1) // workers))
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 4)   # 每个进程允许排队的任务数
+        app.config.setdefault('PASSWORD_HASH_WAIT', 5)    # 排队最长等待（秒）
+
+        app.config['PASSWORD_HASH_METHOD'] = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+
+    def _get_executor(self):
+        # gunicorn fork 之后在各 worker 进程内重新创建进程池
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    workers = current_app.config['PASSWORD_HASH_WORKERS']
+                    self._executor = ProcessPoolExecutor(max_workers=workers)
+                    self._executor_pid = os.getpid()
+                    self._slots = threading.BoundedSemaphore(
+                        workers * (1 + current_app.config['PASSWORD_HASH_QUEUE']))
+        return self._executor
+
+    def _run(self, func, *args):
+        config = current_app.config
+        if config['PASSWORD_HASH_EXECUTOR'] != 'process':
+            return func(*args)
+
+        executor = self._get_executor()
+        if not self._slots.acquire(timeout=config['PASSWORD_HASH_WAIT']):
+            raise PasswordHasherBusy('系统繁忙，请稍后重试')
+        try:
+            return executor.submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        config = current_app.config
+        return self._run(hash_password, password, config['PASSWORD_HASH_METHOD'],
+                         config['PASSWORD_SALT_LENGTH'])
+
+    def verify(self, stored_hash, password):
+        if not stored_hash:
+            return False
+        return self._run(verify_password, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        method = stored_hash.split('$', 1)[0]
+        return method != current_app.config['PASSWORD_HASH_METHOD']
+
+    def verify_and_update(self, user, password):
+        """校验用户密码；成功且参数已变化时更新 user.password（由调用方提交）"""
+        if not self.verify(user.password, password):
+            return False
+        if self.needs_rehash(user.password):
+            user.password = self.hash(password)
+        return True
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,198 @@
+"""
+请求级 SQL 分析
+
+通过 SQLAlchemy 引擎事件记录每个请求执行的 SQL：语句数、数据库耗时、
+最慢的语句，并把同一请求中反复出现的同形语句（N+1）连同视图函数一起标记出来。
+汇总数据按端点保存在进程内，管理员可在 /admin/sql-profile 查看；
+开启 SQL_PROFILER_HEADERS 时在响应头中返回本次请求的统计。
+"""
+
+import re
+import time
+import threading
+from collections import Counter
+
+from flask import g, request, has_request_context, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# 归一化语句：合并 IN 列表、数字和字符串字面量，得到“语句形状”
+_IN_LIST_RE = re.compile(r'IN \((?:[^()]*)\)', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SPACE_RE = re.compile(r'\s+')
+
+# 未匹配任何路由的请求统一记在该名称下
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+
+def statement_shape(statement):
+    shape = _STRING_RE.sub('?', statement)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    shape = _NUMBER_RE.sub('?', shape)
+    return _SPACE_RE.sub(' ', shape).strip()
+
+
+class RequestProfile(object):
+    """单个请求的 SQL 记录"""
+
+    __slots__ = ('queries', 'db_time', 'shapes', 'slowest')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.shapes = Counter()
+        self.slowest = []  # [(耗时秒, 语句)]
+
+    def record(self, statement, elapsed, keep_slowest):
+        self.queries += 1
+        self.db_time += elapsed
+        self.shapes[statement_shape(statement)] += 1
+        self.slowest.append((elapsed, statement))
+        if len(self.slowest) > keep_slowest * 2:
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[keep_slowest:]
+
+    def repeated_shapes(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def top_slowest(self, limit):
+        return sorted(self.slowest, key=lambda item: item[0], reverse=True)[:limit]
+
+
+class EndpointStats(object):
+    """按端点汇总"""
+
+    __slots__ = ('requests', 'queries', 'db_time', 'max_queries', 'n_plus_one', 'examples',
+                 'slowest')
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.db_time = 0.0
+        self.max_queries = 0
+        self.n_plus_one = 0
+        self.examples = {}  # 语句形状 -> 单次请求中的最大重复次数
+        self.slowest = []   # [(耗时秒, 语句)]，所有请求中最慢的若干条
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'avg_queries': round(self.queries / float(self.requests), 2) if self.requests else 0,
+            'max_queries': self.max_queries,
+            'avg_db_ms': round(self.db_time * 1000 / self.requests, 2) if self.requests else 0,
+            'n_plus_one_requests': self.n_plus_one,
+            'n_plus_one_statements': [
+                {'statement': shape, 'max_repeats': count}
+                for shape, count in sorted(self.examples.items(), key=lambda i: i[1], reverse=True)
+            ],
+            'slowest': [
+                {'ms': round(elapsed * 1000, 2), 'statement': statement}
+                for elapsed, statement in self.slowest
+            ],
+        }
+
+
+class SQLProfiler(object):
+    """SQL 分析器"""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._listening = False
+
+    def init_app(self, app):
+        app.config.setdefault('SQL_PROFILER', app.debug)  # 默认只在开发环境开启
+        app.config.setdefault('SQL_PROFILER_HEADERS', False)
+        app.config.setdefault('SQL_PROFILER_N_PLUS_ONE', 5)   # 同形语句重复次数阈值
+        app.config.setdefault('SQL_PROFILER_SLOWEST', 5)      # 保留最慢语句条数
+
+        if not app.config['SQL_PROFILER']:
+            return
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_execute)
+            self._listening = True
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    # ---- 引擎事件 ----
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('sql_profiler_start', []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get('sql_profiler_start')
+        if not stack:
+            return
+        elapsed = time.perf_counter() - stack.pop()
+        if not has_request_context():
+            return
+        profile = g.get('sql_profile')
+        if profile is not None:
+            profile.record(statement, elapsed, current_app.config['SQL_PROFILER_SLOWEST'])
+
+    # ---- 请求钩子 ----
+
+    @staticmethod
+    def _start_request():
+        g.sql_profile = RequestProfile()
+
+    def _finish_request(self, response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+
+        config = current_app.config
+        # 404 扫描等未匹配路由的请求不按路径分别统计，避免统计项无限增长
+        endpoint = request.endpoint or UNMATCHED_ENDPOINT
+        repeated = profile.repeated_shapes(config['SQL_PROFILER_N_PLUS_ONE'])
+
+        with self._lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                stats = self._stats[endpoint] = EndpointStats()
+            stats.requests += 1
+            stats.queries += profile.queries
+            stats.db_time += profile.db_time
+            stats.max_queries = max(stats.max_queries, profile.queries)
+            keep = config['SQL_PROFILER_SLOWEST']
+            stats.slowest = sorted(stats.slowest + profile.top_slowest(keep),
+                                   key=lambda item: item[0], reverse=True)[:keep]
+            if repeated:
+                stats.n_plus_one += 1
+                for shape, count in repeated:
+                    stats.examples[shape] = max(stats.examples.get(shape, 0), count)
+
+        if repeated:
+            view = current_app.view_functions.get(request.endpoint)
+            current_app.logger.warning(
+                f"N+1 suspected in {endpoint} ({getattr(view, '__module__', '?')}."
+                f"{getattr(view, '__name__', '?')}): "
+                + '; '.join(f"{count}x {shape[:120]}" for shape, count in repeated)
+            )
+
+        if config['SQL_PROFILER_HEADERS']:
+            response.headers['X-DB-Query-Count'] = str(profile.queries)
+            response.headers['X-DB-Time-ms'] = '%.2f' % (profile.db_time * 1000)
+            if repeated:
+                response.headers['X-DB-N-Plus-One'] = str(sum(count for _, count in repeated))
+        return response
+
+    # ---- 汇总 ----
+
+    def report(self):
+        with self._lock:
+            endpoints = dict((name, stats.to_dict()) for name, stats in self._stats.items())
+        return {'endpoints': endpoints}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+sql_profiler = SQLProfiler()
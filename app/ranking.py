@@ -0,0 +1,219 @@
+"""
+餐厅排序分
+
+restaurant_score 表为每家餐厅保存排序用的数据：评分、近 30 天销量、评价数、
+创建时间，并冗余一份营业状态，与各排序字段组成联合索引，
+列表页的每种排序都是一次 (status, 排序字段) 索引范围扫描。
+
+维护方式：
+  - 结算时在同一事务内累加销量（record_sales）；
+  - 写入评价时在同一事务内同步评分和评价数（record_ratings）；
+  - 餐厅增改时在同一事务内刷新该餐厅的一行（refresh_restaurant）；
+  - 订单取消或删除时扣减销量（order_status.release_sales）；
+  - 滑出 30 天窗口的销量由全量重建修正：每个 worker 处理第一个请求时启动后台线程，
+    距上次重建超过 RANKING_REFRESH_INTERVAL 秒时重建（其他进程刚重建过则跳过），
+    列表请求不会执行重建。RANKING_REFRESH_INTERVAL 为 0 时不启动线程；
+  - 同一线程每 backfill_interval 秒补齐缺少排序行的餐厅（如在应用外写入的餐厅），
+    否则这些餐厅不会出现在列表中。重建失败时从 retry_delay 秒开始加倍退避重试。
+"""
+
+import logging
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, func
+
+from app import db
+from app.models import Restaurant, RestaurantScore, Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+# 不计入销量的订单状态
+CANCELLED_STATUSES = ('cancelled',)
+
+# 排序方式 -> 排序字段
+SORT_COLUMNS = {
+    'rating': RestaurantScore.rating,
+    'sales': RestaurantScore.sales_30d,
+    'reviews': RestaurantScore.review_count,
+    'newest': RestaurantScore.created_at,
+}
+
+
+def _sales_query(since):
+    return db.session.query(
+        Order.restaurant_id, func.sum(OrderItem.quantity)
+    ).join(
+        OrderItem, OrderItem.order_id == Order.id
+    ).filter(
+        Order.created_at >= since,
+        Order.status.notin_(CANCELLED_STATUSES)
+    ).group_by(Order.restaurant_id)
+
+
+def _score_row(restaurant, sales, now):
+    rid, status, rating, review_count, created_at = restaurant
+    return {
+        'restaurant_id': rid,
+        'status': status or 'open',
+        'rating': rating or 0,
+        'sales_30d': int(sales or 0),
+        'review_count': review_count or 0,
+        'created_at': created_at,
+        'updated_at': now,
+    }
+
+
+class RestaurantRanking(object):
+    """restaurant_score 的维护与查询"""
+
+    backfill_interval = 60  # 检查缺少排序行的餐厅的间隔（秒）
+    retry_delay = 10        # 重建失败后首次重试的等待时间（秒）
+
+    def __init__(self):
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('RANKING_SALES_WINDOW_DAYS', 30)
+        app.config.setdefault('RANKING_REFRESH_INTERVAL', 3600)
+        app.before_request(self._ensure_worker)
+
+    def window_start(self, now=None):
+        """销量统计窗口的起点"""
+        return (now or datetime.utcnow()) - timedelta(days=current_app.config['RANKING_SALES_WINDOW_DAYS'])
+
+    def _restaurant_rows(self, *restaurant_ids):
+        query = db.session.query(Restaurant.id, Restaurant.status, Restaurant.rating,
+                                 Restaurant.review_count, Restaurant.created_at)
+        if restaurant_ids:
+            query = query.filter(Restaurant.id.in_(restaurant_ids))
+        return query.all()
+
+    def rebuild(self):
+        """全量重建（两次聚合查询 + 批量插入）"""
+        now = datetime.utcnow()
+        sales = dict(_sales_query(self.window_start()).all())
+        rows = [_score_row(r, sales.get(r[0]), now) for r in self._restaurant_rows()]
+
+        RestaurantScore.query.delete(synchronize_session=False)
+        if rows:
+            db.session.execute(RestaurantScore.__table__.insert(), rows)
+        db.session.commit()
+        return len(rows)
+
+    def backfill(self):
+        """为缺少 restaurant_score 行的餐厅补上一行，返回补齐的家数"""
+        missing = [rid for (rid,) in db.session.query(Restaurant.id).outerjoin(
+            RestaurantScore, RestaurantScore.restaurant_id == Restaurant.id
+        ).filter(RestaurantScore.restaurant_id.is_(None)).all()]
+        if not missing:
+            return 0
+        now = datetime.utcnow()
+        sales = dict(_sales_query(self.window_start()).filter(Order.restaurant_id.in_(missing)).all())
+        rows = [_score_row(r, sales.get(r[0]), now) for r in self._restaurant_rows(*missing)]
+        db.session.execute(RestaurantScore.__table__.insert(), rows)
+        db.session.commit()
+        logger.warning('已补齐 %d 家餐厅的排序分', len(rows))
+        return len(rows)
+
+    def refresh_if_stale(self, interval):
+        """距上次全量重建超过 interval 秒时重建，返回到下次需要检查的秒数"""
+        self.backfill()
+        refreshed_at = db.session.query(func.min(RestaurantScore.updated_at)).scalar()
+        if refreshed_at is not None:
+            age = (datetime.utcnow() - refreshed_at).total_seconds()
+            if age < interval:
+                # 本进程或其他进程刚重建过
+                db.session.rollback()
+                return interval - age
+        self.rebuild()
+        return interval
+
+    def _ensure_worker(self):
+        """每个进程启动一个定期重建线程（gunicorn fork 之后在各 worker 中分别启动）"""
+        interval = current_app.config['RANKING_REFRESH_INTERVAL']
+        if not interval or self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            app = current_app._get_current_object()
+            thread = threading.Thread(target=self._run, args=(app, interval),
+                                      name='ranking-refresh', daemon=True)
+            thread.start()
+            self._started_pid = os.getpid()
+
+    def _run(self, app, interval):
+        retry = self.retry_delay
+        while True:
+            with app.app_context():
+                try:
+                    wait = self.refresh_if_stale(interval)
+                    retry = self.retry_delay
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('餐厅排序分重建失败，%d 秒后重试', retry)
+                    wait = retry
+                    retry = min(retry * 2, interval)
+                finally:
+                    db.session.remove()
+            time.sleep(max(min(wait, self.backfill_interval), 1))
+
+    def refresh_restaurant(self, restaurant_id):
+        """重新计算一家餐厅（在餐厅增改的事务内、餐厅已 flush 后调用，由调用方提交）"""
+        rows = self._restaurant_rows(restaurant_id)
+        if not rows:
+            self.remove_restaurant(restaurant_id)
+            return
+        sales = dict(_sales_query(self.window_start()).filter(Order.restaurant_id == restaurant_id).all())
+        row = _score_row(rows[0], sales.get(restaurant_id), datetime.utcnow())
+        db.session.merge(RestaurantScore(**row))
+
+    def remove_restaurant(self, restaurant_id):
+        """删除餐厅前调用（与删除在同一事务中提交）"""
+        RestaurantScore.query.filter_by(restaurant_id=restaurant_id).delete(synchronize_session=False)
+
+    def record_sales(self, quantities):
+        """累加销量 {restaurant_id: 件数}（在结算事务内调用，由调用方提交）"""
+        if not quantities:
+            return
+        table = RestaurantScore.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.restaurant_id == bindparam('b_restaurant_id'))
+            .values(sales_30d=table.c.sales_30d + bindparam('b_quantity')),
+            [{'b_restaurant_id': rid, 'b_quantity': quantity}
+             for rid, quantity in sorted(quantities.items())]
+        )
+
+    def record_ratings(self, ratings):
+        """同步评分和评价数 {restaurant_id: (评分, 评价数)}（在写入评价的事务内调用，由调用方提交）"""
+        if not ratings:
+            return
+        table = RestaurantScore.__table__
+        db.session.execute(
+            table.update()
+            .where(table.c.restaurant_id == bindparam('b_restaurant_id'))
+            .values(rating=bindparam('b_rating'), review_count=bindparam('b_review_count')),
+            [{'b_restaurant_id': rid, 'b_rating': rating, 'b_review_count': count}
+             for rid, (rating, count) in sorted(ratings.items())]
+        )
+
+    def ordered(self, query, sort_by, status='open'):
+        """为餐厅查询加上排序（通过 restaurant_score 的 (status, 字段) 索引）
+
+        内连接排序表：排序行随餐厅在同一事务中写入，缺少的由后台线程补齐。
+        """
+        column = SORT_COLUMNS.get(sort_by, RestaurantScore.created_at)
+        return query.join(
+            RestaurantScore, RestaurantScore.restaurant_id == Restaurant.id
+        ).filter(
+            RestaurantScore.status == status
+        ).order_by(column.desc(), RestaurantScore.restaurant_id.desc())
+
+
+restaurant_ranking = RestaurantRanking()
@@ -0,0 +1,144 @@
+"""
+餐厅评价与评分汇总
+
+已完成的订单可以评价一次（1-5 星）。Restaurant 上保存评价的累计星数 rating_sum
+和评价数 review_count，写入评价时在同一事务中累加，并重新计算贝叶斯平滑后的评分：
+
+    rating = (C × m + rating_sum) / (C + review_count)
+
+m 为先验评分（REVIEW_PRIOR_RATING），C 为先验权重（REVIEW_PRIOR_WEIGHT，相当于 C 条
+m 星的虚拟评价），评价很少的新餐厅不会因为一两条五星评价排到最前面。
+页面直接读取这三个字段，不需要对 review 表做聚合。
+
+recompute_ratings() 用一次分组聚合从 review 表重建餐厅的汇总，用于修正数据或修改先验参数后；
+没有 review 记录的餐厅（导入或迁移时折算的历史评分）保留原有汇总，只按当前先验重算评分。
+"""
+
+from flask import current_app
+from sqlalchemy import bindparam, func, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Restaurant, Review, Order
+from app.order_status import COMPLETED
+from app.ranking import restaurant_ranking
+
+MAX_CONTENT_LENGTH = 500
+
+
+class ReviewError(ValueError):
+    """评价无效（消息可直接展示给用户）"""
+
+
+def _prior():
+    config = current_app.config
+    return config.get('REVIEW_PRIOR_RATING', 4.0), config.get('REVIEW_PRIOR_WEIGHT', 10)
+
+
+def bayesian_rating(rating_sum, review_count):
+    """贝叶斯平滑评分（保留两位小数）"""
+    mean, weight = _prior()
+    return round((weight * mean + (rating_sum or 0)) / float(weight + (review_count or 0)), 2)
+
+
+def _parse_rating(value):
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        raise ReviewError('请选择评分')
+    if not 1 <= rating <= 5:
+        raise ReviewError('评分必须在 1 到 5 星之间')
+    return rating
+
+
+def submit_review(user_id, order_id, rating, content=''):
+    """评价已完成的订单，返回 Review
+
+    评价、餐厅汇总和排序表在同一事务中提交；同一订单重复评价时抛出 ReviewError。
+    """
+    rating = _parse_rating(rating)
+    content = (content or '').strip()
+    if len(content) > MAX_CONTENT_LENGTH:
+        raise ReviewError(f'评价内容不能超过 {MAX_CONTENT_LENGTH} 字')
+
+    order = db.session.query(Order.id, Order.user_id, Order.restaurant_id, Order.status)\
+        .filter(Order.id == order_id).first()
+    if order is None or order.user_id != user_id:
+        raise ReviewError('订单不存在')
+    if order.status != COMPLETED:
+        raise ReviewError('订单完成后才能评价')
+    if db.session.query(Review.id).filter(Review.order_id == order_id).first() is not None:
+        raise ReviewError('该订单已评价')
+
+    review = Review(user_id=user_id, restaurant_id=order.restaurant_id, order_id=order_id,
+                    rating=rating, content=content)
+    db.session.add(review)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # 并发提交时由 review.order_id 的唯一索引拦截
+        db.session.rollback()
+        raise ReviewError('该订单已评价')
+
+    _apply_review(order.restaurant_id, rating)
+    db.session.commit()
+    return review
+
+
+def _apply_review(restaurant_id, rating):
+    """在当前事务中累加一条评价（一条 UPDATE，并发写入不会丢失计数）"""
+    mean, weight = _prior()
+    rating_sum = func.coalesce(Restaurant.rating_sum, 0)
+    review_count = func.coalesce(Restaurant.review_count, 0)
+    # rating 放在最前面：MySQL 按顺序赋值，后面的表达式会读到已修改的列
+    db.session.execute(
+        update(Restaurant).where(Restaurant.id == restaurant_id).ordered_values(
+            (Restaurant.rating,
+             func.round((weight * mean + rating_sum + rating) * 1.0 / (weight + review_count + 1), 2)),
+            (Restaurant.rating_sum, rating_sum + rating),
+            (Restaurant.review_count, review_count + 1),
+        ).execution_options(synchronize_session=False)
+    )
+    row = db.session.query(Restaurant.rating, Restaurant.review_count)\
+        .filter(Restaurant.id == restaurant_id).one()
+    restaurant_ranking.record_ratings({restaurant_id: (row.rating, row.review_count)})
+
+
+def recompute_ratings():
+    """重建全部餐厅的评分汇总（一次分组聚合 + 批量更新），返回餐厅数
+
+    有评价的餐厅以 review 表为准；没有评价的餐厅保留 rating_sum/review_count。
+    """
+    totals = dict(
+        (rid, (int(rating_sum or 0), count))
+        for rid, rating_sum, count in db.session.query(
+            Review.restaurant_id, func.sum(Review.rating), func.count(Review.id)
+        ).group_by(Review.restaurant_id)
+    )
+    rows = []
+    for rid, seeded_sum, seeded_count in db.session.query(
+            Restaurant.id, Restaurant.rating_sum, Restaurant.review_count):
+        rating_sum, count = totals.get(rid, (seeded_sum or 0, seeded_count or 0))
+        rows.append({
+            'b_restaurant_id': rid,
+            'b_rating_sum': rating_sum,
+            'b_review_count': count,
+            'b_rating': bayesian_rating(rating_sum, count),
+        })
+    if not rows:
+        return 0
+
+    table = Restaurant.__table__
+    db.session.execute(
+        table.update().where(table.c.id == bindparam('b_restaurant_id')).values(
+            rating_sum=bindparam('b_rating_sum'),
+            review_count=bindparam('b_review_count'),
+            rating=bindparam('b_rating'),
+        ),
+        rows
+    )
+    restaurant_ranking.record_ratings(dict(
+        (row['b_restaurant_id'], (row['b_rating'], row['b_review_count'])) for row in rows
+    ))
+    db.session.commit()
+    return len(rows)
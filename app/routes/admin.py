@@ -0,0 +1,121 @@
+import io
+from datetime import timedelta
+
+from flask import Blueprint, jsonify, request, render_template, redirect, url_for, flash
+from flask_login import login_required, current_user
+from app import db, analytics
+from app.models import Restaurant
+from app.profiler import sql_profiler
+from app.db_pool import pool_metrics
+from app.db_routing import replica_router, read_replica
+from app.catalog_import import import_catalog
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+@admin_bp.route('/sql-profile')
+@login_required
+def sql_profile():
+    """各端点的 SQL 统计与 N+1 检测结果（管理员功能）"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    
+    if request.args.get('reset'):
+        sql_profiler.reset()
+    
+    return jsonify({'success': True, **sql_profiler.report()})
+
+@admin_bp.route('/db-pool')
+@login_required
+def db_pool():
+    """连接池占用、取连接等待和饱和度（管理员功能）"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    
+    pool = db.engine.pool
+    if request.args.get('reset') and hasattr(pool, 'reset_stats'):
+        pool.reset_stats()
+    
+    # 只读副本：各自的连接池和复制延迟（秒，None 表示不可用）
+    replicas = replica_router.status()
+    for key in replicas:
+        replicas[key]['pool'] = pool_metrics(db.engines[key])
+    
+    return jsonify({'success': True, 'pool': pool_metrics(db.engine), 'replicas': replicas})
+
+@admin_bp.route('/import/<kind>', methods=['POST'])
+@login_required
+def import_data(kind):
+    """批量导入餐厅或菜品（管理员功能）
+
+    multipart 上传 file，format=csv/jsonl（默认按扩展名），dry_run=1 时只校验不写入。
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    
+    if kind not in ('restaurants', 'dishes'):
+        return jsonify({'success': False, 'message': '不支持的导入类型'}), 404
+    
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'message': '请上传文件'}), 400
+    
+    fmt = request.form.get('format') or ('jsonl' if upload.filename.endswith(('.jsonl', '.json')) else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'success': False, 'message': '不支持的文件格式'}), 400
+    
+    text_stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+    result = import_catalog(kind, text_stream, fmt,
+                            batch_size=request.form.get('batch_size', 500, type=int),
+                            dry_run=request.form.get('dry_run') == '1')
+    return jsonify({'success': True, **result.to_dict()})
+
+ANALYTICS_RANGES = (1, 7, 30, 90, 365)
+
+def _analytics_data():
+    """按请求参数 days、restaurant_id 从 sales_rollup 读取统计"""
+    days = request.args.get('days', 30, type=int)
+    if days not in ANALYTICS_RANGES:
+        days = 30
+    restaurant_id = request.args.get('restaurant_id', type=int)
+    start, end = analytics.recent_range(days)
+    return {
+        'days': days,
+        'restaurant_id': restaurant_id,
+        'start': start,
+        'end': end,
+        'granularity': analytics.granularity_for(start, end),
+        'summary': analytics.summary(start, end, restaurant_id),
+        'series': analytics.timeseries(start, end, restaurant_id),
+        'top_restaurants': [] if restaurant_id else analytics.top(analytics.RESTAURANT, start, end),
+        'top_dishes': analytics.top(analytics.DISH, start, end, restaurant_id),
+        'top_categories': analytics.top(analytics.CATEGORY, start, end, restaurant_id),
+    }
+
+@admin_bp.route('/analytics')
+@login_required
+@read_replica
+def analytics_dashboard():
+    """销售统计（管理员功能，只查询预聚合的 sales_rollup 表）"""
+    if current_user.role != 'admin':
+        flash('权限不足')
+        return redirect(url_for('restaurant.list_restaurants'))
+    
+    data = _analytics_data()
+    restaurants = db.session.query(Restaurant.id, Restaurant.name).order_by(Restaurant.id).all()
+    return render_template('admin/analytics.html', data=data, last_day=data['end'] - timedelta(days=1),
+                           restaurants=restaurants, ranges=ANALYTICS_RANGES)
+
+@admin_bp.route('/analytics/data')
+@login_required
+@read_replica
+def analytics_data():
+    """销售统计 JSON（管理员功能）"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    
+    data = _analytics_data()
+    for key in ('start', 'end'):
+        data[key] = data[key].isoformat()
+    for point in data['series']:
+        point['bucket'] = point['bucket'].isoformat()
+    return jsonify({'success': True, **data})
@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, redirect, url_for, request, flash
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User, AdminApplication, Address
 from app import db
+from app.user_cache import user_cache
+from app.passwords import password_hasher, PasswordHasherBusy
+from app.geo import fill_coordinates
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -16,7 +18,11 @@ def register():
             flash('用户名已存在')
             return redirect(url_for('auth.register'))
 
-        hashed_pw = generate_password_hash(password)
+        try:
+            hashed_pw = password_hasher.hash(password)
+        except PasswordHasherBusy as e:
+            flash(str(e))
+            return redirect(url_for('auth.register'))
         new_user = User(username=username, password=hashed_pw)
         db.session.add(new_user)
         db.session.commit()
@@ -32,8 +38,18 @@ def login():
         password = request.form['password']
         user = User.query.filter_by(username=username).first()
 
-        if user and check_password_hash(user.password, password):
+        try:
+            # 校验成功时如哈希参数已变化，同时更新 user.password
+            verified = user is not None and password_hasher.verify_and_update(user, password)
+        except PasswordHasherBusy as e:
+            flash(str(e))
+            return redirect(url_for('auth.login'))
+
+        if verified:
+            if db.session.is_modified(user):
+                db.session.commit()
             login_user(user)
+            user_cache.remember(user)
             flash('登录成功')
             # 获取登录前想要访问的页面
             next_page = request.args.get('next')
@@ -69,23 +85,30 @@ def profile():
             flash('用户名已被占用')
             return redirect(url_for('auth.profile'))
         
-        current_user.username = username
-        current_user.email = email
-        current_user.phone = phone
+        user = current_user.user
+        user.username = username
+        user.email = email
+        user.phone = phone
         
         if new_password:
-            if not old_password or not check_password_hash(current_user.password, old_password):
-                flash('原密码错误')
+            try:
+                if not old_password or not password_hasher.verify(user.password, old_password):
+                    flash('原密码错误')
+                    return redirect(url_for('auth.profile'))
+                user.password = password_hasher.hash(new_password)
+            except PasswordHasherBusy as e:
+                db.session.rollback()
+                flash(str(e))
                 return redirect(url_for('auth.profile'))
-            current_user.password = generate_password_hash(new_password)
         
         db.session.commit()
+        user_cache.invalidate(user.id)
         flash('资料更新成功')
         return redirect(url_for('auth.profile'))
     
     # 获取用户地址
     addresses = Address.query.filter_by(user_id=current_user.id).all()
-    return render_template('auth/profile.html', user=current_user, addresses=addresses)
+    return render_template('auth/profile.html', user=current_user.user, addresses=addresses)
 
 @auth_bp.route('/admin/users')
 @login_required
@@ -111,6 +134,7 @@ def delete_user(user_id):
     
     db.session.delete(user)
     db.session.commit()
+    user_cache.invalidate(user_id)
     flash('用户已删除')
     return redirect(url_for('auth.admin_users'))
 
@@ -128,6 +152,7 @@ def toggle_user_role(user_id):
     
     user.role = 'admin' if user.role == 'user' else 'user'
     db.session.commit()
+    user_cache.invalidate(user.id)
     flash(f'用户 {user.username} 的角色已更新为 {user.role}')
     return redirect(url_for('auth.admin_users'))
 
@@ -168,6 +193,7 @@ def approve_application(app_id):
     application.status = 'approved'
     application.user.role = 'admin'
     db.session.commit()
+    user_cache.invalidate(application.user_id)
     flash('申请已通过')
     return redirect(url_for('auth.admin_applications'))
 
@@ -208,6 +234,7 @@ def add_address():
         address=address,
         is_default=is_default
     )
+    fill_coordinates(new_address)
     
     db.session.add(new_address)
     db.session.commit()
@@ -227,7 +254,9 @@ def edit_address(address_id):
     
     address.name = request.form.get('name')
     address.phone = request.form.get('phone')
-    address.address = request.form.get('address')
+    if request.form.get('address') != address.address:
+        address.address = request.form.get('address')
+        fill_coordinates(address, force=True)
     is_default = request.form.get('is_default') == 'on'
     
     # 如果设为默认地址，先将其他地址设为非默认
@@ -1,9 +1,13 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import uuid
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_required, current_user
 from app.models import CartItem, Dish, Restaurant, Order, OrderItem, Address
+from app.checkout import checkout_cart, CheckoutError
+from app.cart_summary import cart_summary
+from app.events import publish_order_status
+from app.order_status import PENDING
 from app import db
-import uuid
-from datetime import datetime
 
 cart_bp = Blueprint('cart', __name__, url_prefix='/cart')
 
@@ -41,9 +45,10 @@ def add_to_cart():
         db.session.add(cart_item)
     
     db.session.commit()
+    cart_summary.set_item(current_user.id, dish, cart_item.quantity)
     
     # 获取购物车总数量
-    cart_count = CartItem.query.filter_by(user_id=current_user.id).count()
+    cart_count = cart_summary.get(current_user.id).distinct_items
     
     return jsonify({
         'success': True,
@@ -105,7 +110,8 @@ def view_cart():
                          total_amount=total_amount,
                          final_total=final_total,
                          addresses=addresses,
-                         default_address=default_address)
+                         default_address=default_address,
+                         checkout_key=uuid.uuid4().hex)
 
 @cart_bp.route('/update', methods=['POST'])
 @login_required
@@ -127,6 +133,7 @@ def update_cart():
     
     cart_item.quantity = quantity
     db.session.commit()
+    cart_summary.set_item(current_user.id, cart_item.dish, quantity)
     
     # 计算新的小计
     subtotal = cart_item.dish.price * quantity
@@ -150,8 +157,10 @@ def remove_from_cart():
     if not cart_item:
         return jsonify({'success': False, 'message': '购物车项不存在'})
     
+    dish_id = cart_item.dish_id
     db.session.delete(cart_item)
     db.session.commit()
+    cart_summary.remove_item(current_user.id, dish_id)
     
     return jsonify({'success': True, 'message': '已从购物车移除'})
 
@@ -161,6 +170,7 @@ def clear_cart():
     """清空购物车"""
     CartItem.query.filter_by(user_id=current_user.id).delete()
     db.session.commit()
+    cart_summary.clear(current_user.id)
     
     flash('购物车已清空')
     return redirect(url_for('cart.view_cart'))
@@ -173,6 +183,11 @@ def checkout():
         # 获取表单数据
         address_id = request.form.get('address_id')
         remark = request.form.get('remark', '')
+        idempotency_key = (request.headers.get('Idempotency-Key') or request.form.get('idempotency_key', '')).strip()
+        
+        if len(idempotency_key) > 64:
+            flash('请求标识无效')
+            return redirect(url_for('cart.view_cart'))
         
         if not address_id:
             flash('请选择收货地址')
@@ -187,64 +202,27 @@ def checkout():
             flash('收货地址不存在')
             return redirect(url_for('cart.checkout'))
         
-        # 获取购物车商品
-        cart_items = db.session.query(CartItem, Dish, Restaurant).join(
-            Dish, CartItem.dish_id == Dish.id
-        ).join(
-            Restaurant, Dish.restaurant_id == Restaurant.id
-        ).filter(
-            CartItem.user_id == current_user.id
-        ).all()
-        
-        if not cart_items:
-            flash('购物车为空')
+        # 分组、批量写入订单并累加销量（单个事务）
+        try:
+            result = checkout_cart(current_user.id, address, remark, idempotency_key or None)
+        except CheckoutError as e:
+            flash(str(e))
             return redirect(url_for('cart.view_cart'))
+        finally:
+            # 结算只删除已占用的购物车行，汇总直接失效后重新加载
+            cart_summary.invalidate(current_user.id)
         
-        # 按餐厅分组创建订单
-        for restaurant_id in set(item[2].id for item in cart_items):
-            restaurant_items = [item for item in cart_items if item[2].id == restaurant_id]
-            restaurant = restaurant_items[0][2]
-            
-            # 计算订单金额
-            subtotal = sum(item[1].price * item[0].quantity for item in restaurant_items)
-            delivery_fee = restaurant.delivery_fee
-            total_amount = subtotal + delivery_fee
-            
-            # 创建订单
-            order = Order(
-                order_no=generate_order_no(),
-                user_id=current_user.id,
-                restaurant_id=restaurant_id,
-                delivery_name=address.name,
-                delivery_phone=address.phone,
-                delivery_address=address.address,
-                subtotal=subtotal,
-                delivery_fee=delivery_fee,
-                total_amount=total_amount,
-                remark=remark
-            )
-            
-            db.session.add(order)
-            db.session.flush()  # 获取订单ID
-            
-            # 创建订单项
-            for cart_item, dish, _ in restaurant_items:
-                order_item = OrderItem(
-                    order_id=order.id,
-                    dish_id=dish.id,
-                    quantity=cart_item.quantity,
-                    price=dish.price,
-                    subtotal=dish.price * cart_item.quantity
-                )
-                db.session.add(order_item)
-                
-                # 更新菜品销量
-                dish.sales_count += cart_item.quantity
+        if result.replayed:
+            flash('订单已提交，请勿重复提交')
+            return redirect(url_for('order.list_orders'))
         
-        # 清空购物车
-        CartItem.query.filter_by(user_id=current_user.id).delete()
+        current_app.logger.info(
+            f"checkout user={current_user.id} orders={len(result.order_ids)} "
+            f"items={result.item_count} total={result.total_ms}ms timings={result.timings}"
+        )
         
-        db.session.commit()
+        for order_id, order_no, restaurant_id in zip(result.order_ids, result.order_nos, result.restaurant_ids):
+            publish_order_status(order_id, order_no, current_user.id, restaurant_id, PENDING)
         
         flash('订单提交成功')
         return redirect(url_for('order.list_orders'))
@@ -256,11 +234,5 @@ def checkout():
 @login_required
 def cart_count():
     """获取购物车商品数量"""
-    count = CartItem.query.filter_by(user_id=current_user.id).count()
+    count = cart_summary.get(current_user.id).distinct_items
     return jsonify({'success': True, 'count': count})
-
-def generate_order_no():
-    """生成订单号"""
-    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-    random_str = str(uuid.uuid4()).replace('-', '')[:6]
-    return f"ORD{timestamp}{random_str}".upper() 
\ No newline at end of file
@@ -2,6 +2,11 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from app.models import Dish, Restaurant, Category
 from app.utils import save_uploaded_image, delete_image_file, create_image_directories
+from app.menu_cache import menu_cache
+from app.cart_summary import cart_summary
+from app.search import search_index
+from app.db_routing import read_replica
+from app.bulk import BulkError, criteria_from_json, bulk_set_dish_available, bulk_delete_dishes
 from app import db
 
 dish_bp = Blueprint('dish', __name__, url_prefix='/dish')
@@ -75,7 +80,10 @@ def add_dish():
         )
         
         db.session.add(new_dish)
+        menu_cache.publish(new_dish.restaurant_id)
         db.session.commit()
+        menu_cache.invalidate(new_dish.restaurant_id)
+        search_index.index_dish(new_dish)
         flash('菜品添加成功')
         return redirect(url_for('dish.admin_dishes'))
 
@@ -100,6 +108,9 @@ def edit_dish(dish_id):
         # 确保图片目录存在
         create_image_directories()
         
+        # 记录原餐厅，菜品可能被移到其他餐厅
+        old_restaurant_id = dish.restaurant_id
+        
         # 基本信息
         dish.name = request.form['name']
         dish.price = float(request.form['price'])
@@ -117,13 +128,10 @@ def edit_dish(dish_id):
         dish.sales_count = int(request.form.get('sales_count', 0))
         
         # 处理菜品图片上传
+        old_image = dish.image
         image_file = request.files.get('image_file')
         if image_file and image_file.filename:
-            # 删除旧的图片文件
-            if dish.image and not dish.image.startswith('http'):
-                delete_image_file(dish.image)
-            
-            # 保存新的图片
+            # 保存新的图片（旧图片在提交后删除）
             new_image_path = save_uploaded_image(image_file, 'dishes', max_size=(600, 400))
             if new_image_path:
                 dish.image = new_image_path
@@ -138,7 +146,12 @@ def edit_dish(dish_id):
         dish.is_recommended = request.form.get('is_recommended') == 'on'
         dish.is_spicy = request.form.get('is_spicy') == 'on'
 
+        menu_cache.publish(old_restaurant_id, dish.restaurant_id)
         db.session.commit()
+        if old_image and old_image != dish.image and not old_image.startswith('http'):
+            delete_image_file(old_image)
+        menu_cache.invalidate(old_restaurant_id, dish.restaurant_id)
+        search_index.index_dish(dish)
         flash('菜品修改成功')
         return redirect(url_for('dish.admin_dishes'))
 
@@ -173,8 +186,15 @@ def delete_dish(dish_id):
         return redirect(url_for('dish.admin_dishes'))
     
     try:
+        restaurant_id = dish.restaurant_id
+        image = dish.image
         db.session.delete(dish)
+        menu_cache.publish(restaurant_id)
         db.session.commit()
+        if image and not image.startswith('http'):
+            delete_image_file(image)
+        menu_cache.invalidate(restaurant_id)
+        search_index.remove_dish(dish_id)
         flash('菜品已删除', 'success')
     except Exception as e:
         db.session.rollback()
@@ -184,6 +204,7 @@ def delete_dish(dish_id):
 
 @dish_bp.route('/admin')
 @login_required
+@read_replica
 def admin_dishes():
     """菜品管理列表（管理员功能）"""
     if current_user.role != 'admin':
@@ -233,7 +254,10 @@ def toggle_available(dish_id):
     
     if new_status is not None:
         dish.available = new_status
+        menu_cache.publish(dish.restaurant_id)
         db.session.commit()
+        menu_cache.invalidate(dish.restaurant_id)
+        search_index.index_dish(dish)
         return jsonify({'success': True, 'message': '状态更新成功'})
     
     return jsonify({'success': False, 'message': '无效的状态'})
@@ -249,19 +273,63 @@ def force_delete_dish(dish_id):
     dish = Dish.query.get_or_404(dish_id)
     
     try:
-        # 先删除相关的购物车项
+        # 先删除相关的购物车项，记录受影响的用户以便提交后刷新购物车汇总
         from app.models import CartItem
+        cart_user_ids = [user_id for (user_id,) in db.session.query(CartItem.user_id)
+                         .filter_by(dish_id=dish_id).distinct()]
         CartItem.query.filter_by(dish_id=dish_id).delete()
         
         # 注意：不删除订单项，因为这会影响历史订单数据
         # 如果真的需要删除，可以先检查订单状态，只删除未完成的订单中的项目
         
         # 删除菜品
+        restaurant_id = dish.restaurant_id
+        image = dish.image
         db.session.delete(dish)
+        menu_cache.publish(restaurant_id)
         db.session.commit()
+        if image and not image.startswith('http'):
+            delete_image_file(image)
+        for user_id in cart_user_ids:
+            cart_summary.invalidate(user_id)
+        menu_cache.invalidate(restaurant_id)
+        search_index.remove_dish(dish_id)
         flash('菜品及相关购物车数据已强制删除', 'success')
     except Exception as e:
         db.session.rollback()
         flash('强制删除失败，请联系系统管理员', 'danger')
         
     return redirect(url_for('dish.admin_dishes'))
+
+@dish_bp.route('/bulk/available', methods=['POST'])
+@login_required
+def bulk_toggle_available():
+    """批量上下架（管理员功能）
+
+    JSON：{"ids": [...]} 或 {"filter": {"ingredient": "花生"}}，以及 "available": true/false。
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data.get('available'), bool):
+        return jsonify({'success': False, 'message': '无效的状态'}), 400
+    try:
+        result = bulk_set_dish_available(criteria_from_json(data), data['available'])
+    except BulkError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **result})
+
+@dish_bp.route('/bulk/delete', methods=['POST'])
+@login_required
+def bulk_delete():
+    """批量删除菜品（管理员功能），"force": true 时同时清理购物车项，有订单记录的菜品改为下架"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        result = bulk_delete_dishes(criteria_from_json(data), force=data.get('force') is True)
+    except BulkError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **result})
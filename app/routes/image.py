@@ -0,0 +1,18 @@
+from flask import Blueprint, jsonify
+from flask_login import login_required, current_user
+from app.image_queue import image_queue
+
+image_bp = Blueprint('image', __name__, url_prefix='/image')
+
+@image_bp.route('/status/<job_id>')
+@login_required
+def image_status(job_id):
+    """查询图片处理任务状态（管理员功能）"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'})
+    
+    job = image_queue.status(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    
+    return jsonify({'success': True, 'job': job.to_dict()})
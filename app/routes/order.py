@@ -1,10 +1,25 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+import time
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, stream_with_context, current_app, jsonify
 from flask_login import login_required, current_user
-from app.models import Order, Dish
+from sqlalchemy.orm import joinedload
+from app.models import Order, OrderItem, Dish, Restaurant, Review
+from app.pagination import keyset_paginate
+from app.export import order_export_statement, csv_stream, jsonl_stream
+from app.events import (event_bus, user_channel, restaurant_channel, ORDERS_CHANNEL, sse_message,
+                        publish_order_status, publish_orders)
+from app.order_status import (STATUS_LABELS, USER_EDITABLE_STATUSES, PENDING, CANCELLED, InvalidTransition,
+                              status_label, allowed_transitions, transition, batch_transition, release_sales)
+from app.reviews import ReviewError, submit_review
 from app import db
+from datetime import datetime, timedelta
 
 order_bp = Blueprint('order', __name__, url_prefix='/order')
 
+order_bp.add_app_template_filter(status_label, 'status_label')
+order_bp.add_app_template_global(allowed_transitions, 'allowed_transitions')
+order_bp.add_app_template_global(USER_EDITABLE_STATUSES, 'USER_EDITABLE_STATUSES')
+
 @order_bp.route('/create/<int:dish_id>', methods=['GET', 'POST'])
 @login_required
 def create_order(dish_id):
@@ -20,15 +35,106 @@ def create_order(dish_id):
 
     return render_template('order/create.html', dish=dish)
 
+def _parse_date(value):
+    """解析 YYYY-MM-DD，格式错误返回 None"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+def load_order_items(orders):
+    """一次查询批量加载订单项及菜品，返回 {order_id: [OrderItem]}"""
+    items_by_order = dict((order.id, []) for order in orders)
+    if not items_by_order:
+        return items_by_order
+    
+    items = OrderItem.query.options(joinedload(OrderItem.dish))\
+                           .filter(OrderItem.order_id.in_(list(items_by_order)))\
+                           .order_by(OrderItem.id).all()
+    for item in items:
+        items_by_order[item.order_id].append(item)
+    return items_by_order
+
 @order_bp.route('/')
 @login_required
 def list_orders():
+    """订单列表（按下单时间倒序的游标分页）"""
+    status = request.args.get('status', '')
+    restaurant_id = request.args.get('restaurant_id', type=int)
+    date_from = _parse_date(request.args.get('date_from'))
+    date_to = _parse_date(request.args.get('date_to'))
+    cursor = request.args.get('cursor')
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    
+    query = Order.query.options(joinedload(Order.restaurant))
+    if current_user.role != 'admin':
+        query = query.filter(Order.user_id == current_user.id)
+    if status:
+        query = query.filter(Order.status == status)
+    if restaurant_id:
+        query = query.filter(Order.restaurant_id == restaurant_id)
+    if date_from:
+        query = query.filter(Order.created_at >= date_from)
+    if date_to:
+        query = query.filter(Order.created_at < date_to + timedelta(days=1))
+    
+    page = keyset_paginate(query, Order.created_at, Order.id, cursor=cursor, per_page=per_page)
+    orders = page.items
+    
+    # 订单项和菜品批量加载，避免模板中逐行懒加载
+    items_by_order = load_order_items(orders)
+    
+    restaurants = []
     if current_user.role == 'admin':
-        orders = Order.query.all()
-    else:
-        orders = Order.query.filter_by(user_id=current_user.id).all()
+        restaurants = db.session.query(Restaurant.id, Restaurant.name).order_by(Restaurant.id).all()
+    
+    filters = {
+        'status': status,
+        'restaurant_id': restaurant_id or '',
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+    
+    return render_template('order/list.html',
+                         orders=orders,
+                         items_by_order=items_by_order,
+                         page=page,
+                         filters=filters,
+                         query_args=dict((k, v) for k, v in filters.items() if v),
+                         restaurants=restaurants,
+                         status_labels=STATUS_LABELS)
 
-    return render_template('order/list.html', orders=orders)
+@order_bp.route('/export')
+@login_required
+def export_orders():
+    """流式导出订单及订单项（管理员功能），format=csv/jsonl，筛选条件同订单列表"""
+    if current_user.role != 'admin':
+        flash('权限不足')
+        return redirect(url_for('order.list_orders'))
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'jsonl'):
+        flash('不支持的导出格式')
+        return redirect(url_for('order.list_orders'))
+    
+    date_to = _parse_date(request.args.get('date_to'))
+    stmt = order_export_statement(
+        status=request.args.get('status', ''),
+        restaurant_id=request.args.get('restaurant_id', type=int),
+        date_from=_parse_date(request.args.get('date_from')),
+        date_to=date_to + timedelta(days=1) if date_to else None
+    )
+    
+    if export_format == 'csv':
+        body, mimetype = csv_stream(stmt), 'text/csv; charset=utf-8'
+    else:
+        body, mimetype = jsonl_stream(stmt), 'application/x-ndjson; charset=utf-8'
+    
+    filename = f"orders-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    return Response(stream_with_context(body), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Accel-Buffering': 'no'  # 反向代理不缓冲，边查边下载
+    })
 
 @order_bp.route('/edit/<int:order_id>', methods=['GET', 'POST'])
 @login_required
@@ -39,7 +145,7 @@ def edit_order(order_id):
         flash('权限不足')
         return redirect(url_for('order.list_orders'))
     
-    if order.status not in ['未处理', '准备中']:
+    if order.status not in USER_EDITABLE_STATUSES:
         flash('订单已确认，无法修改')
         return redirect(url_for('order.list_orders'))
     
@@ -61,10 +167,11 @@ def delete_order(order_id):
         flash('权限不足')
         return redirect(url_for('order.list_orders'))
     
-    if order.status not in ['未处理']:
+    if order.status != PENDING:
         flash('订单已处理，无法删除')
         return redirect(url_for('order.list_orders'))
     
+    release_sales([order.id])
     db.session.delete(order)
     db.session.commit()
     flash('订单已删除')
@@ -81,6 +188,10 @@ def admin_delete_order(order_id):
     order = Order.query.get_or_404(order_id)
     
     try:
+        # 评价保留（计入餐厅评分），只解除与订单的关联
+        Review.query.filter_by(order_id=order.id).update({'order_id': None}, synchronize_session=False)
+        if order.status != CANCELLED:
+            release_sales([order.id])
         # 删除订单（会自动删除关联的订单项，因为设置了cascade='all, delete-orphan'）
         db.session.delete(order)
         db.session.commit()
@@ -100,12 +211,13 @@ def cancel_order(order_id):
         flash('权限不足')
         return redirect(url_for('order.list_orders'))
     
-    if order.status not in ['未处理', '准备中']:
+    if order.status not in USER_EDITABLE_STATUSES:
         flash('订单状态无法取消')
         return redirect(url_for('order.list_orders'))
     
-    order.status = '已取消'
+    transition(order, CANCELLED)
     db.session.commit()
+    publish_order_status(order.id, order.order_no, order.user_id, order.restaurant_id, order.status)
     flash('订单已取消')
     return redirect(url_for('order.list_orders'))
 
@@ -117,12 +229,104 @@ def update_status(order_id):
         return redirect(url_for('order.list_orders'))
 
     order = Order.query.get_or_404(order_id)
-    new_status = request.form['status']
-    order.status = new_status
+    try:
+        transition(order, request.form['status'])
+    except InvalidTransition as e:
+        flash(str(e))
+        return redirect(url_for('order.list_orders'))
     db.session.commit()
+    publish_order_status(order.id, order.order_no, order.user_id, order.restaurant_id, order.status)
     flash('订单状态已更新')
     return redirect(url_for('order.list_orders'))
 
+@order_bp.route('/batch_status', methods=['POST'])
+@login_required
+def batch_update_status():
+    """批量修改订单状态（管理员功能），不允许的订单跳过"""
+    if current_user.role != 'admin':
+        flash('权限不足')
+        return redirect(url_for('order.list_orders'))
+    
+    order_ids = request.form.getlist('order_ids', type=int)
+    target = request.form.get('status', '')
+    try:
+        moved, skipped = batch_transition(order_ids, target,
+                                          restaurant_id=request.form.get('restaurant_id', type=int))
+    except InvalidTransition as e:
+        flash(str(e))
+        return redirect(url_for('order.list_orders'))
+    db.session.commit()
+    publish_orders(moved)
+    
+    flash(f'{len(moved)} 个订单已变为{status_label(target)}' +
+          (f'，{len(skipped)} 个订单未修改' if skipped else ''))
+    return redirect(url_for('order.list_orders', **dict(
+        (k, v) for k, v in request.args.items() if k in ('status', 'restaurant_id', 'date_from', 'date_to'))))
+
+@order_bp.route('/events')
+@login_required
+def order_events():
+    """订单状态推送（Server-Sent Events）
+
+    普通用户接收自己的订单，管理员接收全部订单或 ?restaurant_id= 指定餐厅的订单。
+    连接保持 EVENT_STREAM_TIMEOUT 秒后结束，浏览器的 EventSource 会自动重连。
+    本进程的推送连接已满时返回 204：EventSource 收到非 200 响应后不再重连，
+    页面改为轮询 order_statuses。
+    """
+    if current_user.role == 'admin':
+        restaurant_id = request.args.get('restaurant_id', type=int)
+        channels = [restaurant_channel(restaurant_id) if restaurant_id else ORDERS_CHANNEL]
+    else:
+        channels = [user_channel(current_user.id)]
+    
+    subscription = event_bus.subscribe(channels)
+    if subscription is None:
+        # 推送连接已满，客户端改为轮询
+        return Response(status=204)
+    
+    heartbeat = current_app.config['EVENT_HEARTBEAT']
+    deadline = time.monotonic() + current_app.config['EVENT_STREAM_TIMEOUT']
+    
+    # 不使用 stream_with_context：请求上下文（及数据库会话）在开始推送前即释放
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < deadline:
+                message = subscription.get(timeout=heartbeat)
+                yield sse_message(message) if message else ': ping\n\n'
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 生成器未开始迭代就被关闭时 finally 不会执行
+    response.call_on_close(lambda: event_bus.unsubscribe(subscription))
+    return response
+
+MAX_STATUS_IDS = 100
+
+
+@order_bp.route('/statuses')
+@login_required
+def order_statuses():
+    """订单状态轮询（?ids=1,2,3，最多 MAX_STATUS_IDS 个），推送连接已满时由页面调用"""
+    order_ids = []
+    for value in request.args.get('ids', '').split(',')[:MAX_STATUS_IDS]:
+        if value.strip().isdigit():
+            order_ids.append(int(value))
+    if not order_ids:
+        return jsonify({'orders': []})
+    
+    query = db.session.query(Order.id, Order.status).filter(Order.id.in_(order_ids))
+    if current_user.role != 'admin':
+        query = query.filter(Order.user_id == current_user.id)
+    return jsonify({'orders': [
+        {'order_id': order_id, 'status': status, 'label': STATUS_LABELS.get(status, status)}
+        for order_id, status in query
+    ]})
+
 @order_bp.route('/detail/<int:order_id>')
 @login_required
 def order_detail(order_id):
@@ -132,4 +336,17 @@ def order_detail(order_id):
         flash('权限不足')
         return redirect(url_for('order.list_orders'))
     
-    return render_template('order/detail.html', order=order)
+    review = Review.query.filter_by(order_id=order.id).first()
+    return render_template('order/detail.html', order=order, review=review)
+
+@order_bp.route('/<int:order_id>/review', methods=['POST'])
+@login_required
+def review_order(order_id):
+    """评价已完成的订单"""
+    try:
+        submit_review(current_user.id, order_id, request.form.get('rating'), request.form.get('content', ''))
+    except ReviewError as e:
+        flash(str(e))
+    else:
+        flash('评价成功，感谢您的反馈')
+    return redirect(url_for('order.order_detail', order_id=order_id))
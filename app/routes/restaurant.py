@@ -1,52 +1,89 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
+import math
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, abort
 from flask_login import login_required, current_user
 from app.models import Restaurant, Dish, Category, Review, CartItem
-from app.utils import save_uploaded_image, delete_image_file, create_image_directories
+from app.utils import save_uploaded_image, delete_image_file, create_image_directories, image_srcset, is_image_pending
+from app.menu_cache import menu_cache, menu_responses, MenuBody
+from app.search import search_index
+from app.cart_summary import cart_summary
+from app.ranking import restaurant_ranking
+from app.geo import geo_index, fill_coordinates, user_location
+from app.bulk import BulkError, criteria_from_json, bulk_set_restaurant_status
+from app.db_routing import read_replica
+from app.reviews import bayesian_rating
 from app import db
 from sqlalchemy import func, or_
 
 restaurant_bp = Blueprint('restaurant', __name__, url_prefix='/restaurant')
 
+def _valid_location(lat, lng):
+    """经纬度为有限值且在 ±90 / ±180 范围内"""
+    return math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180
+
 @restaurant_bp.route('/')
+@read_replica
 def list_restaurants():
     """餐厅列表页面"""
     try:
         # 获取搜索关键词
         keyword = request.args.get('keyword', '')
         category_id = request.args.get('category', type=int)
-        sort_by = request.args.get('sort', 'rating')  # rating, distance, sales
+        # rating, distance, sales；有关键词时默认按相关度
+        sort_by = request.args.get('sort', 'relevance' if keyword else 'rating')
+        
+        radius = request.args.get('radius', type=float)  # 配送范围（公里）
+        if radius is not None and not (math.isfinite(radius) and radius > 0):
+            radius = None
+        
+        # 用户位置：请求参数 lat/lng，或默认收货地址的坐标
+        location = None
+        location_notice = None
+        lat = request.args.get('lat', type=float)
+        lng = request.args.get('lng', type=float)
+        if lat is not None and lng is not None:
+            if _valid_location(lat, lng):
+                location = (lat, lng)
+            else:
+                location_notice = '位置参数无效'
+        if location is None and (sort_by == 'distance' or radius) and current_user.is_authenticated:
+            location = user_location(current_user)
+        if location is None and sort_by == 'distance':
+            location_notice = (location_notice or '未获取到您的位置（可在默认收货地址中填写地址）') + '，未按距离排序'
+        elif location_notice:
+            location_notice += '，已忽略'
         
-        # 构建查询
-        query = Restaurant.query.filter_by(status='open')
+        # 按 restaurant_score 的 (status, 排序字段) 索引取营业中的餐厅
+        # 距离排序与相关度排序一样在取出后按距离/得分重排
+        order_by = sort_by if sort_by in ('rating', 'sales') else 'newest'
+        query = restaurant_ranking.ordered(Restaurant.query, order_by)
         
+        # 网格索引查出范围内的餐厅及距离
+        distances = {}
+        if location and (sort_by == 'distance' or radius):
+            nearby = geo_index.nearby(location[0], location[1],
+                                      radius or current_app.config['GEO_DEFAULT_RADIUS_KM'])
+            distances = dict(nearby)
+            query = query.filter(Restaurant.id.in_(distances))
+        
+        matched_ids = []
         if keyword:
-            # 同时搜索餐厅名称和菜品名称
-            dish_restaurants = db.session.query(Restaurant.id).join(Dish).filter(
-                Dish.name.contains(keyword),
-                Dish.available == True
-            ).distinct().subquery()
-            
-            query = query.filter(
-                or_(
-                    Restaurant.name.contains(keyword),
-                    Restaurant.id.in_(dish_restaurants)
-                )
-            )
+            # 全文索引检索餐厅（名称/简介/菜系）和菜品（名称/食材/描述）
+            matched_ids = search_index.search_restaurant_ids(keyword)
+            query = query.filter(Restaurant.id.in_(matched_ids))
         
         if category_id:
             # 筛选特定分类的餐厅
             query = query.join(Dish).join(Category).filter(Category.id == category_id)
 
-        # 排序
-        if sort_by == 'rating':
-            query = query.order_by(Restaurant.rating.desc())
-        elif sort_by == 'sales':
-            query = query.order_by(Restaurant.review_count.desc())
-        else:
-            query = query.order_by(Restaurant.created_at.desc())
-        
         restaurants = query.distinct().all()
         
+        if keyword and sort_by == 'relevance':
+            rank = dict((rid, i) for i, rid in enumerate(matched_ids))
+            restaurants.sort(key=lambda r: rank[r.id])
+        elif sort_by == 'distance' and distances:
+            restaurants.sort(key=lambda r: distances[r.id])
+        
         # 获取所有分类用于筛选
         all_categories = Category.query.order_by(Category.sort_order).all()
         
@@ -55,7 +92,10 @@ def list_restaurants():
                              categories=all_categories,
                              keyword=keyword,
                              current_category=category_id,
-                             sort_by=sort_by)
+                             sort_by=sort_by,
+                             distances=distances,
+                             radius=radius,
+                             location_notice=location_notice)
     except Exception as e:
         # 记录错误
         current_app.logger.error(f"Error in list_restaurants: {e}")
@@ -63,32 +103,16 @@ def list_restaurants():
         return render_template('errors/500.html'), 500
 
 @restaurant_bp.route('/<int:restaurant_id>')
+@read_replica
 def restaurant_detail(restaurant_id):
     """餐厅详情页面"""
     restaurant = Restaurant.query.get_or_404(restaurant_id)
     
-    # 获取菜品分类
-    categories = db.session.query(Category).join(Dish).filter(
-        Dish.restaurant_id == restaurant_id,
-        Dish.available == True
-    ).distinct().all()
-    
-    # 获取推荐菜品
-    recommended_dishes = Dish.query.filter_by(
-        restaurant_id=restaurant_id,
-        is_recommended=True,
-        available=True
-    ).limit(6).all()
-    
-    # 获取所有菜品（按分类分组）
-    dishes_by_category = {}
-    for category in categories:
-        dishes = Dish.query.filter_by(
-            restaurant_id=restaurant_id,
-            category_id=category.id,
-            available=True
-        ).order_by(Dish.sales_count.desc()).all()
-        dishes_by_category[category.name] = dishes
+    # 菜单快照（一次查询加载全部在售菜品并按分类分组）
+    menu = menu_cache.get(restaurant_id)
+    categories = menu.categories
+    recommended_dishes = menu.recommended
+    dishes_by_category = menu.dishes_by_category
     
     # 获取评价
     reviews = Review.query.filter_by(restaurant_id=restaurant_id)\
@@ -98,10 +122,7 @@ def restaurant_detail(restaurant_id):
     # 获取用户购物车数量（如果已登录）
     cart_count = 0
     if current_user.is_authenticated:
-        cart_count = CartItem.query.filter_by(user_id=current_user.id)\
-                                  .join(Dish)\
-                                  .filter(Dish.restaurant_id == restaurant_id)\
-                                  .count()
+        cart_count = cart_summary.get(current_user.id).restaurant_item_count(restaurant_id)
     
     return render_template('restaurant/detail.html',
                          restaurant=restaurant,
@@ -111,20 +132,8 @@ def restaurant_detail(restaurant_id):
                          reviews=reviews,
                          cart_count=cart_count)
 
-@restaurant_bp.route('/<int:restaurant_id>/menu')
-def restaurant_menu(restaurant_id):
-    """餐厅菜单页面（AJAX加载）"""
-    restaurant = Restaurant.query.get_or_404(restaurant_id)
-    category_id = request.args.get('category_id', type=int)
-    
-    query = Dish.query.filter_by(restaurant_id=restaurant_id, available=True)
-    
-    if category_id:
-        query = query.filter_by(category_id=category_id)
-    
-    dishes = query.order_by(Dish.sales_count.desc()).all()
-    
-    return jsonify({
+def _menu_payload(dishes):
+    return {
         'dishes': [{
             'id': dish.id,
             'name': dish.name,
@@ -132,14 +141,53 @@ def restaurant_menu(restaurant_id):
             'price': dish.price,
             'original_price': dish.original_price,
             'image': dish.image,
+            'image_srcset': image_srcset(dish.image),
+            'image_srcset_webp': image_srcset(dish.image, 'webp'),
             'sales_count': dish.sales_count,
             'rating': dish.rating,
             'is_recommended': dish.is_recommended,
             'is_spicy': dish.is_spicy
         } for dish in dishes]
-    })
+    }
+
+@restaurant_bp.route('/<int:restaurant_id>/menu')
+@read_replica
+def restaurant_menu(restaurant_id):
+    """餐厅菜单页面（AJAX加载）
+
+    响应体按 (餐厅, 分类, 菜单版本) 预先序列化并压缩，ETag 为内容摘要，
+    客户端带 If-None-Match 且未变化时返回 304。
+    """
+    category_id = request.args.get('category_id', type=int)
+    
+    snapshot = menu_cache.cached(restaurant_id)
+    if snapshot is None:
+        # 加载前确认餐厅存在，不存在的 id 不写入缓存
+        if db.session.query(Restaurant.id).filter(Restaurant.id == restaurant_id).first() is None:
+            abort(404)
+        snapshot = menu_cache.get(restaurant_id)
+    body = menu_responses.get(snapshot, category_id)
+    if body is None:
+        dishes = snapshot.dishes_in_category(category_id)
+        body = MenuBody(current_app.json.dumps(_menu_payload(dishes)).encode('utf-8'))
+        # 图片仍在后台处理时 srcset 为空，处理完成前不缓存
+        if not any(is_image_pending(dish.image) for dish in dishes if dish.image):
+            menu_responses.put(snapshot, category_id, body)
+    
+    if request.if_none_match.contains_weak(body.etag):
+        response = current_app.response_class(status=304)
+    elif request.accept_encodings['gzip']:
+        response = current_app.response_class(body.gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = current_app.response_class(body.raw, mimetype='application/json')
+    response.set_etag(body.etag, weak=True)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    return response
 
 @restaurant_bp.route('/search')
+@read_replica
 def search_restaurants():
     """搜索餐厅"""
     keyword = request.args.get('q', '')
@@ -147,10 +195,13 @@ def search_restaurants():
     if not keyword:
         return jsonify({'restaurants': []})
     
+    matched_ids = search_index.search_restaurant_ids(keyword, limit=50)
+    rank = dict((rid, i) for i, rid in enumerate(matched_ids))
     restaurants = Restaurant.query.filter(
-        Restaurant.name.contains(keyword),
+        Restaurant.id.in_(matched_ids),
         Restaurant.status == 'open'
-    ).limit(10).all()
+    ).all()
+    restaurants = sorted(restaurants, key=lambda r: rank[r.id])[:10]
     
     return jsonify({
         'restaurants': [{
@@ -182,11 +233,18 @@ def add_restaurant():
             delivery_fee=float(request.form.get('delivery_fee', 0)),
             min_order=float(request.form.get('min_order', 0)),
             logo=request.form.get('logo', ''),
-            banner=request.form.get('banner', '')
+            banner=request.form.get('banner', ''),
+            rating=bayesian_rating(0, 0)
         )
+        fill_coordinates(restaurant)
         
         db.session.add(restaurant)
+        db.session.flush()
+        # 排序行与餐厅在同一事务中写入，否则新餐厅不会出现在列表中
+        restaurant_ranking.refresh_restaurant(restaurant.id)
         db.session.commit()
+        search_index.index_restaurant(restaurant)
+        geo_index.index_restaurant(restaurant)
         
         flash('餐厅添加成功')
         return redirect(url_for('restaurant.list_restaurants'))
@@ -210,22 +268,21 @@ def edit_restaurant(restaurant_id):
         # 基本信息更新
         restaurant.name = request.form['name']
         restaurant.description = request.form.get('description', '')
-        restaurant.address = request.form.get('address', '')
+        address = request.form.get('address', '')
+        if address != restaurant.address:
+            restaurant.address = address
+            fill_coordinates(restaurant, force=True)
         restaurant.phone = request.form.get('phone', '')
         restaurant.business_hours = request.form.get('business_hours', '')
         restaurant.delivery_fee = float(request.form.get('delivery_fee', 0))
         restaurant.min_order = float(request.form.get('min_order', 0))
         restaurant.status = request.form.get('status', 'open')
-        restaurant.rating = float(request.form.get('rating', 4.5))
         
         # 处理Logo图片上传
+        old_images = [restaurant.logo, restaurant.banner]
         logo_file = request.files.get('logo_file')
         if logo_file and logo_file.filename:
-            # 删除旧的logo文件
-            if restaurant.logo:
-                delete_image_file(restaurant.logo)
-            
-            # 保存新的logo
+            # 保存新的logo（旧图片在提交后删除）
             new_logo_path = save_uploaded_image(logo_file, 'logos', max_size=(200, 200))
             if new_logo_path:
                 restaurant.logo = new_logo_path
@@ -239,10 +296,6 @@ def edit_restaurant(restaurant_id):
         # 处理Banner图片上传
         banner_file = request.files.get('banner_file')
         if banner_file and banner_file.filename:
-            # 删除旧的banner文件
-            if restaurant.banner:
-                delete_image_file(restaurant.banner)
-            
             # 保存新的banner
             new_banner_path = save_uploaded_image(banner_file, 'banners', max_size=(800, 300))
             if new_banner_path:
@@ -253,7 +306,13 @@ def edit_restaurant(restaurant_id):
             # 如果没有上传文件但有URL，使用URL
             restaurant.banner = request.form.get('banner_url', '')
         
+        restaurant_ranking.refresh_restaurant(restaurant.id)
         db.session.commit()
+        for image in set(old_images) - set([restaurant.logo, restaurant.banner]):
+            if image and not image.startswith('http'):
+                delete_image_file(image)
+        search_index.index_restaurant(restaurant)
+        geo_index.index_restaurant(restaurant)
         flash('餐厅信息更新成功')
         return redirect(url_for('restaurant.admin_restaurants'))
     
@@ -302,11 +361,30 @@ def toggle_status(restaurant_id):
     
     if new_status in ['open', 'closed']:
         restaurant.status = new_status
+        restaurant_ranking.refresh_restaurant(restaurant.id)
         db.session.commit()
+        geo_index.index_restaurant(restaurant)
         return jsonify({'success': True, 'message': '状态更新成功'})
     
     return jsonify({'success': False, 'message': '无效的状态'})
 
+@restaurant_bp.route('/bulk/status', methods=['POST'])
+@login_required
+def bulk_update_status():
+    """批量修改餐厅状态（管理员功能）
+
+    JSON：{"ids": [...]} 或 {"filter": {"cuisine_type": "湘菜"}}，以及 "status": "open"/"closed"/"busy"。
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': '权限不足'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        result = bulk_set_restaurant_status(criteria_from_json(data), data.get('status'))
+    except BulkError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **result})
+
 @restaurant_bp.route('/<int:restaurant_id>/delete')
 @login_required
 def delete_restaurant(restaurant_id):
@@ -318,8 +396,17 @@ def delete_restaurant(restaurant_id):
     restaurant = Restaurant.query.get_or_404(restaurant_id)
     
     try:
+        images = [restaurant.logo, restaurant.banner]
+        restaurant_ranking.remove_restaurant(restaurant_id)
         db.session.delete(restaurant)
+        menu_cache.publish(restaurant_id)
         db.session.commit()
+        for image in set(images):
+            if image and not image.startswith('http'):
+                delete_image_file(image)
+        menu_cache.invalidate(restaurant_id)
+        search_index.remove_restaurant(restaurant_id)
+        geo_index.remove_restaurant(restaurant_id)
         flash('餐厅删除成功')
     except Exception as e:
         db.session.rollback()
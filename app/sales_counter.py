@@ -0,0 +1,130 @@
+"""
+菜品销量计数
+
+结算不再直接执行 UPDATE dish SET sales_count = sales_count + x：热销菜品的那一行
+会成为并发结算的锁争用点，同时又被菜单的 ORDER BY sales_count 频繁读取。
+改为在结算事务中向 dish_sales_delta 追加增量行（只有 INSERT，不同结算之间没有行锁冲突），
+由后台线程每 SALES_ROLLUP_INTERVAL 秒汇总一次：
+
+  1. 用一条 UPDATE 给尚未汇总的增量行写入本次的批次号（认领）；多个 worker
+     同时汇总时，行锁保证每一行只会被一个批次认领；
+  2. 按 dish_id 分组求和，每道菜一条 UPDATE 累加到 dish.sales_count（按 id 排序加锁）；
+  3. 删除本批次的增量行，与第 2 步在同一事务中提交；
+  4. 在同一事务中发布相关餐厅的菜单失效记录（menu_cache.publish），所有 worker
+     的菜单快照随之失效，菜单排序的延迟约为一个汇总周期。
+
+汇总线程在每个 worker 处理第一个请求时启动（gunicorn fork 之前启动的线程不会带到 worker 中）。
+SALES_ROLLUP_INTERVAL 为 0 时不启动后台线程（测试或由外部定时调用 rollup()）。
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+
+from flask import current_app
+from sqlalchemy import bindparam, func, update
+
+from app import db
+from app.models import Dish, DishSalesDelta
+
+logger = logging.getLogger(__name__)
+
+
+class SalesCounter(object):
+    """销量增量的写入与汇总"""
+
+    def __init__(self):
+        self._started_pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('SALES_ROLLUP_INTERVAL', 10)  # 秒
+        app.config.setdefault('SALES_ROLLUP_BATCH', 10000)  # 每次最多汇总的增量行数
+        app.before_request(self._ensure_worker)
+
+    def record(self, quantities):
+        """追加销量增量 {dish_id: 件数}（在结算事务内调用，由调用方提交）"""
+        if not quantities:
+            return
+        db.session.execute(DishSalesDelta.__table__.insert(), [
+            {'dish_id': dish_id, 'quantity': quantity}
+            for dish_id, quantity in sorted(quantities.items())
+        ])
+        self._ensure_worker()
+
+    def rollup(self):
+        """把一批增量汇总到 dish.sales_count，返回涉及的菜品数"""
+        from app.menu_cache import menu_cache
+
+        table = DishSalesDelta.__table__
+        upper = db.session.query(func.min(table.c.id)).filter(table.c.batch.is_(None)).scalar()
+        if upper is None:
+            db.session.rollback()
+            return 0
+        upper += current_app.config['SALES_ROLLUP_BATCH']
+
+        batch = uuid.uuid4().hex
+        claimed = db.session.execute(
+            update(table).where(table.c.batch.is_(None), table.c.id < upper).values(batch=batch)
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return 0
+
+        totals = db.session.query(table.c.dish_id, func.sum(table.c.quantity))\
+            .filter(table.c.batch == batch).group_by(table.c.dish_id).all()
+        dish_table = Dish.__table__
+        db.session.execute(
+            dish_table.update()
+            .where(dish_table.c.id == bindparam('b_dish_id'))
+            .values(sales_count=func.coalesce(dish_table.c.sales_count, 0) + bindparam('b_quantity')),
+            [{'b_dish_id': dish_id, 'b_quantity': int(quantity)} for dish_id, quantity in sorted(totals)]
+        )
+        db.session.execute(table.delete().where(table.c.batch == batch))
+        restaurant_ids = [rid for (rid,) in db.session.query(Dish.restaurant_id).filter(
+            Dish.id.in_([dish_id for dish_id, _ in totals])).distinct()]
+        menu_cache.publish(*restaurant_ids)
+        db.session.commit()
+
+        menu_cache.invalidate(*restaurant_ids)
+        return len(totals)
+
+    def _ensure_worker(self):
+        """每个进程启动一个汇总线程（gunicorn fork 之后在各 worker 中分别启动）"""
+        interval = current_app.config['SALES_ROLLUP_INTERVAL']
+        if not interval or self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            app = current_app._get_current_object()
+            thread = threading.Thread(target=self._run, args=(app, interval),
+                                      name='sales-rollup', daemon=True)
+            thread.start()
+            self._started_pid = os.getpid()
+
+    def _run(self, app, interval):
+        from app.menu_cache import menu_cache
+
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    # 一批汇总不完时继续下一批
+                    while self.rollup() and self._has_pending():
+                        pass
+                    menu_cache.purge()
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('菜品销量汇总失败')
+                finally:
+                    db.session.remove()
+
+    def _has_pending(self):
+        return db.session.query(DishSalesDelta.id).filter(DishSalesDelta.batch.is_(None)).first() is not None
+
+
+sales_counter = SalesCounter()
@@ -0,0 +1,511 @@
+"""
+餐厅/菜品全文搜索
+
+对餐厅（名称、简介、菜系）和在售菜品（名称、食材、描述）建立倒排索引，
+中文按字切分为单字 + 二元组（bigram），英文/数字按词切分并索引前缀。
+SQLite 下使用 FTS5 虚拟表，其他数据库使用进程内索引。
+写入路径（餐厅/菜品增删改）在提交后调用 index_*/remove_* 增量更新，
+使用进程内索引时各 worker 通过 search_index_change 表同步这些更新。
+"""
+
+import logging
+import math
+import os
+import re
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, text
+
+from app import db
+from app.models import Restaurant, Dish, SearchIndexChange
+
+logger = logging.getLogger(__name__)
+
+# 中日韩统一表意文字
+_TOKEN_RE = re.compile(r'([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)|([a-z0-9]+)')
+
+# 英文单词前缀的最小/最大长度
+_MIN_PREFIX = 2
+_MAX_PREFIX = 20
+
+# 名称字段的权重高于描述字段
+NAME_WEIGHT = 3.0
+BODY_WEIGHT = 1.0
+
+# 命中菜品对所属餐厅得分的折算系数
+DISH_SCORE_FACTOR = 0.5
+
+
+def tokenize(value, for_query=False):
+    """切分文本
+
+    索引时：中文输出单字和相邻二元组，英文输出整词及其前缀；
+    查询时：中文只输出二元组（单字查询输出单字），英文输出整词。
+    """
+    if not value:
+        return []
+
+    tokens = []
+    for match in _TOKEN_RE.finditer(value.lower()):
+        cjk, word = match.groups()
+        if cjk:
+            if len(cjk) == 1:
+                tokens.append(cjk)
+                continue
+            if not for_query:
+                tokens.extend(cjk)
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+        else:
+            word = word[:_MAX_PREFIX]
+            if for_query or len(word) <= _MIN_PREFIX:
+                tokens.append(word)
+            else:
+                tokens.extend(word[:i] for i in range(_MIN_PREFIX, len(word) + 1))
+    return tokens
+
+
+def _restaurant_fields(restaurant):
+    name = restaurant.name or ''
+    body = ' '.join(filter(None, [restaurant.description, restaurant.cuisine_type]))
+    return name, body
+
+
+def _dish_fields(dish):
+    name = dish.name or ''
+    body = ' '.join(filter(None, [dish.ingredients, dish.description]))
+    return name, body
+
+
+class MemorySearchBackend(object):
+    """进程内倒排索引（token -> {文档: 权重}）"""
+
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}        # doc_key -> (restaurant_id, Counter)
+        self._postings = {}    # token -> {doc_key: weight}
+        self.built_at = None
+
+    def _remove(self, doc_key):
+        doc = self._docs.pop(doc_key, None)
+        if doc is None:
+            return
+        for token in doc[1]:
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.pop(doc_key, None)
+                if not posting:
+                    del self._postings[token]
+
+    def upsert(self, doc_key, restaurant_id, name, body):
+        weights = Counter()
+        for token in tokenize(name):
+            weights[token] += NAME_WEIGHT
+        for token in tokenize(body):
+            weights[token] += BODY_WEIGHT
+
+        with self._lock:
+            self._remove(doc_key)
+            self._docs[doc_key] = (restaurant_id, weights)
+            for token, weight in weights.items():
+                self._postings.setdefault(token, {})[doc_key] = weight
+
+    def remove(self, doc_key):
+        with self._lock:
+            self._remove(doc_key)
+
+    def remove_restaurant(self, restaurant_id):
+        with self._lock:
+            for doc_key in [k for k, d in self._docs.items() if d[0] == restaurant_id]:
+                self._remove(doc_key)
+
+    def reset(self):
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+        self.built_at = time.time()
+
+    def is_empty(self):
+        return self.built_at is None
+
+    def query(self, tokens, limit):
+        """返回 [(doc_key, restaurant_id, score)]，所有 token 必须同时命中"""
+        with self._lock:
+            postings = [self._postings.get(token) for token in set(tokens)]
+            if not postings or any(p is None for p in postings):
+                return []
+            postings.sort(key=len)
+
+            total = float(len(self._docs)) or 1.0
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+
+            results = []
+            for doc_key in candidates:
+                score = 0.0
+                for posting in postings:
+                    score += posting[doc_key] * math.log(1.0 + total / len(posting))
+                results.append((doc_key, self._docs[doc_key][0], score))
+
+        results.sort(key=lambda r: r[2], reverse=True)
+        return results[:limit]
+
+
+class SqliteFtsBackend(object):
+    """SQLite FTS5 索引（内容在写入前已由 tokenize 预切分）
+
+    文档 key 编码为 rowid（菜品 2*id，餐厅 2*id+1），按主键更新/删除。
+    """
+
+    name = 'fts5'
+    table = 'search_fts'
+
+    def __init__(self, engine):
+        self.engine = engine
+        with engine.begin() as conn:
+            conn.execute(text(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5('
+                'restaurant_id UNINDEXED, name, body)'
+            ))
+
+    @staticmethod
+    def _rowid(doc_key):
+        kind, doc_id = doc_key.split(':')
+        return int(doc_id) * 2 + (1 if kind == 'r' else 0)
+
+    @staticmethod
+    def _doc_key(rowid):
+        return '%s:%d' % ('r' if rowid % 2 else 'd', rowid // 2)
+
+    def _params(self, doc_key, restaurant_id, name, body):
+        return {'id': self._rowid(doc_key), 'r': restaurant_id,
+                'n': ' '.join(tokenize(name)), 'b': ' '.join(tokenize(body))}
+
+    def upsert(self, doc_key, restaurant_id, name, body):
+        self.upsert_many([(doc_key, restaurant_id, name, body)])
+
+    def upsert_many(self, rows):
+        if not rows:
+            return
+        params = [self._params(*row) for row in rows]
+        with self.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {self.table} WHERE rowid = :id'), params)
+            conn.execute(text(
+                f'INSERT INTO {self.table} (rowid, restaurant_id, name, body) '
+                'VALUES (:id, :r, :n, :b)'
+            ), params)
+
+    def remove(self, doc_key):
+        self.remove_many([doc_key])
+
+    def remove_many(self, doc_keys):
+        if not doc_keys:
+            return
+        with self.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {self.table} WHERE rowid = :id'),
+                         [{'id': self._rowid(doc_key)} for doc_key in doc_keys])
+
+    def remove_restaurant(self, restaurant_id):
+        with self.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {self.table} WHERE restaurant_id = :r'),
+                         {'r': restaurant_id})
+
+    def reset(self):
+        with self.engine.begin() as conn:
+            conn.execute(text(f'DELETE FROM {self.table}'))
+
+    def is_empty(self):
+        with self.engine.connect() as conn:
+            row = conn.execute(text(f'SELECT 1 FROM {self.table} LIMIT 1')).first()
+        return row is None
+
+    def query(self, tokens, limit):
+        match = ' '.join('"%s"' % token for token in set(tokens))
+        with self.engine.connect() as conn:
+            rows = conn.execute(text(
+                f'SELECT rowid, restaurant_id, '
+                f'bm25({self.table}, 0, {NAME_WEIGHT}, {BODY_WEIGHT}) AS score '
+                f'FROM {self.table} WHERE {self.table} MATCH :q '
+                'ORDER BY score LIMIT :n'
+            ), {'q': match, 'n': limit}).fetchall()
+        # bm25 越小越相关，取反后与内存索引保持一致
+        return [(self._doc_key(rowid), int(restaurant_id), -score)
+                for rowid, restaurant_id, score in rows]
+
+
+def _fts5_available(engine):
+    if engine.dialect.name != 'sqlite':
+        return False
+    try:
+        with engine.connect() as conn:
+            conn.execute(text('CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)'))
+            conn.execute(text('DROP TABLE temp._fts5_probe'))
+        return True
+    except Exception:
+        return False
+
+
+class SearchIndex(object):
+    """搜索入口：按配置选择后端，负责建索引和增量更新
+
+    内存索引在多个 worker 间不共享：增量更新时同时向 search_index_change 表追加变更记录，
+    每个进程的后台线程每 SEARCH_SYNC_INTERVAL 秒读取新记录，从数据库重新加载对应文档；
+    同一线程每 SEARCH_INDEX_TTL 秒在旁边重建一份新索引后整体替换，作为兜底。
+    """
+
+    change_retention = 3600  # 变更记录保留时间（秒）
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._last_change = 0  # 已应用到内存索引的最大 search_index_change.id
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_BACKEND', 'auto')   # auto/fts5/memory
+        app.config.setdefault('SEARCH_INDEX_TTL', 600)    # 内存索引定期重建（秒）
+        app.config.setdefault('SEARCH_SYNC_INTERVAL', 2)  # 内存索引读取变更记录的间隔（秒），0 为不同步
+        app.extensions['search_index'] = None
+        app.before_request(self._ensure_worker)
+
+    def _create(self, app):
+        choice = app.config['SEARCH_BACKEND']
+        if choice == 'fts5' or (choice == 'auto' and _fts5_available(db.engine)):
+            return SqliteFtsBackend(db.engine)
+        return MemorySearchBackend()
+
+    def _backend(self):
+        app = current_app._get_current_object()
+        backend = app.extensions.get('search_index')
+        if backend is None:
+            # 首次使用时建索引（FTS 表只在此时检查是否为空）
+            with self._lock:
+                backend = app.extensions.get('search_index')
+                if backend is None:
+                    backend = self._create(app)
+                    if backend.is_empty():
+                        self._fill(backend)
+                    app.extensions['search_index'] = backend
+        return backend
+
+    def _swap(self, app):
+        """在旁边建一份新的内存索引，建好后替换 app.extensions 中的引用（调用方持有 self._lock）"""
+        fresh = MemorySearchBackend()
+        self._fill(fresh)
+        app.extensions['search_index'] = fresh
+        return fresh
+
+    def _fill(self, backend):
+        if backend.name == 'memory':
+            # 先记录变更位置再读数据，之后的变更由 _sync 重放（重复应用无副作用）
+            self._last_change = db.session.query(func.max(SearchIndexChange.id)).scalar() or 0
+
+        rows = []
+        for r in db.session.query(Restaurant.id, Restaurant.name,
+                                  Restaurant.description, Restaurant.cuisine_type):
+            rows.append(('r:%d' % r.id, r.id) + _restaurant_fields(r))
+        for d in db.session.query(Dish.id, Dish.restaurant_id, Dish.name,
+                                  Dish.ingredients, Dish.description).filter(Dish.available == True):
+            rows.append(('d:%d' % d.id, d.restaurant_id) + _dish_fields(d))
+
+        backend.reset()
+        if hasattr(backend, 'upsert_many'):
+            backend.upsert_many(rows)
+        else:
+            for row in rows:
+                backend.upsert(*row)
+
+    def rebuild(self):
+        """从数据库全量重建索引（内存索引建好后整体替换，重建期间搜索不受影响）"""
+        app = current_app._get_current_object()
+        if app.extensions.get('search_index') is None:
+            self._backend()
+            self._publish(['*'])
+            return
+        # 先记录，本进程重建时会跳过这条记录，其他进程读到后各自重建
+        self._publish(['*'])
+        with self._lock:
+            backend = app.extensions['search_index']
+            if backend.name == 'memory':
+                self._swap(app)
+            else:
+                self._fill(backend)
+
+    # ---- 多进程同步 ----
+
+    def _publish(self, doc_keys):
+        """内存索引时记录变更，供其他进程重放（写入路径已提交，单独一个事务写入）"""
+        backend = current_app.extensions.get('search_index')
+        if backend is None or backend.name != 'memory' or not doc_keys:
+            return
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(SearchIndexChange.__table__.insert(),
+                             [{'doc_key': doc_key, 'created_at': now} for doc_key in doc_keys])
+        except Exception:
+            # 记录失败时其他进程要到下次定期重建才能看到这次修改
+            logger.exception('写入搜索索引变更记录失败')
+
+    def _sync(self):
+        """重放其他进程（以及本进程）记录的变更（调用方持有 self._lock）"""
+        app = current_app._get_current_object()
+        backend = app.extensions.get('search_index')
+        rows = db.session.query(SearchIndexChange.id, SearchIndexChange.doc_key)\
+            .filter(SearchIndexChange.id > self._last_change)\
+            .order_by(SearchIndexChange.id).all()
+        if not rows:
+            return
+        doc_keys = set(doc_key for _, doc_key in rows)
+        if '*' in doc_keys:
+            self._swap(app)
+            return
+        self._last_change = rows[-1][0]
+
+        restaurant_ids = [int(key[2:]) for key in doc_keys if key.startswith('r:')]
+        dish_ids = [int(key[2:]) for key in doc_keys if key.startswith('d:')]
+        if restaurant_ids:
+            found = dict((r.id, r) for r in db.session.query(
+                Restaurant.id, Restaurant.name, Restaurant.description, Restaurant.cuisine_type
+            ).filter(Restaurant.id.in_(restaurant_ids)))
+            for restaurant_id in restaurant_ids:
+                if restaurant_id in found:
+                    backend.upsert('r:%d' % restaurant_id, restaurant_id,
+                                   *_restaurant_fields(found[restaurant_id]))
+                else:
+                    backend.remove_restaurant(restaurant_id)
+        if dish_ids:
+            found = dict((d.id, d) for d in db.session.query(
+                Dish.id, Dish.restaurant_id, Dish.name, Dish.ingredients, Dish.description
+            ).filter(Dish.id.in_(dish_ids), Dish.available == True))
+            for dish_id in dish_ids:
+                if dish_id in found:
+                    backend.upsert('d:%d' % dish_id, found[dish_id].restaurant_id,
+                                   *_dish_fields(found[dish_id]))
+                else:
+                    backend.remove('d:%d' % dish_id)
+
+    def purge(self):
+        """删除超过保留时间的变更记录"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.change_retention)
+        db.session.execute(SearchIndexChange.__table__.delete()
+                           .where(SearchIndexChange.created_at < cutoff))
+        db.session.commit()
+
+    def _ensure_worker(self):
+        """每个进程启动一个同步线程（gunicorn fork 之后在各 worker 中分别启动）"""
+        interval = current_app.config['SEARCH_SYNC_INTERVAL']
+        if not interval or self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            app = current_app._get_current_object()
+            thread = threading.Thread(target=self._run, args=(app, interval),
+                                      name='search-sync', daemon=True)
+            thread.start()
+            self._started_pid = os.getpid()
+
+    def _run(self, app, interval):
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    backend = app.extensions.get('search_index')
+                    if backend is None:
+                        continue  # 本进程还没有用到搜索
+                    if backend.name != 'memory':
+                        return  # FTS 表在进程间共享，不需要同步
+                    expired = time.time() - backend.built_at > app.config['SEARCH_INDEX_TTL']
+                    with self._lock:
+                        if expired:
+                            self._swap(app)
+                        else:
+                            self._sync()
+                    if expired:
+                        self.purge()
+                except Exception:
+                    db.session.rollback()
+                    logger.exception('搜索索引同步失败')
+                finally:
+                    db.session.remove()
+
+    # ---- 增量更新 ----
+
+    def index_restaurant(self, restaurant):
+        self._backend().upsert('r:%d' % restaurant.id, restaurant.id,
+                               *_restaurant_fields(restaurant))
+        self._publish(['r:%d' % restaurant.id])
+
+    def remove_restaurant(self, restaurant_id):
+        self._backend().remove_restaurant(restaurant_id)
+        self._publish(['r:%d' % restaurant_id])
+
+    def index_dish(self, dish):
+        """菜品上架时写入索引，下架时移除"""
+        if not dish.available:
+            return self.remove_dish(dish.id)
+        self._backend().upsert('d:%d' % dish.id, dish.restaurant_id, *_dish_fields(dish))
+        self._publish(['d:%d' % dish.id])
+
+    def remove_dish(self, dish_id):
+        self._backend().remove('d:%d' % dish_id)
+        self._publish(['d:%d' % dish_id])
+
+    def index_dishes(self, dishes):
+        """批量写入已上架的菜品（需要 id、restaurant_id、name、ingredients、description）"""
+        backend = self._backend()
+        rows = [('d:%d' % dish.id, dish.restaurant_id) + _dish_fields(dish) for dish in dishes]
+        if hasattr(backend, 'upsert_many'):
+            backend.upsert_many(rows)
+        else:
+            for row in rows:
+                backend.upsert(*row)
+        self._publish([row[0] for row in rows])
+
+    def remove_dishes(self, dish_ids):
+        backend = self._backend()
+        doc_keys = ['d:%d' % dish_id for dish_id in dish_ids]
+        if hasattr(backend, 'remove_many'):
+            backend.remove_many(doc_keys)
+        else:
+            for doc_key in doc_keys:
+                backend.remove(doc_key)
+        self._publish(doc_keys)
+
+    # ---- 查询 ----
+
+    def search_restaurant_ids(self, keyword, limit=200):
+        """按相关度返回餐厅 id 列表
+
+        餐厅自身命中的得分全额计入，菜品命中按 DISH_SCORE_FACTOR 折算，
+        同一餐厅只取最相关的一道菜。
+        """
+        tokens = tokenize(keyword, for_query=True)
+        if not tokens:
+            return []
+
+        scores = {}
+        best_dish = {}
+        for doc_key, restaurant_id, score in self._backend().query(tokens, limit * 10):
+            if doc_key.startswith('r:'):
+                scores[restaurant_id] = scores.get(restaurant_id, 0.0) + score
+            elif score > best_dish.get(restaurant_id, 0.0):
+                best_dish[restaurant_id] = score
+        for restaurant_id, score in best_dish.items():
+            scores[restaurant_id] = scores.get(restaurant_id, 0.0) + score * DISH_SCORE_FACTOR
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [restaurant_id for restaurant_id, _ in ranked[:limit]]
+
+
+search_index = SearchIndex()
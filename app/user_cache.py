@@ -0,0 +1,107 @@
+"""
+登录用户缓存
+
+Flask-Login 每个请求都会调用 user_loader。这里把用户的 (id, username, role)
+按 USER_CACHE_TTL 缓存在进程内，命中时不查询数据库，返回只读的 Principal；
+视图需要其他字段（邮箱、密码等）时才按 id 加载完整的 User 行。
+
+修改用户名、角色或删除用户后调用 user_cache.invalidate(user_id)。
+多个 worker 之间不共享缓存，其他 worker 上的旧数据最多保留 USER_CACHE_TTL 秒。
+"""
+
+import time
+import threading
+
+from flask import current_app
+from flask_login import UserMixin
+
+from app import db, login_manager
+from app.models import User
+
+
+class Principal(UserMixin):
+    """当前登录用户的只读视图"""
+
+    def __init__(self, user_id, username, role):
+        object.__setattr__(self, 'id', user_id)
+        object.__setattr__(self, 'username', username)
+        object.__setattr__(self, 'role', role)
+        object.__setattr__(self, '_user', None)
+
+    @property
+    def user(self):
+        """完整的 User 行（首次访问时加载）"""
+        if self._user is None:
+            object.__setattr__(self, '_user', User.query.get(self.id))
+        return self._user
+
+    def __getattr__(self, name):
+        # 其余字段和关系从完整的 User 行读取
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Principal 为只读对象，请修改 current_user.user')
+
+    def __repr__(self):
+        return f'<Principal {self.id} {self.username} {self.role}>'
+
+
+class UserCache(object):
+    """user_loader 使用的身份缓存"""
+
+    def __init__(self):
+        self._data = {}  # user_id -> (过期时间, username, role)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('USER_CACHE_TTL', 60)
+        app.config.setdefault('USER_CACHE_MAX_USERS', 10000)
+        login_manager.user_loader(self.load)
+
+    def load(self, user_id):
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(user_id)
+        if entry is not None and entry[0] > now:
+            return Principal(user_id, entry[1], entry[2])
+
+        row = db.session.query(User.username, User.role).filter(User.id == user_id).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        self._store(user_id, row.username, row.role)
+        return Principal(user_id, row.username, row.role)
+
+    def _store(self, user_id, username, role):
+        config = current_app.config
+        with self._lock:
+            if len(self._data) >= config['USER_CACHE_MAX_USERS'] and user_id not in self._data:
+                now = time.time()
+                for key in [key for key, entry in self._data.items() if entry[0] <= now]:
+                    del self._data[key]
+                if len(self._data) >= config['USER_CACHE_MAX_USERS']:
+                    self._data.clear()
+            self._data[user_id] = (time.time() + config['USER_CACHE_TTL'], username, role)
+
+    def remember(self, user):
+        """登录成功后直接写入缓存"""
+        self._store(user.id, user.username, user.role)
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+user_cache = UserCache()
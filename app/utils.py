@@ -4,8 +4,11 @@ from logging.handlers import RotatingFileHandler
 from datetime import datetime
 import uuid
 from werkzeug.utils import secure_filename
-from PIL import Image
 import hashlib
+import re
+import glob
+from functools import lru_cache
+from flask import request
 
 def setup_logging(app):
     """配置日志系统"""
@@ -69,10 +72,25 @@ def generate_unique_filename(original_filename):
     unique_name = str(uuid.uuid4())
     return f"{unique_name}.{ext}"
 
+# 响应式图片宽度（小于上传类型最大宽度的才会生成）
+IMAGE_VARIANT_WIDTHS = (160, 320, 480, 640)
+
+# 内容哈希命名的图片：/static/images/<类型>/<20位哈希>.jpg
+HASHED_IMAGE_RE = re.compile(r'^/static/images/[a-z]+/[0-9a-f]{20}(-\d+)?\.(jpg|webp)$')
+
+def content_hash_filename(data):
+    """按内容生成文件名，相同图片得到相同文件名"""
+    return hashlib.sha256(data).hexdigest()[:20] + '.jpg'
+
 def save_uploaded_image(file, upload_type='dishes', max_size=(800, 600)):
     """
     保存上传的图片文件
     
+    文件名取内容哈希，相同图片直接复用已有文件。新图片的原始字节立即写入
+    目标路径并返回路径（处理完成前作为占位），转换、缩放、各宽度版本和
+    WebP 交给后台图片队列生成，完成后原子替换该文件。
+    处理进度可通过 image_queue.status(文件名) 或 /image/status/<文件名> 查询。
+    
     Args:
         file: 上传的文件对象
         upload_type: 上传类型 ('dishes', 'restaurants', 'logos', 'banners')
@@ -90,9 +108,9 @@ def save_uploaded_image(file, upload_type='dishes', max_size=(800, 600)):
         return None
     
     try:
-        # 生成唯一文件名
-        filename = generate_unique_filename(file.filename)
-        print(f"生成文件名: {filename}")
+        # 按内容生成文件名
+        data = file.read()
+        filename = content_hash_filename(data)
         
         # 获取应用根目录下的static目录
         from flask import current_app
@@ -101,44 +119,28 @@ def save_uploaded_image(file, upload_type='dishes', max_size=(800, 600)):
         
         # 确保目录存在
         os.makedirs(upload_dir, exist_ok=True)
-        print(f"保存目录: {upload_dir}")
         
         # 完整文件路径
         file_path = os.path.join(upload_dir, filename)
-        print(f"完整文件路径: {file_path}")
-        
-        # 保存原始文件
-        file.save(file_path)
-        print("文件保存成功")
-        
-        # 使用PIL压缩和调整图片大小
-        try:
-            with Image.open(file_path) as img:
-                print(f"原始图片信息: {img.size}, {img.mode}")
-                
-                # 转换为RGB模式（处理RGBA等格式）
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-                    print("图片模式转换完成")
-                
-                # 调整图片大小（保持比例）
-                img.thumbnail(max_size, Image.Resampling.LANCZOS)
-                print(f"图片尺寸调整后: {img.size}")
-                
-                # 保存压缩后的图片
-                img.save(file_path, 'JPEG', quality=85, optimize=True)
-                print("图片压缩保存完成")
-        except Exception as img_error:
-            print(f"图片处理失败: {img_error}")
-            # 如果图片处理失败，但文件已保存，仍然返回路径
         
         # 返回相对路径（用于数据库存储和Web访问）
         web_path = f"/static/images/{upload_type}/{filename}"
-        print(f"返回的Web路径: {web_path}")
+        
+        # 相同内容已上传过（或正在处理），直接复用
+        if os.path.exists(file_path):
+            print(f"图片已存在，复用: {web_path}")
+            return web_path
+        
+        # 保存原始文件，并标记为处理中
+        from app.image_queue import image_queue, pending_marker
+        open(pending_marker(file_path), 'w').close()
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        
+        # 提交后台处理（压缩、调整大小、生成各宽度版本）
+        image_queue.submit(filename, file_path, web_path, max_size,
+                           widths=IMAGE_VARIANT_WIDTHS, webp=True)
+        print(f"图片已保存，等待后台处理: {web_path}")
         return web_path
         
     except Exception as e:
@@ -154,11 +156,97 @@ def save_uploaded_image(file, upload_type='dishes', max_size=(800, 600)):
                 pass
         return None
 
+def _image_file_path(web_path):
+    """Web 路径转换为磁盘路径"""
+    from flask import current_app
+    app_root = os.path.dirname(current_app.instance_path)
+    return os.path.join(app_root, 'app', web_path.lstrip('/'))
+
+def is_image_pending(web_path):
+    """图片是否仍在后台处理中"""
+    from app.image_queue import pending_marker
+    return os.path.exists(pending_marker(_image_file_path(web_path)))
+
+@lru_cache(maxsize=4096)
+def _variant_widths_on_disk(file_base):
+    """已处理完成图片的各宽度版本（完成后不再变化，可以缓存）"""
+    widths = []
+    for path in glob.glob(glob.escape(file_base) + '-*.jpg'):
+        suffix = os.path.splitext(path)[0].rsplit('-', 1)[1]
+        if suffix.isdigit():
+            widths.append(int(suffix))
+    return tuple(sorted(widths))
+
+def image_srcset(image_path, fmt='jpg'):
+    """生成 srcset 字符串（仅内容哈希命名且已处理完成的图片，否则返回空串）"""
+    if not image_path or not HASHED_IMAGE_RE.match(image_path) or '-' in image_path.rsplit('/', 1)[1]:
+        return ''
+    if is_image_pending(image_path):
+        return ''
+    base = image_path[:-len('.jpg')]
+    widths = _variant_widths_on_disk(os.path.splitext(_image_file_path(image_path))[0])
+    return ', '.join(f'{base}-{w}.{fmt} {w}w' for w in widths)
+
+def register_image_caching(app):
+    """内容哈希命名的图片内容不会变化，处理完成后使用长期缓存"""
+    
+    @app.after_request
+    def cache_hashed_images(response):
+        if response.status_code in (200, 304) and HASHED_IMAGE_RE.match(request.path) \
+                and not is_image_pending(request.path):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = 31536000
+            response.cache_control.immutable = True
+        return response
+    
+    app.add_template_filter(image_srcset, 'srcset')
+
+def _image_in_use(image_path):
+    """图片是否仍被菜品或餐厅引用"""
+    from app import db
+    from app.models import Dish, Restaurant
+    if db.session.query(Dish.id).filter(Dish.image == image_path).first() is not None:
+        return True
+    return db.session.query(Restaurant.id).filter(
+        (Restaurant.logo == image_path) | (Restaurant.banner == image_path)
+    ).first() is not None
+
+def _delete_hashed_image(image_path):
+    """删除内容哈希图片及其各宽度版本和 WebP"""
+    base = os.path.splitext(_image_file_path(image_path))[0]
+    paths = [base + '.jpg', base + '.webp']
+    for ext in ('jpg', 'webp'):
+        paths.extend(glob.glob(glob.escape(base) + '-*.' + ext))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    _variant_widths_on_disk.cache_clear()
+    print(f"删除图片及其各版本: {image_path}（{len(paths)} 个文件）")
+
 def delete_image_file(image_path):
-    """删除图片文件"""
+    """删除图片文件
+
+    内容哈希命名的图片可能被多处引用，应在引用方的修改提交后调用：
+    没有其他菜品/餐厅引用且已处理完成时，连同各宽度版本和 WebP 一起删除。
+    """
     if not image_path:
         return
     
+    if HASHED_IMAGE_RE.match(image_path):
+        if '-' in image_path.rsplit('/', 1)[1]:
+            return
+        try:
+            if _image_in_use(image_path) or is_image_pending(image_path):
+                print(f"共享图片，保留文件: {image_path}")
+                return
+            _delete_hashed_image(image_path)
+        except Exception as e:
+            print(f"删除图片文件失败: {e}")
+        return
+    
     try:
         # 移除开头的斜杠，转换为相对路径
         if image_path.startswith('/'):
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+销售统计重建脚本
+
+从 order/order_item 重新计算 sales_rollup（按小时/天预聚合的销售统计）。
+上线统计功能时全量执行一次，之后由结算增量维护；数据有误时可从某一天起重建。
+建议在低峰期执行。
+
+用法:
+    python backfill_analytics.py
+    python backfill_analytics.py --since 2024-01-01
+"""
+
+import sys
+import os
+import time
+import argparse
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app import analytics
+
+
+def main():
+    parser = argparse.ArgumentParser(description='销售统计重建')
+    parser.add_argument('--since', help='从该日期（本地时间，YYYY-MM-DD）起重建，默认全量')
+    parser.add_argument('--batch-size', type=int, default=1000, help='每批读取的订单数')
+    args = parser.parse_args()
+
+    since = datetime.strptime(args.since, '%Y-%m-%d') if args.since else None
+
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        count = analytics.backfill(since, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+    print(f"销售统计重建完成，共 {count} 个订单，用时 {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
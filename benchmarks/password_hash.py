@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+密码哈希微基准
+
+对每种算法/代价参数分别测量单核每秒哈希次数，以及进程池（默认每核一个进程）
+的总吞吐和折算到每核的吞吐，用于选择 PASSWORD_HASH_METHOD 和 PASSWORD_HASH_WORKERS。
+
+用法:
+    python benchmarks/password_hash.py
+    python benchmarks/password_hash.py --method scrypt:16384:8:1 --method pbkdf2:sha256:300000 --seconds 5
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.passwords import hash_password, normalize_method
+
+DEFAULT_METHODS = [
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+    'scrypt:32768:8:1',
+    'scrypt:16384:8:1',
+]
+
+
+def single_core(method, seconds):
+    """当前进程内连续计算，返回每秒次数"""
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        hash_password('benchmark-password', method)
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def pooled(method, seconds, workers):
+    """进程池并发计算，返回每秒次数"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 预热，排除进程启动时间
+        list(executor.map(hash_password, ['warmup'] * workers, [method] * workers))
+        count = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            batch = workers * 2
+            list(executor.map(hash_password, ['benchmark-password'] * batch, [method] * batch))
+            count += batch
+        return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='密码哈希微基准')
+    parser.add_argument('--method', action='append', help='要测试的算法参数，可重复指定')
+    parser.add_argument('--seconds', type=float, default=3, help='每项测试时长（秒）')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='进程池大小')
+    args = parser.parse_args()
+
+    methods = [normalize_method(method) for method in (args.method or DEFAULT_METHODS)]
+    print(f"CPU 核数: {os.cpu_count()}，进程池: {args.workers}")
+    print(f"\n{'算法':<26}{'单次(ms)':>10}{'单核(次/秒)':>14}{'进程池(次/秒)':>16}{'每核(次/秒)':>14}")
+    for method in methods:
+        single = single_core(method, args.seconds)
+        pool = pooled(method, args.seconds, args.workers)
+        print(f"{method:<26}{1000 / single:>10.1f}{single:>14.1f}{pool:>16.1f}{pool / args.workers:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
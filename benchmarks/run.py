@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+热点路径基准测试
+
+用 Flask 测试客户端依次压测浏览、购物车和结算路径，统计每个端点的
+p50/p95/p99 延迟和 SQL 语句数，结果保存为 JSON，可与历史结果对比。
+
+用法:
+    python benchmarks/run.py --scale small --iterations 200
+    python benchmarks/run.py --reuse --baseline benchmarks/results/上次.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# 超过基准结果的比例视为性能回退
+REGRESSION_THRESHOLD = 1.2
+
+
+def percentile(values, pct):
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class EndpointRecorder(object):
+    """记录单个端点的延迟和语句数"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    def call(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        response = func(*args, **kwargs)
+        self.latencies.append((time.perf_counter() - start) * 1000)
+        self.queries.append(int(response.headers.get('X-DB-Query-Count', 0)))
+        if response.status_code >= 400:
+            self.errors += 1
+        return response
+
+    def summary(self):
+        return {
+            'count': len(self.latencies),
+            'errors': self.errors,
+            'p50_ms': round(percentile(self.latencies, 50), 3),
+            'p95_ms': round(percentile(self.latencies, 95), 3),
+            'p99_ms': round(percentile(self.latencies, 99), 3),
+            'mean_queries': round(sum(self.queries) / float(len(self.queries)), 2) if self.queries else 0,
+            'max_queries': max(self.queries) if self.queries else 0,
+        }
+
+
+def run_benchmarks(app, iterations, seed=7):
+    from benchmarks.seed import BENCH_PASSWORD
+    from app.models import User, Restaurant, Dish, Address
+    from app import db
+
+    rng = random.Random(seed)
+    with app.app_context():
+        restaurant_ids = [row[0] for row in db.session.query(Restaurant.id).filter(Restaurant.status == 'open')]
+        dish_ids = dict(db.session.query(Dish.id, Dish.restaurant_id).filter(Dish.available == True).all())
+        user = User.query.filter(User.role == 'user').first()
+        address_id = Address.query.filter_by(user_id=user.id).first().id
+        username = user.username
+        dish_count = len(dish_ids)
+    dish_list = list(dish_ids)
+
+    customer = app.test_client()
+    customer.post('/auth/login', data={'username': username, 'password': BENCH_PASSWORD})
+    admin = app.test_client()
+    admin.post('/auth/login', data={'username': 'admin', 'password': BENCH_PASSWORD})
+
+    recorders = {}
+
+    def rec(name):
+        if name not in recorders:
+            recorders[name] = EndpointRecorder(name)
+        return recorders[name]
+
+    for i in range(iterations):
+        rid = rng.choice(restaurant_ids)
+        rec('list_restaurants').call(customer.get, '/restaurant/', query_string={
+            'sort': rng.choice(['rating', 'sales'])})
+        rec('list_restaurants_nearby').call(customer.get, '/restaurant/', query_string={
+            'sort': 'distance', 'radius': rng.choice([3, 5, 10])})
+        rec('list_restaurants_keyword').call(customer.get, '/restaurant/', query_string={
+            'keyword': rng.choice(['鱼头', '牛肉', '披萨', '湘菜'])})
+        rec('restaurant_detail').call(customer.get, f'/restaurant/{rid}')
+        rec('restaurant_menu').call(customer.get, f'/restaurant/{rid}/menu')
+
+        rec('add_to_cart').call(customer.post, '/cart/add', json={
+            'dish_id': rng.choice(dish_list), 'quantity': 1})
+        rec('view_cart').call(customer.get, '/cart/')
+
+        # 每 5 轮结算一次，避免购物车无限增长
+        if i % 5 == 4:
+            rec('checkout').call(customer.post, '/cart/checkout', data={
+                'address_id': address_id, 'remark': 'bench'})
+
+        rec('admin_dishes').call(admin.get, '/dish/admin', query_string={
+            'page': rng.randint(1, max(1, dish_count // 10))})
+
+    return dict((name, recorder.summary()) for name, recorder in recorders.items())
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline_path):
+    """与基准结果比较 p95，返回回退的端点列表"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['endpoints']
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if before and before['p95_ms'] and current['p95_ms'] > before['p95_ms'] * REGRESSION_THRESHOLD:
+            regressions.append((name, before['p95_ms'], current['p95_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='热点路径基准测试')
+    parser.add_argument('--scale', default='small', help='数据规模: tiny/small/medium/large')
+    parser.add_argument('--iterations', type=int, default=100, help='每个端点的请求轮数')
+    parser.add_argument('--db', default=os.path.join(ROOT, 'instance', 'bench.db'), help='基准数据库文件')
+    parser.add_argument('--reuse', action='store_true', help='复用已有的基准数据库，不重新生成数据')
+    parser.add_argument('--output', help='结果 JSON 路径（默认 benchmarks/results/<时间>.json）')
+    parser.add_argument('--baseline', help='与之前的结果 JSON 对比 p95')
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.db), exist_ok=True)
+    os.environ['DATABASE_URL'] = 'sqlite:///' + args.db
+    os.environ['SQL_PROFILER_HEADERS'] = '1'
+
+    from app import create_app
+    from benchmarks.seed import seed_database, SCALES
+    from app.search import search_index
+
+    app = create_app()
+    app.config['TESTING'] = True
+
+    if not args.reuse or not os.path.exists(args.db):
+        print(f"生成 {args.scale} 规模数据: {SCALES[args.scale]}")
+        start = time.perf_counter()
+        with app.app_context():
+            seed_database(args.scale)
+            search_index.rebuild()
+        print(f"数据生成完成，用时 {time.perf_counter() - start:.1f}s")
+
+    print(f"开始压测，每个端点 {args.iterations} 轮...")
+    results = run_benchmarks(app, args.iterations)
+
+    print(f"\n{'端点':<26}{'次数':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'平均SQL':>9}{'最大SQL':>9}")
+    for name, item in results.items():
+        print(f"{name:<26}{item['count']:>6}{item['p50_ms']:>10.2f}{item['p95_ms']:>10.2f}"
+              f"{item['p99_ms']:>10.2f}{item['mean_queries']:>9.1f}{item['max_queries']:>9}")
+
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'scale': args.scale,
+            'iterations': args.iterations,
+            'endpoints': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline)
+        for name, before, after in regressions:
+            print(f"⚠️  性能回退 {name}: p95 {before:.2f}ms -> {after:.2f}ms")
+        if regressions:
+            sys.exit(1)
+        print("✓ 未发现性能回退")
+
+
+if __name__ == '__main__':
+    main()
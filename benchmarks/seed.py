@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基准测试数据生成
+
+在与 init_data.py 相同的模型上批量生成大规模合成数据
+（餐厅、菜品、用户、地址、订单、订单项），全部使用 executemany 分批插入。
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import User, Address, Restaurant, Category, Dish, Order, OrderItem
+
+# 数据规模
+SCALES = {
+    'tiny': {'restaurants': 50, 'dishes_per_restaurant': 20, 'users': 20, 'orders': 2000},
+    'small': {'restaurants': 500, 'dishes_per_restaurant': 40, 'users': 200, 'orders': 50000},
+    'medium': {'restaurants': 2000, 'dishes_per_restaurant': 60, 'users': 1000, 'orders': 500000},
+    'large': {'restaurants': 5000, 'dishes_per_restaurant': 60, 'users': 5000, 'orders': 2000000},
+}
+
+BATCH_SIZE = 10000
+
+# 坐标范围（北京五环内）
+LAT_RANGE = (39.80, 40.05)
+LNG_RANGE = (116.20, 116.55)
+
+BENCH_PASSWORD = 'bench123'
+
+CATEGORY_NAMES = ['热菜', '凉菜', '主食', '汤品', '饮品', '甜品', '披萨', '意面', '小食']
+CUISINES = ['湘菜', '川菜', '粤菜', '西餐', '日料', '快餐', '火锅', '烧烤']
+DISH_WORDS = ['剁椒', '鱼头', '小炒', '黄牛肉', '红烧', '排骨', '麻辣', '香锅', '芝士', '披萨',
+              '牛肉', '拉面', '鸡腿', '米饭', '酸菜', '鱼片', '宫保', '鸡丁', '蛋炒饭', '奶茶']
+
+
+def _insert(table, rows):
+    """分批插入"""
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(table.insert(), rows[start:start + BATCH_SIZE])
+    db.session.commit()
+
+
+def seed_database(scale='small', seed=42):
+    """清空并生成数据，返回规模参数"""
+    params = SCALES[scale]
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    db.drop_all()
+    db.create_all()
+
+    # 用户（密码哈希只计算一次）
+    password = generate_password_hash(BENCH_PASSWORD)
+    users = [{'username': 'admin', 'password': password, 'role': 'admin', 'created_at': now}]
+    users += [{'username': f'bench{i}', 'password': password, 'role': 'user', 'created_at': now}
+              for i in range(params['users'])]
+    _insert(User.__table__, users)
+    user_ids = [row[0] for row in db.session.query(User.id).filter(User.role == 'user')]
+
+    _insert(Address.__table__, [{
+        'user_id': user_id, 'name': f'用户{user_id}', 'phone': '13800000000',
+        'address': f'北京市朝阳区测试路{user_id}号', 'is_default': True, 'created_at': now,
+        'latitude': rng.uniform(*LAT_RANGE), 'longitude': rng.uniform(*LNG_RANGE)
+    } for user_id in user_ids])
+
+    _insert(Category.__table__, [{'name': name, 'sort_order': i}
+                                 for i, name in enumerate(CATEGORY_NAMES)])
+    category_ids = [row[0] for row in db.session.query(Category.id)]
+
+    # 餐厅与菜品
+    _insert(Restaurant.__table__, [{
+        'name': f'{rng.choice(DISH_WORDS)}{rng.choice(CUISINES)}（{i}号店）',
+        'description': f'{rng.choice(CUISINES)} {rng.choice(DISH_WORDS)} 精选食材',
+        'address': f'北京市海淀区测试大街{i}号', 'phone': '010-00000000',
+        'latitude': rng.uniform(*LAT_RANGE), 'longitude': rng.uniform(*LNG_RANGE),
+        'cuisine_type': rng.choice(CUISINES), 'business_hours': '10:00-22:00',
+        'delivery_fee': rng.choice([0, 3, 5, 8]), 'min_order': rng.choice([0, 20, 30]),
+        'rating': round(rng.uniform(3.5, 5.0), 1), 'review_count': rng.randint(0, 5000),
+        'status': 'open' if rng.random() < 0.9 else 'closed',
+        'created_at': now - timedelta(days=rng.randint(0, 1000)), 'logo': '', 'banner': ''
+    } for i in range(params['restaurants'])])
+    restaurant_ids = [row[0] for row in db.session.query(Restaurant.id)]
+
+    dishes = []
+    for restaurant_id in restaurant_ids:
+        for j in range(params['dishes_per_restaurant']):
+            price = round(rng.uniform(8, 120), 1)
+            dishes.append({
+                'restaurant_id': restaurant_id, 'category_id': rng.choice(category_ids),
+                'name': rng.choice(DISH_WORDS) + rng.choice(DISH_WORDS) + str(j),
+                'description': '招牌菜品', 'price': price, 'ingredients': '、'.join(rng.sample(DISH_WORDS, 3)),
+                'sales_count': rng.randint(0, 10000), 'rating': round(rng.uniform(4.0, 5.0), 1),
+                'is_recommended': j < 3, 'is_spicy': rng.random() < 0.3,
+                'available': rng.random() < 0.95, 'created_at': now
+            })
+    _insert(Dish.__table__, dishes)
+    dish_rows = db.session.query(Dish.id, Dish.restaurant_id, Dish.price).all()
+    dishes_by_restaurant = {}
+    for dish_id, restaurant_id, price in dish_rows:
+        dishes_by_restaurant.setdefault(restaurant_id, []).append((dish_id, price))
+    del dishes
+
+    # 订单与订单项（按批生成，避免一次性占用大量内存）
+    statuses = ['pending', 'confirmed', 'preparing', 'delivering', 'completed', 'completed',
+                'completed', 'cancelled']
+    order_id = 0
+    for start in range(0, params['orders'], BATCH_SIZE):
+        orders, items = [], []
+        for i in range(start, min(start + BATCH_SIZE, params['orders'])):
+            order_id += 1
+            restaurant_id = rng.choice(restaurant_ids)
+            picked = rng.sample(dishes_by_restaurant[restaurant_id], rng.randint(1, 3))
+            subtotal = 0
+            for dish_id, price in picked:
+                quantity = rng.randint(1, 3)
+                subtotal += price * quantity
+                items.append({'order_id': order_id, 'dish_id': dish_id, 'quantity': quantity,
+                              'price': price, 'subtotal': price * quantity})
+            orders.append({
+                'id': order_id, 'order_no': f'BENCH{order_id:012d}',
+                'user_id': rng.choice(user_ids), 'restaurant_id': restaurant_id,
+                'delivery_name': '测试', 'delivery_phone': '13800000000', 'delivery_address': '北京',
+                'subtotal': subtotal, 'delivery_fee': 5, 'total_amount': subtotal + 5,
+                'status': rng.choice(statuses), 'payment_status': 'paid',
+                'created_at': now - timedelta(minutes=rng.randint(0, 365 * 24 * 60))
+            })
+        db.session.execute(Order.__table__.insert(), orders)
+        db.session.execute(OrderItem.__table__.insert(), items)
+        db.session.commit()
+
+    return params
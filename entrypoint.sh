@@ -44,6 +44,6 @@ if [ "$FLASK_ENV" = "development" ]; then
     python run.py
 else
     echo "以生产模式启动（使用Gunicorn）..."
-    gunicorn --bind 0.0.0.0:5000 --workers 4 --threads 2 --timeout 120 --access-logfile logs/access.log --error-logfile logs/error.log run:app
+    gunicorn --bind 0.0.0.0:5000 --workers ${WEB_WORKERS:-4} --threads ${WEB_THREADS:-2} --timeout 120 --access-logfile logs/access.log --error-logfile logs/error.log run:app
 fi
 
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+餐厅/菜品批量导入脚本
+
+用法:
+    python import_catalog.py restaurants restaurants.csv
+    python import_catalog.py dishes menu.jsonl --batch-size 1000
+    python import_catalog.py dishes menu.csv --dry-run
+
+CSV 第一行为表头。餐厅字段：name, description, address, phone, cuisine_type,
+business_hours, delivery_fee, min_order, status, logo, banner；
+菜品字段：restaurant（餐厅名称）, category（分类名称）, name, price, original_price,
+discount_rate, description, ingredients, image, available, is_recommended, is_spicy。
+"""
+
+import sys
+import os
+import time
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.catalog_import import import_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description='餐厅/菜品批量导入')
+    parser.add_argument('kind', choices=['restaurants', 'dishes'], help='导入类型')
+    parser.add_argument('path', help='CSV 或 JSONL 文件')
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help='文件格式（默认按扩展名判断）')
+    parser.add_argument('--batch-size', type=int, default=500, help='每批写入行数')
+    parser.add_argument('--dry-run', action='store_true', help='只校验，不写入数据库')
+    args = parser.parse_args()
+
+    fmt = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.json')) else 'csv')
+
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        with open(args.path, encoding='utf-8-sig', newline='') as f:
+            result = import_catalog(args.kind, f, fmt, batch_size=args.batch_size, dry_run=args.dry_run)
+        elapsed = time.perf_counter() - start
+
+    print(f"{'校验' if args.dry_run else '导入'}完成，用时 {elapsed:.2f}s")
+    print(f"   总行数: {result.total}")
+    print(f"   新增: {result.inserted}")
+    print(f"   更新: {result.updated}")
+    print(f"   错误: {result.error_count}")
+    for line, message in result.errors[:50]:
+        print(f"   第 {line} 行: {message}")
+    if result.error_count > 50:
+        print(f"   ……其余 {result.error_count - 50} 条错误未显示")
+    sys.exit(1 if result.error_count else 0)
+
+
+if __name__ == '__main__':
+    main()
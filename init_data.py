@@ -264,6 +264,8 @@ def init_database():
         
         restaurants = {}
         for rest_data in restaurants_data:
+            # 示例评分视为历史评价的平均分，保持评价汇总一致
+            rest_data['rating_sum'] = round(rest_data['rating'] * rest_data['review_count'])
             restaurant = Restaurant(**rest_data)
             db.session.add(restaurant)
             restaurants[rest_data['name']] = restaurant
@@ -476,6 +478,18 @@ def init_database():
         print("🍽️ 菜品数据创建完成")
         
         print("\n✨ 数据初始化完成！")
+        # 重建搜索索引（drop_all 不会清理 FTS 虚拟表）
+        from app.search import search_index
+        search_index.rebuild()
+        print("🔍 搜索索引重建完成")
+        
+        from app.geo import backfill_coordinates
+        print(f"📍 已解析 {backfill_coordinates()} 个地址的坐标")
+        
+        from app.ranking import restaurant_ranking
+        restaurant_ranking.rebuild()
+        print("🏆 餐厅排序分计算完成")
+        
         print("\n📊 数据统计:")
         print(f"   用户数量: {User.query.count()}")
         print(f"   餐厅数量: {Restaurant.query.count()}")
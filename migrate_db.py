@@ -4,8 +4,15 @@
 """
 
 from app import create_app, db
-from app.models import Dish
-from sqlalchemy import text
+from app.models import Dish, Order, OrderItem, RestaurantScore, IdempotencyKey, ReplicationHeartbeat, Review, DishSalesDelta, SalesRollup, MenuInvalidation, SearchIndexChange
+from sqlalchemy import text, inspect
+
+def ensure_indexes(*models):
+    """创建模型上声明但数据库中尚不存在的索引"""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+            print(f"✓ 索引 {index.name} 已就绪")
 
 def migrate_database():
     """执行数据库迁移"""
@@ -52,12 +59,83 @@ def migrate_database():
                 db.session.commit()
                 print("✓ restaurant.delivery_fee 字段添加成功")
 
+            if 'rating_sum' not in r_columns:
+                print("添加 restaurant.rating_sum 字段...")
+                db.session.execute(text("ALTER TABLE restaurant ADD COLUMN rating_sum INTEGER DEFAULT 0"))
+                # 已有的评分视为历史评价的平均分；之后可运行 recompute_ratings.py 按贝叶斯公式重算评分
+                # （没有 review 记录的餐厅保留这里折算的历史汇总）
+                db.session.execute(text(
+                    "UPDATE restaurant SET review_count = COALESCE(review_count, 0), "
+                    "rating_sum = ROUND(COALESCE(rating, 0) * COALESCE(review_count, 0))"))
+                db.session.commit()
+                print("✓ restaurant.rating_sum 字段添加成功")
+
             if 'min_order' not in r_columns:
                 print("添加 restaurant.min_order 字段...")
                 db.session.execute(text("ALTER TABLE restaurant ADD COLUMN min_order FLOAT DEFAULT 0"))
                 db.session.commit()
                 print("✓ restaurant.min_order 字段添加成功")
 
+            # === 经纬度字段 ===
+            for table, columns_ in (('restaurant', r_columns), ('address', None)):
+                if columns_ is None:
+                    columns_ = [row[1] for row in db.session.execute(text(f"PRAGMA table_info({table})"))]
+                for column in ('latitude', 'longitude'):
+                    if column not in columns_:
+                        print(f"添加 {table}.{column} 字段...")
+                        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} FLOAT"))
+                        db.session.commit()
+                        print(f"✓ {table}.{column} 字段添加成功")
+            
+            # === 订单状态时间字段 ===
+            o_columns = [row[1] for row in db.session.execute(text('PRAGMA table_info("order")'))]
+            for column in ('preparing_at', 'delivering_at', 'cancelled_at'):
+                if column not in o_columns:
+                    print(f"添加 order.{column} 字段...")
+                    db.session.execute(text(f'ALTER TABLE "order" ADD COLUMN {column} DATETIME'))
+                    db.session.commit()
+                    print(f"✓ order.{column} 字段添加成功")
+            
+            from app.order_status import migrate_legacy_statuses
+            print(f"✓ 已转换 {migrate_legacy_statuses()} 个旧订单状态")
+            
+            from app.geo import backfill_coordinates
+            print(f"✓ 已解析 {backfill_coordinates()} 个地址的坐标")
+            
+            # === 新增表 ===
+            if not inspect(db.engine).has_table(RestaurantScore.__tablename__):
+                RestaurantScore.__table__.create(db.engine)
+                from app.ranking import restaurant_ranking
+                print(f"✓ restaurant_score 表创建成功，已计算 {restaurant_ranking.rebuild()} 家餐厅")
+            
+            if not inspect(db.engine).has_table(IdempotencyKey.__tablename__):
+                IdempotencyKey.__table__.create(db.engine)
+                print("✓ idempotency_key 表创建成功")
+            
+            if not inspect(db.engine).has_table(ReplicationHeartbeat.__tablename__):
+                ReplicationHeartbeat.__table__.create(db.engine)
+                print("✓ replication_heartbeat 表创建成功")
+            
+            if not inspect(db.engine).has_table(DishSalesDelta.__tablename__):
+                DishSalesDelta.__table__.create(db.engine)
+                print("✓ dish_sales_delta 表创建成功")
+            
+            if not inspect(db.engine).has_table(MenuInvalidation.__tablename__):
+                MenuInvalidation.__table__.create(db.engine)
+                print("✓ menu_invalidation 表创建成功")
+            
+            if not inspect(db.engine).has_table(SearchIndexChange.__tablename__):
+                SearchIndexChange.__table__.create(db.engine)
+                print("✓ search_index_change 表创建成功")
+            
+            if not inspect(db.engine).has_table(SalesRollup.__tablename__):
+                SalesRollup.__table__.create(db.engine)
+                from app import analytics
+                print(f"✓ sales_rollup 表创建成功，已统计 {analytics.backfill()} 个订单")
+            
+            # === 索引检查 ===
+            ensure_indexes(Order, OrderItem, RestaurantScore, IdempotencyKey, Review, SalesRollup)
+
             print("\n数据库迁移完成！")
             
         except Exception as e:
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+餐厅评分重建脚本
+
+按 review 表重新计算每家餐厅的评价星数合计、评价数和贝叶斯平滑评分
+（修改 REVIEW_PRIOR_RATING / REVIEW_PRIOR_WEIGHT 后或发现汇总与评价不一致时运行）。
+没有 review 记录的餐厅保留导入或迁移时的历史汇总，只重算评分。
+
+用法:
+    python recompute_ratings.py
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.reviews import recompute_ratings
+
+
+def main():
+    app = create_app()
+    with app.app_context():
+        start = time.perf_counter()
+        count = recompute_ratings()
+        elapsed = time.perf_counter() - start
+    print(f"评分重建完成，共 {count} 家餐厅，用时 {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
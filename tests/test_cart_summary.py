@@ -0,0 +1,167 @@
+"""
+购物车汇总缓存测试
+
+并发的加购/删除在 LRU 存储和 Redis 存储（用内存实现的假 Redis，
+支持 WATCH/MULTI）上都不能丢失更新。
+
+运行: python -m pytest tests
+"""
+
+import os
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.cart_summary import (CartSummaryCache, CartSummary, LRUCartStore, RedisCartStore,
+                              WatchError)
+
+USER_ID = 1
+
+
+class FakeRedis(object):
+    """进程内的 Redis 替身：get/set/delete 和带 WATCH 的 pipeline"""
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+        self.before_execute = None  # 测试钩子：事务提交前调用
+
+    def _write(self, name, value):
+        if value is None:
+            self.data.pop(name, None)
+        else:
+            self.data[name] = value.encode('utf-8') if isinstance(value, str) else value
+        self.versions[name] = self.versions.get(name, 0) + 1
+
+    def get(self, name):
+        with self.lock:
+            return self.data.get(name)
+
+    def set(self, name, value, ex=None):
+        with self.lock:
+            self._write(name, value)
+
+    def delete(self, name):
+        with self.lock:
+            self._write(name, None)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline(object):
+    def __init__(self, client):
+        self.client = client
+        self.watched = {}
+        self.commands = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.watched = {}
+        self.commands = None
+
+    def watch(self, *names):
+        with self.client.lock:
+            self.watched = dict((name, self.client.versions.get(name, 0)) for name in names)
+
+    def unwatch(self):
+        self.watched = {}
+
+    def get(self, name):
+        return self.client.get(name)
+
+    def multi(self):
+        self.commands = []
+
+    def set(self, name, value, ex=None):
+        self.commands.append((name, value))
+
+    def execute(self):
+        hook, self.client.before_execute = self.client.before_execute, None
+        if hook is not None:
+            hook()
+        with self.client.lock:
+            for name, version in self.watched.items():
+                if self.client.versions.get(name, 0) != version:
+                    raise WatchError('watched key changed')
+            for name, value in self.commands:
+                self.client._write(name, value)
+        return [True] * len(self.commands)
+
+
+def _dish(dish_id):
+    return SimpleNamespace(id=dish_id, restaurant_id=1, price=10.0)
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def store(request):
+    if request.param == 'redis':
+        return RedisCartStore(FakeRedis(), ttl=60)
+    return LRUCartStore(max_entries=100, ttl=60)
+
+
+@pytest.fixture
+def cache(store):
+    app = Flask(__name__)
+    app.extensions['cart_summary_store'] = store
+    with app.app_context():
+        store.set(USER_ID, CartSummary().to_dict())
+        yield CartSummaryCache()
+
+
+def _items(cache):
+    return CartSummary.from_dict(cache.store.get(USER_ID)).items
+
+
+def test_concurrent_updates_are_not_lost(cache):
+    app = Flask(__name__)
+    app.extensions['cart_summary_store'] = cache.store
+    threads_count, per_thread = 8, 50
+
+    def add(offset):
+        with app.app_context():
+            for i in range(per_thread):
+                cache.set_item(USER_ID, _dish(offset * per_thread + i), 1)
+
+    threads = [threading.Thread(target=add, args=(n,)) for n in range(threads_count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(_items(cache)) == threads_count * per_thread
+
+
+def test_update_skips_missing_entry(cache):
+    cache.store.delete(USER_ID)
+    cache.set_item(USER_ID, _dish(1), 2)
+    assert cache.store.get(USER_ID) is None
+
+
+def test_set_and_remove_item(cache):
+    cache.set_item(USER_ID, _dish(1), 2)
+    cache.set_item(USER_ID, _dish(2), 1)
+    cache.remove_item(USER_ID, 1)
+    assert _items(cache) == {2: (1, 1, 10.0)}
+
+
+def test_redis_update_retries_after_concurrent_write():
+    client = FakeRedis()
+    store = RedisCartStore(client, ttl=60)
+    app = Flask(__name__)
+    app.extensions['cart_summary_store'] = store
+    with app.app_context():
+        store.set(USER_ID, CartSummary().to_dict())
+        cache = CartSummaryCache()
+        # 第一次提交前另一个请求写入了菜品 2，WATCH 失败后重试时应读到它
+        client.before_execute = lambda: cache.set_item(USER_ID, _dish(2), 1)
+        cache.set_item(USER_ID, _dish(1), 1)
+        assert sorted(_items(cache)) == [1, 2]
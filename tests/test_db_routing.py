@@ -0,0 +1,138 @@
+"""
+读写分离测试
+
+用两个 SQLite 文件模拟主库和只读副本：两边的餐厅名称不同，
+据此判断 @read_replica 视图的查询发往了哪个库。
+
+运行: python -m pytest tests
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import User, Address, Restaurant, Dish, ReplicationHeartbeat
+from config import config, DevelopmentConfig
+
+PRIMARY_NAME = '主库餐厅'
+REPLICA_NAME = '副本餐厅'
+
+
+@pytest.fixture
+def app(tmp_path):
+    class RoutingTestConfig(DevelopmentConfig):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "primary.db"}'
+        SQLALCHEMY_REPLICA_URIS = [f'sqlite:///{tmp_path / "replica.db"}']
+        REPLICA_LAG_CHECK_INTERVAL = 0
+        REPLICA_HEARTBEAT_INTERVAL = 60
+        PASSWORD_HASH_EXECUTOR = 'inline'
+        SALES_ROLLUP_INTERVAL = 0
+        RANKING_REFRESH_INTERVAL = 0
+        SEARCH_SYNC_INTERVAL = 0
+        SQL_PROFILER = False
+
+    config['routing_test'] = RoutingTestConfig
+    try:
+        app = create_app('routing_test')
+    finally:
+        del config['routing_test']
+
+    with app.app_context():
+        for key, name in ((None, PRIMARY_NAME), ('replica0', REPLICA_NAME)):
+            engine = db.engines[key]
+            db.metadata.create_all(engine)
+            with engine.begin() as conn:
+                _seed(conn, name)
+    # 不在外层保持应用上下文：每个请求使用各自的数据库会话
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def _seed(conn, restaurant_name):
+    """两边写入相同的用户和菜品，只有餐厅名称不同"""
+    conn.execute(User.__table__.insert().values(
+        id=1, username='u', password=generate_password_hash('pw', method='pbkdf2:sha256:1000'),
+        role='user'))
+    conn.execute(Address.__table__.insert().values(
+        id=1, user_id=1, name='张三', phone='1', address='北京', is_default=True))
+    conn.execute(Restaurant.__table__.insert().values(
+        id=1, name=restaurant_name, description='', address='北京', delivery_fee=0,
+        min_order=0, rating=4.0, rating_sum=0, review_count=0, status='open',
+        logo='', banner='', created_at=datetime.utcnow()))
+    conn.execute(Dish.__table__.insert().values(
+        id=1, restaurant_id=1, name='米饭', price=2, available=True, sales_count=0,
+        created_at=datetime.utcnow()))
+    conn.execute(ReplicationHeartbeat.__table__.insert().values(id=1, updated_at=datetime.utcnow()))
+
+
+def _set_replica_heartbeat(app, at):
+    """模拟复制：副本上的心跳时间"""
+    table = ReplicationHeartbeat.__table__
+    with app.app_context(), db.engines['replica0'].begin() as conn:
+        conn.execute(update(table).where(table.c.id == 1).values(updated_at=at))
+
+
+def _page(client):
+    response = client.get('/restaurant/1')
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def test_read_replica_view_reads_from_replica(app):
+    _set_replica_heartbeat(app, datetime.utcnow())
+    page = _page(app.test_client())
+    assert REPLICA_NAME in page
+    assert PRIMARY_NAME not in page
+
+
+def test_lagging_replica_falls_back_to_primary(app):
+    _set_replica_heartbeat(app, datetime.utcnow() - timedelta(seconds=60))
+    page = _page(app.test_client())
+    assert PRIMARY_NAME in page
+
+
+def test_reads_own_writes_from_primary(app):
+    _set_replica_heartbeat(app, datetime.utcnow())
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'u', 'password': 'pw'})
+
+    response = client.post('/cart/add', json={'dish_id': 1, 'quantity': 1})
+    assert response.status_code == 200
+
+    # 写入后 REPLICA_STICKY_SECONDS 秒内同一会话读主库
+    page = _page(client)
+    assert PRIMARY_NAME in page
+    assert REPLICA_NAME not in page
+
+    # 写入只发往主库
+    with app.app_context():
+        with db.engines[None].connect() as conn:
+            assert conn.exec_driver_sql('SELECT COUNT(*) FROM cart_item').scalar() == 1
+        with db.engines['replica0'].connect() as conn:
+            assert conn.exec_driver_sql('SELECT COUNT(*) FROM cart_item').scalar() == 0
+
+
+def test_read_requests_do_not_write_heartbeat(app):
+    table = ReplicationHeartbeat.__table__
+    old = datetime.utcnow() - timedelta(hours=1)
+    with app.app_context(), db.engines[None].begin() as conn:
+        conn.execute(update(table).where(table.c.id == 1).values(updated_at=old))
+    _set_replica_heartbeat(app, datetime.utcnow())
+
+    with app.app_context():
+        from app.db_routing import replica_router
+        assert replica_router.lag('replica0') is not None
+        with db.engines[None].connect() as conn:
+            beat = conn.execute(table.select()).first().updated_at
+    assert beat == old
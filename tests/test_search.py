@@ -0,0 +1,123 @@
+"""
+搜索索引多进程同步测试
+
+两个应用实例共用一个 SQLite 文件、各自使用内存索引，模拟两个 worker：
+一个 worker 修改菜品后，另一个 worker 重放变更记录后搜索结果随之更新。
+
+运行: python -m pytest tests
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.models import Restaurant, Dish
+from app.search import SearchIndex
+from config import config, DevelopmentConfig
+
+
+@pytest.fixture
+def workers(tmp_path):
+    class SearchTestConfig(DevelopmentConfig):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path / "search.db"}'
+        SEARCH_BACKEND = 'memory'
+        SEARCH_SYNC_INTERVAL = 0
+        PASSWORD_HASH_EXECUTOR = 'inline'
+        SALES_ROLLUP_INTERVAL = 0
+        RANKING_REFRESH_INTERVAL = 0
+        SQL_PROFILER = False
+
+    config['search_test'] = SearchTestConfig
+    try:
+        apps = [create_app('search_test'), create_app('search_test')]
+    finally:
+        del config['search_test']
+
+    with apps[0].app_context():
+        db.metadata.create_all(db.engine)
+        db.session.add(Restaurant(id=1, name='农耕记', description='', address='北京', status='open',
+                                  logo='', banner='', created_at=datetime.utcnow()))
+        db.session.add(Dish(id=1, restaurant_id=1, name='剁椒鱼头', price=68, available=True))
+        db.session.commit()
+
+    # 每个 worker 一个 SearchIndex，首次搜索时各自建好内存索引
+    indexes = [SearchIndex(), SearchIndex()]
+    for app, index in zip(apps, indexes):
+        with app.app_context():
+            assert index.search_restaurant_ids('鱼头') == [1]
+    yield list(zip(apps, indexes))
+    for app in apps:
+        with app.app_context():
+            db.engine.dispose()
+
+
+def _search(worker, keyword):
+    app, index = worker
+    with app.app_context():
+        return index.search_restaurant_ids(keyword)
+
+
+def _sync(worker):
+    app, index = worker
+    with app.app_context():
+        with index._lock:
+            index._sync()
+
+
+def test_dish_changes_are_replayed_in_other_workers(workers):
+    writer, reader = workers
+    app, index = writer
+    with app.app_context():
+        dish = db.session.get(Dish, 1)
+        dish.available = False
+        db.session.commit()
+        index.index_dish(dish)
+
+    assert _search(writer, '鱼头') == []
+    assert _search(reader, '鱼头') == [1]
+    _sync(reader)
+    assert _search(reader, '鱼头') == []
+
+    with app.app_context():
+        db.session.add(Dish(id=2, restaurant_id=1, name='小炒黄牛肉', price=58, available=True))
+        db.session.commit()
+        index.index_dish(db.session.get(Dish, 2))
+    _sync(reader)
+    assert _search(reader, '黄牛') == [1]
+
+
+def test_restaurant_removal_is_replayed(workers):
+    writer, reader = workers
+    app, index = writer
+    with app.app_context():
+        Dish.query.delete()
+        Restaurant.query.delete()
+        db.session.commit()
+        index.remove_restaurant(1)
+
+    _sync(reader)
+    assert _search(reader, '农耕') == []
+    assert _search(reader, '鱼头') == []
+
+
+def test_rebuild_is_replayed_as_full_rebuild(workers):
+    writer, reader = workers
+    app, index = writer
+    with app.app_context():
+        db.session.add(Dish(id=3, restaurant_id=1, name='酸菜鱼', price=48, available=True))
+        db.session.commit()
+        index.rebuild()
+
+    reader_app, reader_index = reader
+    with reader_app.app_context():
+        old = reader_app.extensions['search_index']
+    _sync(reader)
+    with reader_app.app_context():
+        assert reader_app.extensions['search_index'] is not old
+    assert _search(reader, '酸菜') == [1]